@@ -1 +1,24 @@
-from .lineage import Lineage, Person, Relation, InvalidRelationError
+from .lineage import (
+    Lineage,
+    Person,
+    Relation,
+    Line,
+    InvalidRelationError,
+    BLOOD_RELATIONS,
+    MergeReport,
+)
+from .snapshot import LineageSnapshot, save_snapshot
+from .journal import Journal
+
+__all__ = [
+    "Lineage",
+    "Person",
+    "Relation",
+    "Line",
+    "InvalidRelationError",
+    "BLOOD_RELATIONS",
+    "MergeReport",
+    "LineageSnapshot",
+    "save_snapshot",
+    "Journal",
+]
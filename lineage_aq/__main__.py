@@ -1,21 +1,38 @@
 from __future__ import annotations
 from collections import defaultdict
 from datetime import datetime
-import json
 import os
-from typing import Callable
-from lineage_aq import Lineage, Person, Relation, InvalidRelationError
+from pathlib import Path
+import shlex
+import shutil
+import sys
+from time import perf_counter
+from typing import Callable, Iterable
+from lineage_aq import Lineage, Person, Relation, Line, InvalidRelationError
 from sys import exit
+from argparse import ArgumentParser
 from lineage_aq.config import (
+    LINEAGE_CACHE_DIR,
     LINEAGE_HOME,
+    add_alternate_spells_listener,
+    alternate_spells_version,
     config,
     save_config,
     setup,
 )
-from lineage_aq.search import advanced_search
+from lineage_aq.cache import LRUCache
+from lineage_aq.duplicates import DuplicateIndex
+from lineage_aq.journal import Journal, num_entries
+from lineage_aq.metadata import FileCounts, file_counts
+from lineage_aq.name_index import CanonicalIndex, normalize
+from lineage_aq.search import advanced_search_persons, canonical_form
+from lineage_aq.search_all import search_all
+from lineage_aq.snapshot import LineageSnapshot, save_snapshot
 from lineage_aq.my_io import (
+    flush,
     input_from,
     input_in_range,
+    answer_prompts,
     non_empty_input,
     print_blue,
     print_cyan,
@@ -23,13 +40,36 @@ from lineage_aq.my_io import (
     print_grey,
     print_heading,
     print_id_name_in_box,
+    print_plain,
+    recording,
     print_tree,
+    tree_lines,
+    use_color,
+    write_tree,
     print_yellow,
     print_red,
+    scripted,
     take_input,
+    unanswered_prompts,
 )
 
 lineage_modified = False
+# Journal of the file from which lineage is loaded or to which it is saved
+journal: Journal | None = None
+# Index of possibly duplicate persons in the lineage, built when first needed
+duplicate_index: DuplicateIndex | None = None
+# Index of the canonical keys of names in the lineage, built when first needed
+canonical_index: CanonicalIndex | None = None
+# Number of persons shown by fuzzy, and suggested when the name is not found
+NUM_FUZZY_RESULTS = 10
+NUM_SUGGESTIONS = 5
+# Counts of the saved files without metadata, listed by load_from_file
+FILE_COUNTS_CACHE = LINEAGE_CACHE_DIR / "file_counts.json"
+# Results of searching names, keyed on the query, alternate_spells version and revision
+# of the lineage
+search_cache = LRUCache(256)
+# Rendered details of persons, keyed on the ID, revision of the lineage and the toggles
+details_cache = LRUCache(1024)
 
 
 def commands() -> dict[Callable, str]:
@@ -44,6 +84,7 @@ def commands() -> dict[Callable, str]:
         remove_person: "rmperson",
         remove_relation: "rmrel",
         find: "find",
+        fuzzy_find: "fuzzy",
         show_tree: "tree",
         toggle_print_all_ancestors: "ta",
         toggle_print_id_with_person: "tid",
@@ -51,16 +92,42 @@ def commands() -> dict[Callable, str]:
         toggle_print_expanded_tree: "texp",
         toggle_print_spouse_in_tree: "ts",
         shortest_path: "sp",
+        duplicates: "dup",
+        relationship: "rel",
         no_parent: "noparent",
         one_parent: "oneparent",
         all_persons: "showall",
         all_relations: "showallrel",
+        cache_stats: "stats",
+        merge: "merge",
         save_to_file: "save",
         safe_exit: "exit",
         show_help: "help",
     }
 
 
+def modifying_commands() -> set[Callable]:
+    """Commands which modify the lineage, not available in read-only mode"""
+
+    return {
+        add_new_person,
+        add_parent,
+        add_children,
+        add_spouse,
+        edit_name,
+        remove_person,
+        remove_relation,
+        merge,
+        save_to_file,
+    }
+
+
+def commands_with_options() -> set[Callable]:
+    """Commands which take options after the command, e.g. `tree --out FILE`"""
+
+    return {show_tree}
+
+
 def person_repr(person: Person, parent=False) -> str:
     """Returns the representation of person based on certain switches"""
 
@@ -79,44 +146,19 @@ def add_new_person(lineage: Lineage):
             print_red("Error in ID", id)
             print_red(e)
 
-    def find_same_name_persons(name: str) -> list[Person]:
-        new_person_name = name.lower()
-        all_persons = {
-            person: person.name.lower().split(" ") for person in lineage.all_persons()
-        }
-
-        found = []
-        for name in new_person_name.split(" "):
-            found2 = []
-            for person, fullname in all_persons.items():
-                if name in fullname:
-                    found2.append(person)
-
-            # name may be a common name
-            if len(found2) > 8:
-                found2 = []
-            found += found2
-
-        # Fullname exact match
-        for person in lineage.all_persons():
-            if new_person_name == person.name.lower():
-                found.append(person)
-
-        return list(set(found))
-
     def whether_to_continue_if_found(name: str) -> bool:
-        same_name_persons = find_same_name_persons(name)
+        same_name_persons = _duplicate_index(lineage).find(name)
         if same_name_persons:
             print_blue("\nPeople found with same name.")
             for person in same_name_persons:
                 print_grey("-" * 50)
-                _print_person_details(person)
+                _print_person_details(lineage, person)
 
             inp = input_from(
                 "Do you want to continue to add new person? [y/n]: ",
                 ("y", "n", "yes", "no"),
             )
-            print()
+            print_plain()
             return True if inp in ("y", "yes") else False
         return True
 
@@ -125,7 +167,8 @@ def add_new_person(lineage: Lineage):
     if len(name) == 0:
         print_red("Name is empty")
         return
-    if not whether_to_continue_if_found(name):
+    # Script adds the persons it means to, even if named same
+    if not scripted() and not whether_to_continue_if_found(name):
         return
 
     gender = input_from("Input gender (m/f): ", ("m", "f"))
@@ -142,7 +185,7 @@ def add_new_person(lineage: Lineage):
     except ValueError as e:
         print_red("Parent2 not added")
         print_red(e)
-    _print_person_details(person)
+    _print_person_details(lineage, person)
 
     global lineage_modified
     lineage_modified = True
@@ -153,7 +196,7 @@ def edit_name(lineage: Lineage):
     person = lineage.find_person_by_id(int(non_empty_input("Enter ID of person: ")))
     print_cyan("Current name:", person.name)
     person.name = non_empty_input("Enter new name: ")
-    _print_person_details(person)
+    _print_person_details(lineage, person)
 
     global lineage_modified
     lineage_modified = True
@@ -164,7 +207,7 @@ def add_parent(lineage: Lineage):
     person = lineage.find_person_by_id(int(non_empty_input("Enter ID of person: ")))
     parent = lineage.find_person_by_id(int(non_empty_input("Enter ID of parent: ")))
     person.add_parent(parent)
-    _print_person_details(person)
+    _print_person_details(lineage, person)
 
     global lineage_modified
     lineage_modified = True
@@ -189,7 +232,7 @@ def add_children(lineage: Lineage):
             print_red(f"ID={child_id}:", e)
         except Exception as e:
             print_red(e)
-    _print_person_details(person)
+    _print_person_details(lineage, person)
 
     global lineage_modified
     lineage_modified = True
@@ -202,7 +245,7 @@ def add_spouse(lineage: Lineage):
     try:
         person1.add_spouse(person2)
         print_yellow("Added successfully")
-        _print_person_details(person1)
+        _print_person_details(lineage, person1)
     except Exception as e:
         print_red("Something went wrong")
         print_red(e)
@@ -239,7 +282,7 @@ def remove_relation(lineage: Lineage):
     )
     person.remove_relative(relative)
     print_cyan("Relation removed")
-    _print_person_details(person)
+    _print_person_details(lineage, person)
 
     global lineage_modified
     lineage_modified = True
@@ -249,7 +292,25 @@ def sorted_by_id(persons: list[Person]):
     return sorted(persons, key=lambda person: person.id)
 
 
-def _print_person_details(person: Person):
+def _print_person_details(lineage: Lineage, person: Person):
+    key = (
+        person.id,
+        lineage.revision,
+        config["print_all_ancestors"],
+        config["print_id_with_person"],
+        config["print_id_with_parent"],
+        use_color(),
+    )
+    details = details_cache.get(key)
+    if details is None:
+        with recording() as output:
+            _render_person_details(lineage, person)
+        details_cache.put(key, "".join(output))
+    else:
+        print_plain(details, end="")
+
+
+def _render_person_details(lineage: Lineage, person: Person):
     def print_person(person: Person | list[Person], end="\n"):
         if isinstance(person, list):
             for p in person[:-1]:
@@ -270,28 +331,24 @@ def _print_person_details(person: Person):
         print_cyan(person_repr(father, parent=True), end="")
 
         if config["print_all_ancestors"]:
-            p = father.father
-            while p:
+            for p in lineage.ancestors(father, line=Line.PATERNAL):
                 print_cyan(" -> ", end="")
                 print_person(p, end="")
-                p = p.father
-        print()
+        print_plain()
 
     if config["print_all_ancestors"] and father and mother:
         # Space to reduce clutter
-        print()
+        print_plain()
 
     if mother:
         print_blue("Mother:\t ", end="")
         print_cyan(person_repr(mother, parent=True), end="")
 
         if config["print_all_ancestors"]:
-            p = mother.father
-            while p:
+            for p in lineage.ancestors(mother, line=Line.PATERNAL):
                 print_cyan(" -> ", end="")
                 print_person(p, end="")
-                p = p.father
-        print()
+        print_plain()
 
     print_id_name_in_box(person)
 
@@ -321,7 +378,7 @@ def _print_person_details(person: Person):
     brother = sorted_by_id(set(brother) - {person})
     sister = sorted_by_id(set(sister) - {person})
     if brother or sister:
-        print()
+        print_plain()
     if brother:
         print_blue("Brother: ", end="")
         print_person(sorted_by_id(brother))
@@ -337,10 +394,10 @@ def toggle_print_all_ancestors(_):
     command = commands()[toggle_print_all_ancestors]
     if config["print_all_ancestors"]:
         print_blue(f"{command}=ON")
-        print("Ancestors will be shown")
+        print_plain("Ancestors will be shown")
     else:
         print_blue(f"{command}=OFF")
-        print("Ancestors will not be shown")
+        print_plain("Ancestors will not be shown")
 
 
 def toggle_print_id_with_person(_):
@@ -350,10 +407,10 @@ def toggle_print_id_with_person(_):
     command = commands()[toggle_print_id_with_person]
     if config["print_id_with_person"]:
         print_blue(f"{command}=ON")
-        print("ID will be shown for all")
+        print_plain("ID will be shown for all")
     else:
         print_blue(f"{command}=OFF")
-        print("ID will not be shown")
+        print_plain("ID will not be shown")
 
 
 def toggle_print_id_with_parent(_):
@@ -363,11 +420,11 @@ def toggle_print_id_with_parent(_):
     command = commands()[toggle_print_id_with_parent]
     if config["print_id_with_parent"]:
         print_blue(f"{command}=ON")
-        print("Parents ID will be shown")
+        print_plain("Parents ID will be shown")
     else:
         print_blue(f"{command}=OFF")
         tid = commands()[toggle_print_id_with_person]
-        print(f"Parents ID will not be shown, if {tid} is off")
+        print_plain(f"Parents ID will not be shown, if {tid} is off")
 
 
 def toggle_print_spouse_in_tree(_):
@@ -377,10 +434,10 @@ def toggle_print_spouse_in_tree(_):
     command = commands()[toggle_print_spouse_in_tree]
     if config["print_spouse_in_tree"]:
         print_blue(f"{command}=ON")
-        print("Spouse will be shown in tree")
+        print_plain("Spouse will be shown in tree")
     else:
         print_blue(f"{command}=OFF")
-        print("Spouse will not be shown in tree")
+        print_plain("Spouse will not be shown in tree")
 
 
 def toggle_print_expanded_tree(_):
@@ -391,39 +448,78 @@ def toggle_print_expanded_tree(_):
     command = commands()[toggle_print_expanded_tree]
     if config["print_expanded_tree"] == 0:
         print_blue(f"{command}=FEMALE")
-        print("Only females in tree will be expanded now")
+        print_plain("Only females in tree will be expanded now")
     elif config["print_expanded_tree"] == 1:
         print_blue(f"{command}=MALE")
-        print("Only males in tree will be expanded now")
+        print_plain("Only males in tree will be expanded now")
     else:
         print_blue(f"{command}=ALL")
-        print("Complete tree will be expanded now")
+        print_plain("Complete tree will be expanded now")
 
 
 def _find_by_id(lineage: Lineage, id: int):
     person = lineage.find_person_by_id(id)
     if person:
-        _print_person_details(person)
+        _print_person_details(lineage, person)
     else:
         print_red("ID not found")
 
 
-def _find_by_name(lineage: Lineage, name: str):
-    all_persons: dict[str, list[Person]] = defaultdict(list)
-    for person in lineage.all_persons():
-        # Multiple persons can have same name
-        all_persons[person.name.replace(" ", "")].append(person)
+def _search_name(lineage: Lineage | LineageSnapshot, name: str) -> list[Person]:
+    key = (normalize(name), alternate_spells_version(), lineage.revision)
+    persons = search_cache.get(key)
+    if persons is None:
+        # Persons with the same name are shown before the ones containing it
+        if isinstance(lineage, LineageSnapshot):
+            # Canonical index would load all the names, which the snapshot avoids
+            found = advanced_search_persons(name, lineage)
+            name_key = canonical_form(normalize(name))
+            same_name = [
+                p for p in found if canonical_form(normalize(p.name)) == name_key
+            ]
+        else:
+            same_name = _canonical_index(lineage).find(name)
+            found = advanced_search_persons(name, lineage)
+        same = set(same_name)
+        persons = same_name + [p for p in found if p not in same]
+        search_cache.put(key, persons)
+    return persons
+
+
+def _print_similar(found: list[tuple[Person, float]]):
+    for person, score in found:
+        print_grey(f"{score:4.0%}  ", end="")
+        print_plain(f"P{person.id}({person.name})")
+
 
-    person_names = advanced_search(name.replace(" ", ""), all_persons.keys())
-    if len(person_names) == 0:
+def _find_by_name(lineage: Lineage | LineageSnapshot, name: str):
+    persons = _search_name(lineage, name)
+    if len(persons) == 0:
         print_red("Name not found")
+        if isinstance(lineage, LineageSnapshot):
+            return
+        similar = _canonical_index(lineage).similar(name, NUM_SUGGESTIONS)
+        if similar:
+            print_yellow("Did you mean:")
+            _print_similar(similar)
         return
 
-    for person_name in person_names:
-        persons = all_persons[person_name]
-        for person in persons:
-            print_grey("─" * 50)
-            _print_person_details(person)
+    for person in persons:
+        print_grey("─" * 50)
+        _print_person_details(lineage, person)
+
+
+def fuzzy_find(lineage: Lineage | LineageSnapshot):
+    print_heading("FUZZY FIND")
+    if isinstance(lineage, LineageSnapshot):
+        print_red("Not available in read-only mode")
+        return
+    name = non_empty_input("Enter name to search: ")
+    similar = _canonical_index(lineage).similar(name, NUM_FUZZY_RESULTS)
+    if not similar:
+        print_red("No similar name found")
+        return
+    _print_similar(similar)
 
 
 def find(lineage: Lineage):
@@ -448,20 +544,33 @@ def all_relations(lineage: Lineage):
 
 
 def save_to_file(lineage: Lineage):
-    global lineage_modified
+    """
+    Changes are recorded in the journal of the file as they are made. Saving commits
+    them, making sure they are on disk, and rewrites the file when the journal has grown
+    large.
+    """
+
+    global lineage_modified, journal
+    rewrite = False
     if not lineage_modified:
         print_red("No change since last save")
         inp = take_input("Do you want to save again [y/N]: ")
         if inp not in ("y", "yes"):
             print_grey("Not saved, since not required")
             return
+        rewrite = True
 
-    filename = (
-        LINEAGE_HOME / f'lineage {datetime.now().strftime("%Y-%m-%d %H.%M.%S")}.json'
-    )
     try:
-        lineage.save_to_file(filename)
-        print_green("Saved successfully at", filename)
+        if journal is None or rewrite or journal.needs_compaction():
+            _write_lineage_file(lineage)
+            rewrite = True
+        else:
+            journal.commit()
+
+        if rewrite:
+            print_green("Saved successfully at", journal.base)
+        else:
+            print_green(f"Saved {len(journal)} changes in journal of", journal.base)
 
         lineage_modified = False
 
@@ -469,6 +578,28 @@ def save_to_file(lineage: Lineage):
         print_red("Some error occured while saving file")
 
 
+def _write_lineage_file(lineage: Lineage) -> None:
+    """
+    Rewrite the file of lineage along with its snapshot, clearing its journal. A new file
+    is created if lineage is not loaded from or saved to a file yet.
+    """
+
+    global journal
+    if journal is None:
+        filename = (
+            LINEAGE_HOME
+            / f'lineage {datetime.now().strftime("%Y-%m-%d %H.%M.%S")}.json'
+        )
+        lineage.save_to_file(filename)
+        journal = Journal(filename)
+        lineage.attach_journal(journal)
+    else:
+        journal.compact(lineage)
+
+    # Snapshot is used to browse the lineage quickly in read-only mode
+    save_snapshot(lineage, journal.base.with_suffix(".snapshot"))
+
+
 def autosave(lineage: Lineage):
     global lineage_modified
     if not lineage_modified:
@@ -486,31 +617,33 @@ def autosave(lineage: Lineage):
         pass
 
 
-def load_from_file() -> Lineage | None:
-    def print_num_persons_and_relations(file):
-        with open(file) as f:
-            data: dict = json.load(f)
-
-        num_persons = len(data["persons"])
-        num_relations = len(data["relations"])
-
-        print_grey(f"   [{num_persons}]", end="")
-        print_grey(f"\t[{num_relations}]", end="")
+def load_from_file(read_only=False) -> Lineage | LineageSnapshot | None:
+    def print_num_persons_and_relations(file: Path, counts: FileCounts | None):
+        if counts is None:
+            print_red("   [unreadable]", end="")
+            return
+        print_grey(f"   [{counts.persons}]", end="")
+        print_grey(f"\t[{counts.relations}]", end="")
+        # Counts are of the file, without the changes in its journal
+        changes = num_entries(file)
+        if changes:
+            print_yellow(f" +{changes} changes", end="")
 
     def print_all_files(files: list):
+        counts = file_counts(files, FILE_COUNTS_CACHE, workers=os.cpu_count())
         padding = len(str(len(files)))
         print_yellow(" " * (padding - 1), end="")
-        print("# ", "Filenames", " " * 23, "Persons  Relations")
+        print_plain("# ", "Filenames", " " * 23, "Persons  Relations")
 
         i = len(files)
-        for file in reversed(files[1:]):
-            print(f"{i:{padding}d}:", file.name, end="")
-            print_num_persons_and_relations(file)
-            print()
+        for file, file_count in reversed(list(zip(files[1:], counts[1:]))):
+            print_plain(f"{i:{padding}d}:", file.name, end="")
+            print_num_persons_and_relations(file, file_count)
+            print_plain()
             i -= 1
 
-        print(f"{1:{padding}d}:", files[0].name, end="")
-        print_num_persons_and_relations(files[0])
+        print_plain(f"{1:{padding}d}:", files[0].name, end="")
+        print_num_persons_and_relations(files[0], counts[0])
         print_green(" (latest)")
 
     path = LINEAGE_HOME
@@ -527,8 +660,64 @@ def load_from_file() -> Lineage | None:
 
     print_all_files(files)
     inp = int(input_in_range("Select the file to load: ", 1, len(files) + 1))
+    file = files[inp - 1]
+
+    if read_only:
+        snapshot = file.with_suffix(".snapshot")
+        if (
+            snapshot.exists()
+            and snapshot.stat().st_mtime >= file.stat().st_mtime
+            and not file.with_suffix(".journal").exists()
+        ):
+            return LineageSnapshot(snapshot)
+        print_red("Snapshot of the file is not up to date, loading the complete file")
+
+    return _load_file(file)
+
+
+def _load_file(file: Path) -> Lineage:
+    """Load the lineage from the file along with the changes in its journal"""
+
+    issues = []
+    lineage = Lineage.load_from_file(file, issues)
+    if issues:
+        print_red(f"{len(issues)} invalid rows in the file are skipped")
+
+    global journal
+    journal = Journal(file)
+    num_changes = journal.replay(lineage)
+    if num_changes:
+        print_yellow(f"Restored {num_changes} changes from the journal")
+    lineage.attach_journal(journal)
+
+    issues = lineage.validate(workers=os.cpu_count())
+    if issues:
+        print_red(f"{len(issues)} consistency issues found in the lineage")
+        for issue in issues[:10]:
+            print_red(" ", issue)
+
+    return lineage
+
+
+def merge(lineage: Lineage):
+    print_heading("MERGE LINEAGE")
+    file = non_empty_input("Enter path of the lineage file to merge: ").strip()
+
+    issues = []
+    other = Lineage.load_from_file(file, issues)
+    if issues:
+        print_red(f"{len(issues)} invalid rows in the file are skipped")
+
+    report = lineage.merge(other, name_key=lambda name: canonical_form(normalize(name)))
+    print_cyan("Matched persons:", len(report.matched))
+    print_cyan("Added persons:", len(report.added))
+    if report.conflicts:
+        print_red(f"{len(report.conflicts)} conflicts")
+        for issue in report.conflicts:
+            print_red(" ", issue)
 
-    return Lineage.load_from_file(files[inp - 1])
+    global lineage_modified
+    lineage_modified = True
 
 
 def safe_exit(lineage: Lineage):
@@ -543,29 +732,115 @@ def safe_exit(lineage: Lineage):
     )
     if inp in ("y", "yes"):
         autosave(lineage)
+        # Unsaved changes are kept only in the autosave, not replayed on the next load
+        if journal is not None:
+            journal.discard()
         exit(0)
 
     print_red("Exit aborted")
 
 
-def shortest_path(lineage: Lineage):
+def shortest_path(lineage: Lineage | LineageSnapshot):
     print_heading("SHORTEST PATH")
     person1_id = int(non_empty_input("Enter ID of I person: "))
     person2_id = int(non_empty_input("Enter ID of II person: "))
 
-    sp = lineage.shortest_path(
-        lineage.find_person_by_id(person1_id),
-        lineage.find_person_by_id(person2_id),
-    )
+    start = lineage.find_person_by_id(person1_id)
+    stop = lineage.find_person_by_id(person2_id)
+    (sp,) = lineage.shortest_paths([(start, stop)])
+    if sp is None:
+        raise ValueError(f"No path between {start} and {stop}")
 
-    for i in range(len(sp) - 1):
-        print_cyan(sp[i], end=" ")
-        print_blue(f"--{sp[i].relation_with(sp[i+1]).name}->", end=" ")
-    print_cyan(sp[-1])
+    print_cyan(sp[0][0], end=" ")
+    for person, relation in sp[1:]:
+        print_blue(f"--{relation.name}->", end=" ")
+        print_cyan(person, end=" ")
+    print_plain()
 
     print_cyan("Distance:", len(sp) - 1)
 
 
+def relationship(lineage: Lineage | LineageSnapshot):
+    print_heading("RELATIONSHIP")
+    person1_id = int(non_empty_input("Enter ID of I person: "))
+    person2_id = int(non_empty_input("Enter ID of II person: "))
+
+    person1 = lineage.find_person_by_id(person1_id)
+    person2 = lineage.find_person_by_id(person2_id)
+    for id, person in ((person1_id, person1), (person2_id, person2)):
+        if person is None:
+            print_red(f"ID {id} is not present")
+            return
+
+    relationship = lineage.relationship(person1, person2)
+    if relationship is None:
+        print_red("No common ancestor is present")
+        return
+
+    print_cyan(person_repr(person2), end=" ")
+    print_blue(f"is {relationship} of", end=" ")
+    print_cyan(person_repr(person1))
+
+    common = lineage.common_ancestors(person1, person2)
+    print_blue("Common ancestors:", end=" ")
+    print_cyan(", ".join(person_repr(person) for person in common))
+
+
+def _duplicate_index(lineage: Lineage | LineageSnapshot) -> DuplicateIndex:
+    global duplicate_index
+    if duplicate_index is None:
+        duplicate_index = DuplicateIndex(canonical_form, alternate_spells_version)
+        if isinstance(lineage, LineageSnapshot):
+            for person in lineage.all_persons():
+                duplicate_index.add(person)
+        else:
+            lineage.attach_index(duplicate_index)
+    return duplicate_index
+
+
+def _canonical_index(lineage: Lineage) -> CanonicalIndex:
+    """
+    Index of the canonical names, built when first needed. Not built for the snapshot,
+    which is searched directly so that it opens quickly.
+    """
+
+    global canonical_index
+    if canonical_index is None:
+        canonical_index = CanonicalIndex(canonical_form, alternate_spells_version)
+        lineage.attach_index(canonical_index)
+        # Keys are rebuilt in the thread fetching alternate_spells, not at next search
+        add_alternate_spells_listener(canonical_index.rebuild)
+    return canonical_index
+
+
+def cache_stats(_):
+    print_heading("CACHE STATISTICS")
+    for name, cache in (("Search", search_cache), ("Details", details_cache)):
+        lookups = cache.hits + cache.misses
+        rate = f"{cache.hits / lookups:.0%}" if lookups else "-"
+        print_blue(f"{name + ':':9}", end="")
+        print_plain(
+            f"{cache.hits} hits, {cache.misses} misses ({rate} hit rate),"
+            f" {len(cache)}/{cache.maxsize} entries"
+        )
+
+
+def duplicates(lineage: Lineage):
+    print_heading("POSSIBLE DUPLICATES")
+    found = _duplicate_index(lineage).all_duplicates()
+
+    if len(found) == 0:
+        print_red("No possible duplicate found")
+        return
+
+    for person1, person2, score in found:
+        print_cyan(person1, end=" ")
+        print_blue("~", end=" ")
+        print_cyan(person2, end=" ")
+        print_grey(f"({score:.2f})")
+    print_cyan("Total pairs:", len(found))
+
+
 def _helper_no_and_one_parent(lineage: Lineage) -> tuple[set, set]:
     """Return set of persons having father and set of persons having mother"""
 
@@ -579,18 +854,15 @@ def _helper_no_and_one_parent(lineage: Lineage) -> tuple[set, set]:
 
 def no_parent(lineage: Lineage):
     print_heading("PERSONS HAVING NO PARENT")
-    f, m = _helper_no_and_one_parent(lineage)
-
-    allp = set(lineage.all_persons())
-    no_parent = allp - f.union(m)
+    # First generation consists of the persons without parents
+    no_parent = lineage.generation(0)
 
     if len(no_parent) == 0:
         print_red("All persons are having at least one parent")
         return
 
-    no_parent = sorted_by_id(no_parent)
     for i in no_parent:
-        print(i)
+        print_plain(i)
     print_cyan("Total persons:", len(no_parent))
 
 
@@ -606,62 +878,66 @@ def one_parent(lineage: Lineage):
 
     single_parent = sorted_by_id(single_parent)
     for i in single_parent:
-        print(i)
+        print_plain(i)
 
     print_cyan("Total persons:", len(single_parent))
 
 
-def show_tree(lineage: Lineage):
-    def _build_complete_tree(person: Person) -> dict[Person, dict]:
-        tree = {}
-        children = sorted_by_id(person.children)
-        for child in children:
-            occurance[child] += 1
-            tree[child] = _build_complete_tree(child)
-        return tree
-
-    def _build_male_expanded_tree(person: Person) -> dict[Person, dict]:
-        tree = {}
-        daughters = sorted_by_id(person.daughters)
-        for daughter in daughters:
-            tree[daughter] = {}
-
-        sons = sorted_by_id(person.sons)
-        for son in sons:
-            occurance[son] += 1
-            tree[son] = _build_male_expanded_tree(son)
-        return tree
-
-    def _build_female_expanded_tree(person: Person) -> dict[Person, dict]:
-        tree = {}
-        sons = sorted_by_id(person.sons)
-        for son in sons:
-            tree[son] = {}
-
-        daughters = sorted_by_id(person.daughters)
-        for daughter in daughters:
-            occurance[daughter] += 1
-            tree[daughter] = _build_female_expanded_tree(daughter)
-        return tree
+def show_tree(lineage: Lineage, options: str = ""):
+    """Options: `--out FILE` writes the tree to the file instead of printing"""
+
+    out = None
+    if options:
+        option, _, out = options.partition(" ")
+        out = out.strip()
+        if option != "--out" or not out:
+            raise ValueError("Usage: tree [--out FILE]")
+
+    def complete_tree_children(person: Person) -> list[tuple[Person, bool]]:
+        return [(child, True) for child in sorted_by_id(person.children)]
+
+    def male_expanded_tree_children(person: Person) -> list[tuple[Person, bool]]:
+        return [(daughter, False) for daughter in sorted_by_id(person.daughters)] + [
+            (son, True) for son in sorted_by_id(person.sons)
+        ]
+
+    def female_expanded_tree_children(person: Person) -> list[tuple[Person, bool]]:
+        return [(son, False) for son in sorted_by_id(person.sons)] + [
+            (daughter, True) for daughter in sorted_by_id(person.daughters)
+        ]
 
     print_heading("PRINT TREE")
     p_id = int(non_empty_input("Enter ID of person: "))
     person = lineage.find_person_by_id(p_id)
 
-    occurance = defaultdict(int)
     if person is not None:
         if config["print_expanded_tree"] == 0:
-            tree = {person: _build_female_expanded_tree(person)}
+            children = female_expanded_tree_children
             print_blue("\nFemale expanded tree")
         elif config["print_expanded_tree"] == 1:
-            tree = {person: _build_male_expanded_tree(person)}
+            children = male_expanded_tree_children
             print_blue("\nMale expanded tree")
         else:
-            tree = {person: _build_complete_tree(person)}
-        # Since two persons can have same name, person_repr can't be used while building the tree dict
-        print_tree(
-            tree, occurance, person_repr, print_spouse=config["print_spouse_in_tree"]
+            children = complete_tree_children
+
+        lines = tree_lines(
+            person,
+            children,
+            person_repr,
+            print_spouse=config["print_spouse_in_tree"],
+            color=out is None and use_color(),
         )
+        if out is not None:
+            with open(out, "w", encoding="utf-8") as f:
+                write_tree(lines, f)
+            print_green(f"Tree written to {out}")
+            return
+
+        # Long trees are paged on terminal, so that the first page shows up at once
+        page_size = None
+        if sys.stdout.isatty():
+            page_size = max(shutil.get_terminal_size().lines - 2, 1)
+        print_tree(lines, page_size)
 
     else:
         print_red(f"ID {p_id} is not present")
@@ -683,14 +959,19 @@ addc:\t\tAdd children of a person
 adds:\t\tAdd spouse of a person
 edit:\t\tEdit name of a person
 find:\t\tFind and show matching person
-tree:\t\tPrint tree of a person
+fuzzy:\t\tPersons with names similar to the given, most similar first
+tree:\t\tPrint tree of a person, or write it to file by `tree --out FILE`
 sp:\t\tShortest path between two persons
+rel:\t\tRelationship and nearest common ancestors of two persons
+dup:\t\tPossible duplicate persons in lineage
 rmrel:\t\tRemove relation between two persons
 rmperson:\tRemove person from lineage
 noparent:\tPersons whose no parent is present in lineage
 oneparent:\tPersons whose only one parent is present in lineage
 showall:\tShow all persons in lineage
 showallrel:\tShow all relations in lineage
+stats:\t\tShow hits and misses of the search and person details caches
+merge:\t\tMerge another lineage file into lineage
 save:\t\tSave lineage to file
 exit:\t\tExit the lineage prompt
 help:\t\tShow this help
@@ -708,24 +989,62 @@ ts:\t\tWhether to show spouse in tree
 """
 
     print_yellow("USAGE: Type following commands to do respective action")
-    print_help(commands_help, [6])
+    print_help(commands_help, [7])
     print_yellow("\nTOGGLES/SWITCHES: Controls the output of other commands")
     print_help(toggles_help, [])
 
 
-def _main():
+def _run_command(
+    lineage: Lineage | LineageSnapshot, command: str, disabled_commands: set
+):
+    """
+    Run the command entered at the prompt, or find the person by the ID or name entered.
+    Options are taken only when starting with --, so names like `tree ali` are searched.
+    """
+
+    commands_fn = {v: k for k, v in commands().items()}
+    command_ = command.replace(" ", "").lower()
+    name, _, options = command.partition(" ")
+    name = name.lower()
+    options = options.strip()
+    if command_ in commands_fn:
+        if commands_fn[command_] in disabled_commands:
+            print_red("Not available in read-only mode")
+        else:
+            commands_fn[command_](lineage)
+    elif (
+        name in commands_fn
+        and commands_fn[name] in commands_with_options()
+        and options.startswith("--")
+    ):
+        commands_fn[name](lineage, options)
+    else:
+        print_heading("FIND PERSON")
+        if command.isdigit():
+            _find_by_id(lineage, int(command))
+        else:
+            _find_by_name(lineage, command)
+
+
+def _main(read_only=False):
     print_heading("LINEAGE")
     lineage = None
 
     try:
-        inp = input_from(
-            "Do you want to load lineage from file (y/n)? ", ("y", "n", "yes", "no")
-        ).lower()
-        if inp in ("y", "yes"):
-            lineage = load_from_file()
+        if read_only:
+            lineage = load_from_file(read_only=True)
+            if lineage is None:
+                exit()
+        else:
+            inp = input_from(
+                "Do you want to load lineage from file (y/n)? ",
+                ("y", "n", "yes", "no"),
+            ).lower()
+            if inp in ("y", "yes"):
+                lineage = load_from_file()
     except (KeyboardInterrupt, Exception) as e:
         print_red("\nSomething went wrong")
-        print(e)
+        print_plain(e)
         exit()
 
     show_help(show_changes=True)
@@ -734,40 +1053,157 @@ def _main():
         print_yellow("Creating new lineage\n")
         lineage = Lineage()
 
-    commands_fn = {v: k for k, v in commands().items()}
+    disabled_commands = set()
+    if isinstance(lineage, LineageSnapshot):
+        print_yellow("Lineage is opened in read-only mode\n")
+        disabled_commands = modifying_commands()
 
     while True:
         try:
-            command = non_empty_input("# ").strip()
-            command_ = command.replace(" ", "").lower()
-            if command_ in commands_fn:
-                commands_fn[command_](lineage)
-            else:
-                print_heading("FIND PERSON")
-                if command.isdigit():
-                    _find_by_id(lineage, int(command))
-                else:
-                    _find_by_name(lineage, command)
+            _run_command(lineage, non_empty_input("# ").strip(), disabled_commands)
 
         except KeyboardInterrupt:
-            print()
+            print_plain()
             try:
                 safe_exit(lineage)
             except (KeyboardInterrupt, EOFError):
-                print()
+                print_plain()
 
         except Exception as e:
             print_red(e)
 
         print_grey("─" * 50)
+        flush()
+
+
+def _run_script(lineage: Lineage, lines: Iterable[str]) -> int:
+    """
+    Run the commands of the script without prompts and return the number of commands run.
+
+    Each line is a command followed by the answers of its prompts in the order they are
+    asked, quoted if having spaces, e.g. `new "Ali Khan" m 0`. Blank answers may be left
+    at the end. Text after # is ignored. Stops with ValueError at the first failing line.
+    """
+
+    commands_fn = {v: k for k, v in commands().items()}
+    # Lineage is saved once after the script
+    disabled_commands = {save_to_file, safe_exit}
+
+    num_commands = 0
+    for line_no, line in enumerate(lines, 1):
+        try:
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            command = commands_fn.get(words[0].lower())
+            if command is None or command in disabled_commands:
+                raise ValueError(f"Unknown command {words[0]}")
+
+            answer_prompts(words[1:])
+            command(lineage)
+            if unanswered_prompts():
+                raise ValueError(f"{unanswered_prompts()} extra arguments")
+        except Exception as e:
+            raise ValueError(f"Line {line_no}: {line.strip()}\n{e}") from e
+        finally:
+            answer_prompts(None)
+        num_commands += 1
+
+    return num_commands
+
+
+def _main_script(script: str, file: str | None = None):
+    lineage = Lineage()
+    if file is not None:
+        lineage = _load_file(Path(file))
+        # Changes are saved once after the script, instead of recording them as they run
+        lineage.attach_journal(None)
+
+    start = perf_counter()
+    try:
+        if script == "-":
+            num_commands = _run_script(lineage, sys.stdin)
+        else:
+            with open(script, encoding="utf-8") as f:
+                num_commands = _run_script(lineage, f)
+    except ValueError as e:
+        print_red(e)
+        print_red("Script stopped, lineage is not saved")
+        exit(1)
+    run_time = perf_counter() - start
+
+    start = perf_counter()
+    if lineage_modified:
+        _write_lineage_file(lineage)
+        print_green("Saved successfully at", journal.base)
+    save_time = perf_counter() - start
+
+    print_grey("─" * 50)
+    print_yellow(
+        f"{num_commands} commands run in {run_time:.3f}s, saved in {save_time:.3f}s"
+    )
+
+
+def _main_search_all(name: str):
+    start = perf_counter()
+    hits, num_files, num_cached = search_all(name, workers=os.cpu_count())
+    search_time = perf_counter() - start
+
+    file = None
+    for hit in hits:
+        if hit.file != file:
+            file = hit.file
+            print_blue(f"\n{file.relative_to(LINEAGE_HOME)}")
+        print_plain(f"  P{hit.id}({hit.name})")
+    if not hits:
+        print_red("Name not found in any file")
+
+    print_grey("─" * 50)
+    print_yellow(
+        f"{len(hits)} persons found in {num_files} files ({num_cached} from name cache)"
+        f" in {search_time:.3f}s"
+    )
 
 
 def main():
+    parser = ArgumentParser(prog="lineage", description="Create and edit lineage")
+    parser.add_argument(
+        "--read-only",
+        action="store_true",
+        help="browse the saved snapshot of a lineage file without loading it",
+    )
+    parser.add_argument(
+        "--script",
+        metavar="SCRIPT",
+        help="run the commands of the script file (- for stdin) without prompts and save"
+        " the lineage once at the end",
+    )
+    parser.add_argument(
+        "--file",
+        metavar="FILE",
+        help="lineage file the script is run on, new lineage if not given",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    search_all_parser = subparsers.add_parser(
+        "search-all", help="search a name in all the saved lineage files"
+    )
+    search_all_parser.add_argument("name", nargs="+")
+    args = parser.parse_args()
+    if args.file is not None and args.script is None:
+        parser.error("--file is used only with --script")
+
     setup()
     try:
-        _main()
+        if args.command == "search-all":
+            _main_search_all(" ".join(args.name))
+        elif args.script is not None:
+            _main_script(args.script, args.file)
+        else:
+            _main(read_only=args.read_only)
     except KeyboardInterrupt:
         exit(0)
+    finally:
+        flush()
 
 
 if __name__ == "__main__":
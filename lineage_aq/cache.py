@@ -0,0 +1,45 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """
+    Bounded map which drops the least recently used entry when full, counting the hits and
+    misses of lookups.
+
+    Entries are not invalidated. Keys should include the version of everything the value
+    depends on (e.g. Lineage.revision), so that stale entries are never hit and leave the
+    cache as they get old.
+    """
+
+    def __init__(self, maxsize: int = 128) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__entries: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value = self.__entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.__entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        if len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.__entries.clear()
+        self.hits = 0
+        self.misses = 0
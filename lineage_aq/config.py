@@ -1,18 +1,26 @@
+from __future__ import annotations
 import json
 import requests
 from pathlib import Path
 from threading import Thread
+from typing import Callable
 
 
 LINEAGE_HOME = Path().home() / ".lineage"
 LINEAGE_CONFIG_DIR = LINEAGE_HOME / ".config"
 LINEAGE_AUTOSAVE_DIR = LINEAGE_HOME / "autosave"
+LINEAGE_CACHE_DIR = LINEAGE_HOME / ".cache"
 alternate_spells_web_url = (
     "https://aqdasak.github.io/lineage_list/alternate_spells.json"
 )
 
 
 alternate_spells = []
+# Incremented whenever alternate_spells is replaced, so that the data derived from it
+# can be rebuilt
+_alternate_spells_version = 0
+# Called after alternate_spells is replaced, in the thread which replaced it
+_alternate_spells_listeners: list[Callable[[], None]] = []
 
 config = {
     "print_all_ancestors": False,
@@ -71,6 +79,26 @@ def save_config():
         )
 
 
+def alternate_spells_version() -> int:
+    return _alternate_spells_version
+
+
+def add_alternate_spells_listener(listener: Callable[[], None]) -> None:
+    """
+    Call the listener whenever alternate_spells is replaced. When fetched from the web,
+    listener is called in the background thread of fetching.
+    """
+
+    _alternate_spells_listeners.append(listener)
+
+
+def _alternate_spells_updated():
+    global _alternate_spells_version
+    _alternate_spells_version += 1
+    for listener in _alternate_spells_listeners:
+        listener()
+
+
 def load_alternate_spells():
     """
     Load alternate_spells from storage
@@ -83,6 +111,7 @@ def load_alternate_spells():
             # If `[:]` is not used, new variable is created and data is
             # not written in global variable. Other solution is using `+=`
             alternate_spells[:] = json.load(f)
+            _alternate_spells_updated()
     except Exception:
         pass
 
@@ -100,6 +129,7 @@ def fetch_alternate_spells_from_web():
             result = requests.get(alternate_spells_web_url).text
             if result:
                 alternate_spells[:] = json.loads(result)
+                _alternate_spells_updated()
                 with open(file, "w") as f:
                     f.write(result)
 
@@ -115,6 +145,7 @@ def initialize_save_directories():
     LINEAGE_HOME.mkdir(parents=True, exist_ok=True)
     LINEAGE_AUTOSAVE_DIR.mkdir(parents=True, exist_ok=True)
     LINEAGE_CONFIG_DIR.mkdir(parents=True, exist_ok=True)
+    LINEAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def setup():
@@ -0,0 +1,179 @@
+from __future__ import annotations
+from collections import defaultdict
+from typing import TYPE_CHECKING, Callable, NamedTuple
+
+if TYPE_CHECKING:
+    from lineage_aq.lineage import Person
+
+
+# Keys shared by more persons than this are too common to make a block
+MAX_BLOCK = 50
+# Words shared by more persons than this are common names, not shown as same name
+COMMON_NAME = 8
+# Pairs scoring below this are not reported as duplicates
+MIN_SCORE = 0.5
+
+
+class Duplicate(NamedTuple):
+    person1: Person
+    person2: Person
+    score: float
+
+
+def _same(x: str) -> str:
+    return x
+
+
+class DuplicateIndex:
+    """
+    Blocking index to find the persons who may have been added more than once.
+
+    Persons are grouped into blocks by the keys of their names, i.e. each word of the
+    name (prefixed `w:`) and the whole name without spaces (prefixed `n:`), in the
+    canonical spelling. Only the persons sharing a block are compared, and they are
+    scored by the fraction of the keys shared, plus one for each shared parent and spouse.
+
+    The index is kept updated by the lineage it is attached to (Lineage.attach_index).
+
+    Parameters
+    ----------
+    canonical: Callable[[str], str]
+        canonical spelling of the lowercased word, same for all the alternate spellings
+    version: Callable[[], int] | None
+        version of the canonical spelling. All the keys are rebuilt when it changes.
+    """
+
+    def __init__(
+        self,
+        canonical: Callable[[str], str] = _same,
+        version: Callable[[], int] | None = None,
+    ) -> None:
+        self.__canonical = canonical
+        self.__version = version
+        self.__indexed_version = version() if version is not None else None
+        self.__blocks: dict[str, set[Person]] = defaultdict(set)
+        self.__keys: dict[Person, frozenset[str]] = {}
+
+    def name_keys(self, name: str) -> frozenset[str]:
+        words = name.lower().split()
+        keys = {"w:" + self.__canonical(word) for word in words}
+        keys.add(self.__whole_key(words))
+        return frozenset(keys)
+
+    def __whole_key(self, words: list[str]) -> str:
+        # Kept apart from the word keys, so that a single word name does not take in
+        # the block of the common word
+        return "n:" + self.__canonical("".join(words))
+
+    def __sync(self) -> None:
+        if self.__version is None:
+            return
+        version = self.__version()
+        if version != self.__indexed_version:
+            self.__indexed_version = version
+            persons = list(self.__keys)
+            self.__blocks.clear()
+            self.__keys.clear()
+            for person in persons:
+                self.add(person)
+
+    def add(self, person: Person) -> None:
+        keys = self.name_keys(person.name)
+        self.__keys[person] = keys
+        for key in keys:
+            self.__blocks[key].add(person)
+
+    def remove(self, person: Person) -> None:
+        keys = self.__keys.pop(person, None)
+        if keys is None:
+            return
+
+        for key in keys:
+            block = self.__blocks[key]
+            block.discard(person)
+            if not block:
+                del self.__blocks[key]
+
+    def update(self, person: Person) -> None:
+        """Reindex the person after the change in name"""
+
+        self.remove(person)
+        self.add(person)
+
+    def __blocks_of(
+        self, keys: frozenset[str], limit: int = MAX_BLOCK
+    ) -> list[set[Person]]:
+        blocks = (self.__blocks.get(key) for key in keys)
+        return [block for block in blocks if block and len(block) <= limit]
+
+    def find(self, name: str) -> list[Person]:
+        """
+        Persons sharing a block with the name, most similar first. The whole name
+        matches even if it is a common name.
+        """
+
+        self.__sync()
+        keys = self.name_keys(name)
+        found = set()
+        for block in self.__blocks_of(keys, COMMON_NAME):
+            found |= block
+        found |= self.__blocks.get(self.__whole_key(name.lower().split()), set())
+
+        def similarity(person: Person) -> tuple:
+            return (-_similarity(keys, self.__keys[person]), person.id)
+
+        return sorted(found, key=similarity)
+
+    def duplicates_of(self, person: Person) -> list[Duplicate]:
+        """Possible duplicates of the person, best first"""
+
+        self.__sync()
+        keys = self.__keys[person]
+        candidates = set()
+        for block in self.__blocks_of(keys):
+            candidates |= block
+        candidates.discard(person)
+
+        found = []
+        for other in candidates:
+            score = self.__score(person, other)
+            if score >= MIN_SCORE:
+                found.append(Duplicate(person, other, score))
+        found.sort(key=lambda d: (-d.score, d.person2.id))
+        return found
+
+    def all_duplicates(self) -> list[Duplicate]:
+        """Possible duplicates among all the indexed persons, best first"""
+
+        self.__sync()
+        pairs = set()
+        for block in self.__blocks.values():
+            if 1 < len(block) <= MAX_BLOCK:
+                block = sorted(block, key=lambda person: person.id)
+                for i, person in enumerate(block):
+                    for other in block[i + 1 :]:
+                        pairs.add((person, other))
+
+        found = []
+        for person, other in pairs:
+            score = self.__score(person, other)
+            if score >= MIN_SCORE:
+                found.append(Duplicate(person, other, score))
+        found.sort(key=lambda d: (-d.score, d.person1.id, d.person2.id))
+        return found
+
+    def __score(self, person: Person, other: Person) -> float:
+        # Relatives of each other are different persons, even if named same
+        if person.gender != other.gender or person.relation_with(other) is not None:
+            return 0.0
+
+        score = _similarity(self.__keys[person], self.__keys[other])
+        score += len(set(person.parents).intersection(other.parents))
+        spouses = person.husband + person.wife
+        if spouses:
+            score += len(set(spouses).intersection(other.husband + other.wife))
+        return score
+
+
+def _similarity(keys1: frozenset[str], keys2: frozenset[str]) -> float:
+    return len(keys1 & keys2) / len(keys1 | keys2)
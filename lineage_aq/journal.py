@@ -0,0 +1,162 @@
+from __future__ import annotations
+import json
+import os
+from pathlib import Path
+
+from lineage_aq.lineage import Lineage, Relation
+from lineage_aq.metadata import metadata_path
+
+# Number of entries after which the journal should be compacted into the base file
+COMPACT_AFTER = 500
+
+
+class Journal:
+    """
+    Append-only log of the changes made to a lineage after its base file was saved.
+
+    The journal of `lineage X.json` is kept in `lineage X.journal`, one JSON array per line:
+    ```
+    ["person", id, name, gender]
+    ["name", id, name]
+    ["rel", id1, id2, relation]
+    ["unrel", id1, id2]
+    ["rmperson", id]
+    ```
+    Entries are written as the changes happen, so a crash loses no change. Loading the
+    base file and replaying the journal on it restores the lineage.
+
+    Entries recorded after the last commit are the unsaved changes, which are dropped
+    by discard when the user leaves without saving.
+    """
+
+    def __init__(self, base: Path | str) -> None:
+        self.base = Path(base)
+        self.path = self.base.with_suffix(".journal")
+        self.__file = None
+        self.__num_entries = 0
+        # Size of the journal file and number of entries at the last commit
+        self.__committed_size = self.path.stat().st_size if self.path.exists() else 0
+        self.__committed_entries = 0
+
+    def __len__(self) -> int:
+        return self.__num_entries
+
+    def record(self, *entry) -> None:
+        if self.__file is None:
+            self.__file = open(self.path, "a")
+        self.__file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        # Flushed to OS on every entry, so that it survives the crash of the program
+        self.__file.flush()
+        self.__num_entries += 1
+
+    def sync(self) -> None:
+        """Make sure that the recorded entries are written to the disk"""
+
+        if self.__file is not None:
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+
+    def commit(self) -> None:
+        """Make the entries recorded so far saved, so that discard keeps them"""
+
+        self.sync()
+        self.__committed_size = self.path.stat().st_size if self.path.exists() else 0
+        self.__committed_entries = self.__num_entries
+
+    def discard(self) -> None:
+        """Drop the entries recorded after the last commit from the journal file"""
+
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        if self.__committed_size == 0:
+            if self.path.exists():
+                self.path.unlink()
+        else:
+            os.truncate(self.path, self.__committed_size)
+        self.__num_entries = self.__committed_entries
+
+    def close(self) -> None:
+        if self.__file is not None:
+            self.sync()
+            self.__file.close()
+            self.__file = None
+
+    def replay(self, lineage: Lineage) -> int:
+        """
+        Apply the recorded entries to the lineage loaded from the base file.
+        Return the number of entries applied.
+        """
+
+        if not self.path.exists():
+            return 0
+
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            # Last line may be partially written due to crash
+            valid = data.rfind(b"\n") + 1
+            if valid < len(data):
+                f.truncate(valid)
+
+        num_entries = 0
+        for line in data[:valid].decode().splitlines():
+            try:
+                _apply(lineage, json.loads(line))
+                num_entries += 1
+            except Exception:
+                pass
+
+        self.__num_entries += num_entries
+        # Changes restored from the journal are kept as saved
+        self.__committed_size = valid
+        self.__committed_entries = self.__num_entries
+        return num_entries
+
+    def compact(self, lineage: Lineage) -> None:
+        """Write the lineage as the new base file and clear the journal"""
+
+        temp = self.base.with_name(self.base.name + ".tmp")
+        lineage.save_to_file(temp)
+        os.replace(temp, self.base)
+        os.replace(metadata_path(temp), metadata_path(self.base))
+
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        if self.path.exists():
+            self.path.unlink()
+        self.__num_entries = 0
+        self.__committed_size = 0
+        self.__committed_entries = 0
+
+    def needs_compaction(self) -> bool:
+        return self.__num_entries >= COMPACT_AFTER
+
+
+def num_entries(base: Path) -> int:
+    """Number of entries in the journal of the base file, not yet compacted into it"""
+
+    try:
+        with open(base.with_suffix(".journal"), "rb") as f:
+            return f.read().count(b"\n")
+    except OSError:
+        return 0
+
+
+def _apply(lineage: Lineage, entry: list) -> None:
+    kind, id, *args = entry
+    if kind == "person":
+        lineage._add_person(id, *args)
+        return
+
+    person = lineage.find_person_by_id(id)
+    if kind == "name":
+        person.name = args[0]
+    elif kind == "rel":
+        person._add_relation(lineage.find_person_by_id(args[0]), Relation[args[1]])
+    elif kind == "unrel":
+        person._remove_from_one_side(lineage.find_person_by_id(args[0]))
+    elif kind == "rmperson":
+        person.self_remove()
+    else:
+        raise ValueError(f"Unknown journal entry {entry}")
@@ -0,0 +1,142 @@
+"""
+Incremental reading and writing of the lineage file format.
+
+The file is a JSON object whose values are mostly arrays of rows
+```
+{
+"headers":{"persons":["id","name","gender"],"relations":["id1","id2","relation"]},
+"persons":[
+[0,"Father","m"],
+[1,"Mother","f"]
+],
+"relations":[
+[0,1,"WIFE"],
+[1,0,"HUSBAND"]
+]
+}
+```
+Rows are written and read one at a time, so the whole document is never held in memory.
+"""
+
+from __future__ import annotations
+import json
+import re
+from typing import IO, Any, Iterable, Iterator
+
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = re.compile(r"\s*")
+_decoder = json.JSONDecoder()
+_encoder = json.JSONEncoder(separators=(",", ":"))
+
+
+def dump_rows(f: IO[str], headers: dict, sections: dict[str, Iterable[list]]) -> None:
+    """
+    Write the headers and each section of rows to the file, one row per line
+
+    Parameters
+    ----------
+    f: IO[str]
+        file opened for writing
+    headers: dict
+        written as the value of "headers" key
+    sections: dict[str, Iterable[list]]
+        key of the section and the rows to be written in it. Rows are consumed lazily.
+    """
+
+    f.write('{\n"headers":')
+    f.write(_encoder.encode(headers))
+    for key, rows in sections.items():
+        f.write(",\n")
+        f.write(_encoder.encode(key))
+        f.write(":[")
+        separator = "\n"
+        for row in rows:
+            f.write(separator)
+            f.write(_encoder.encode(row))
+            separator = ",\n"
+        f.write("\n]")
+    f.write("\n}\n")
+
+
+class _Reader:
+    def __init__(self, f: IO[str], chunk_size: int = CHUNK_SIZE) -> None:
+        self.__f = f
+        self.__chunk_size = chunk_size
+        self.__buffer = ""
+        self.__pos = 0
+
+    def __fill(self) -> bool:
+        """Read next chunk in buffer, discarding the consumed part. Return False at EOF."""
+
+        data = self.__f.read(self.__chunk_size)
+        if not data:
+            return False
+        self.__buffer = self.__buffer[self.__pos :] + data
+        self.__pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip the whitespace and return the next character"""
+
+        while True:
+            self.__pos = _WHITESPACE.match(self.__buffer, self.__pos).end()
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if not self.__fill():
+                raise ValueError("Unexpected end of file")
+
+    def take(self, expected: str) -> str:
+        """Consume the next character, which must be one of the expected characters"""
+
+        char = self.peek()
+        if char not in expected:
+            raise ValueError(f"Expected one of {expected!r}, found {char!r}")
+        self.__pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.__buffer, self.__pos)
+            except json.JSONDecodeError:
+                if self.__fill():
+                    continue
+                raise
+
+            # A number ending with the buffer may continue in the next chunk
+            if end == len(self.__buffer) and self.__fill():
+                continue
+            self.__pos = end
+            return value
+
+
+def iter_rows(f: IO[str], chunk_size: int = CHUNK_SIZE) -> Iterator[tuple[str, Any]]:
+    """
+    Iterate over the rows of every array in the top level object of the file,
+    yielding the key of the array along with the row. Other values are skipped.
+    """
+
+    reader = _Reader(f, chunk_size)
+    reader.take("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        key = reader.value()
+        reader.take(":")
+        if reader.peek() == "[":
+            reader.take("[")
+            if reader.peek() == "]":
+                reader.take("]")
+            else:
+                while True:
+                    yield key, reader.value()
+                    if reader.take(",]") == "]":
+                        break
+        else:
+            reader.value()
+
+        if reader.take(",}") == "}":
+            return
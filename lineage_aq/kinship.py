@@ -0,0 +1,165 @@
+"""
+Coefficients of kinship and inbreeding over the father and mother relations.
+
+Kinship of two persons is the probability that alleles picked at random from both are
+identical by descent. Inbreeding of a person is the kinship of its parents.
+
+Both are computed with the method of Meuwissen and Luo (1992). The additive relationship
+matrix A (twice the kinship) is factored as A = L D L', where row i of L holds the
+contribution of each ancestor j of person i (1 for i itself, halved for each generation)
+and D is the diagonal of the Mendelian sampling variances
+```
+D[j] = 1/2 - (F[father] + F[mother]) / 4, with both parents
+D[j] = 3/4 - F[parent] / 4, with one parent
+D[j] = 1, with no parent
+```
+Then 1 + F[i] is the sum of L[i, j]² D[j] and kinship of i and k is half the sum of
+L[i, j] L[k, j] D[j]. Rows of L are sparse, having only the ancestors, so no matrix of
+the size of the lineage is ever stored.
+"""
+
+from __future__ import annotations
+from heapq import heappop, heappush
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from lineage_aq.lineage import Person
+
+
+_NO_PARENT = -1
+
+
+class Pedigree:
+    """
+    Persons with their ancestors, numbered such that parents come before children.
+    Raises ValueError if a person is an ancestor of itself.
+    """
+
+    def __init__(self, persons: Iterable[Person]) -> None:
+        self.persons: list[Person] = []
+        self.index: dict[Person, int] = {}
+        self.father: list[int] = []
+        self.mother: list[int] = []
+
+        # Iterative depth first search, a person is numbered after its parents. Persons
+        # whose parents are being numbered form the path, each a child of the next one.
+        # A person met again on the path is its own ancestor, and can't be numbered.
+        for person in persons:
+            if person in self.index:
+                continue
+            path: list[Person] = []
+            on_path: set[Person] = set()
+            stack = [(person, False)]
+            while stack:
+                p, parents_done = stack.pop()
+                if p in self.index:
+                    continue
+                if parents_done:
+                    path.pop()
+                    on_path.remove(p)
+                    self.__number(p)
+                    continue
+                if p in on_path:
+                    cycle = path[path.index(p) :]
+                    raise ValueError(
+                        "Persons are ancestors of themselves: "
+                        + ", ".join(f"{q.name} ({q.id})" for q in cycle)
+                    )
+                stack.append((p, True))
+                path.append(p)
+                on_path.add(p)
+                for parent in p.parents:
+                    if parent not in self.index:
+                        stack.append((parent, False))
+
+        self.__inbreeding: list[float] = []
+        self.__variance: list[float] = []
+
+    def __number(self, person: Person) -> None:
+        father = person.father
+        mother = person.mother
+        self.index[person] = len(self.persons)
+        self.persons.append(person)
+        self.father.append(_NO_PARENT if father is None else self.index[father])
+        self.mother.append(_NO_PARENT if mother is None else self.index[mother])
+
+    def _row(self, i: int) -> dict[int, float]:
+        """Nonzero entries of the row i of L"""
+
+        father = self.father
+        mother = self.mother
+        row = {i: 1.0}
+        # Ancestors are visited from the latest numbered, so that all the contributions
+        # to an ancestor are added before it passes them to its own parents
+        heap = [-i]
+        while heap:
+            j = -heappop(heap)
+            half = row[j] * 0.5
+            for parent in (father[j], mother[j]):
+                if parent == _NO_PARENT:
+                    continue
+                if parent in row:
+                    row[parent] += half
+                else:
+                    row[parent] = half
+                    heappush(heap, -parent)
+        return row
+
+    def inbreeding(self) -> list[float]:
+        """Inbreeding coefficient of every person, in the order of numbering"""
+
+        inbreeding = self.__inbreeding
+        variance = self.__variance
+        father = self.father
+        mother = self.mother
+        # Full siblings have the same coefficient
+        by_parents: dict[tuple[int, int], float] = {}
+
+        for i in range(len(inbreeding), len(self.persons)):
+            f = father[i]
+            m = mother[i]
+            if f != _NO_PARENT and m != _NO_PARENT:
+                variance.append(0.5 - 0.25 * (inbreeding[f] + inbreeding[m]))
+            elif f != _NO_PARENT or m != _NO_PARENT:
+                parent = f if f != _NO_PARENT else m
+                variance.append(0.75 - 0.25 * inbreeding[parent])
+            else:
+                variance.append(1.0)
+
+            if f == _NO_PARENT or m == _NO_PARENT:
+                # Kinship with an unknown parent is taken as zero
+                coefficient = 0.0
+            elif (f, m) in by_parents:
+                coefficient = by_parents[f, m]
+            else:
+                row = self._row(i)
+                coefficient = (
+                    sum(value * value * variance[j] for j, value in row.items()) - 1.0
+                )
+                by_parents[f, m] = coefficient
+            inbreeding.append(coefficient)
+
+        return inbreeding
+
+    def kinship(self, persons: list[Person]) -> list[list[float]]:
+        """Kinship coefficient of every pair of the persons, which must be numbered"""
+
+        self.inbreeding()
+        variance = self.__variance
+        rows = [self._row(self.index[person]) for person in persons]
+
+        matrix = [[0.0] * len(persons) for _ in persons]
+        for a, row_a in enumerate(rows):
+            for b in range(a, len(rows)):
+                row_b = rows[b]
+                if len(row_b) < len(row_a):
+                    small, large = row_b, row_a
+                else:
+                    small, large = row_a, row_b
+                total = 0.0
+                for j, value in small.items():
+                    other = large.get(j)
+                    if other is not None:
+                        total += value * other * variance[j]
+                matrix[a][b] = matrix[b][a] = 0.5 * total
+        return matrix
@@ -1,10 +1,18 @@
 from __future__ import annotations
 from collections import defaultdict
-import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import networkx
-from networkx import DiGraph
+from operator import attrgetter
+import re
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, NamedTuple
 from enum import Enum, auto
+from lineage_aq.json_stream import dump_rows, iter_rows
+from lineage_aq.kinship import Pedigree
+from lineage_aq.metadata import FileCounts, HashingWriter, write_metadata
+from lineage_aq.name_index import NameIndex, normalize
+
+if TYPE_CHECKING:
+    from lineage_aq.journal import Journal
 
 
 class InvalidRelationError(ValueError):
@@ -22,16 +30,137 @@ class Relation(Enum):
     def __repr__(self) -> str:
         return str(self)
 
+    # Members are singletons, identity hash is enough and much faster than hashing the name
+    __hash__ = object.__hash__
+
+
+class Line(Enum):
+    """Relatives to be followed while finding ancestors or descendants"""
+
+    # Through fathers only, like surname
+    PATERNAL = auto()
+    # Through mothers only
+    MATERNAL = auto()
+    # Through both parents
+    ALL = auto()
+
+    __hash__ = object.__hash__
+
+
+# Name of the list in _Graph holding the relation, and the list holding its reciprocal
+_RELATIVES_LIST = {
+    Relation.FATHER: "parents",
+    Relation.MOTHER: "parents",
+    Relation.SON: "children",
+    Relation.DAUGHTER: "children",
+    Relation.HUSBAND: "spouses",
+    Relation.WIFE: "spouses",
+}
+_RECIPROCAL_LIST = {"parents": "children", "children": "parents", "spouses": "spouses"}
+_MALE_RELATIONS = (Relation.FATHER, Relation.SON, Relation.HUSBAND)
+# Relation of a relative kept in the list, by gender of the relative
+_LIST_RELATIONS = {
+    "parents": {"m": Relation.FATHER, "f": Relation.MOTHER},
+    "children": {"m": Relation.SON, "f": Relation.DAUGHTER},
+    "spouses": {"m": Relation.HUSBAND, "f": Relation.WIFE},
+}
+# Relation of a person with the relative, by relation of relative and gender of person
+_RECIPROCAL_RELATION = {
+    relation: _LIST_RELATIONS[_RECIPROCAL_LIST[list_name]]
+    for relation, list_name in _RELATIVES_LIST.items()
+}
+# Relations through which persons share the blood, to be used as filter of the path
+BLOOD_RELATIONS = frozenset(
+    (Relation.FATHER, Relation.MOTHER, Relation.SON, Relation.DAUGHTER)
+)
+
+
+class ConsistencyIssue(NamedTuple):
+    """Problem found in the data of lineage"""
+
+    reason: str
+    id1: int | None = None
+    id2: int | None = None
+    relation: Relation | None = None
+
+
+class MergeReport(NamedTuple):
+    """Result of Lineage.merge"""
+
+    # Persons of the other lineage and the matching persons of this lineage
+    matched: dict[Person, Person]
+    # Persons added for the unmatched persons of the other lineage
+    added: list[Person]
+    # Relations of the other lineage which could not be merged, and persons which
+    # matched more than one person. IDs are of this lineage.
+    conflicts: list[ConsistencyIssue]
+
+
+class _Graph:
+    """
+    Compact storage of the persons and their relations.
+
+    Persons are kept in a list indexed by their slot, and relatives of each slot are
+    kept in three lists: parents (father first), children (sons first) and spouses.
+    Each side of a relation is stored once, and the relation is derived from the list
+    holding it and the gender of the relative. Empty lists are not kept (`None`).
+    """
+
+    __slots__ = ("persons", "parents", "children", "spouses")
+
+    def __init__(self) -> None:
+        self.persons: list[Person | None] = []
+        self.parents: list[list[Person] | None] = []
+        self.children: list[list[Person] | None] = []
+        self.spouses: list[list[Person] | None] = []
+
+    def add_node(self, person: Person) -> int:
+        """Add the person and return the slot assigned to it"""
+
+        self.persons.append(person)
+        self.parents.append(None)
+        self.children.append(None)
+        self.spouses.append(None)
+        return len(self.persons) - 1
+
+    def remove_node(self, slot: int) -> None:
+        self.persons[slot] = None
+        self.parents[slot] = None
+        self.children[slot] = None
+        self.spouses[slot] = None
+
+    def nodes(self) -> Iterator[Person]:
+        for person in self.persons:
+            if person is not None:
+                yield person
+
+
+_EMPTY = ()
+_gender = attrgetter("gender")
+
 
 class Person:
-    def __init__(self, digraph: DiGraph, id: int, name: str, gender: str) -> None:
+    __slots__ = ("__graph", "__slot", "__id", "__name", "__gender", "__lineage")
+
+    def __init__(
+        self,
+        graph: _Graph,
+        id: int,
+        name: str,
+        gender: str,
+        lineage: Lineage | None = None,
+    ) -> None:
         if gender not in ("m", "f"):
             raise ValueError("Gender should be either male(m) or female(f)")
-        self.__graph = digraph
+        self.__graph = graph
         self.__id = id
+        self.__lineage = None
         self.name = name
-        self.__gender = gender[0].lower()
-        self.__relatives_dict: dict[Relation, list[Person]] = defaultdict(list)
+        # Literal is used so that all persons share the same string object
+        self.__gender = "m" if gender == "m" else "f"
+        self.__slot = graph.add_node(self)
+        # Lineage is notified of the changes made after the creation only
+        self.__lineage = lineage
 
     @property
     def id(self) -> int:
@@ -44,59 +173,114 @@ class Person:
     @name.setter
     def name(self, name: str) -> None:
         self.__name = name.title()
+        if self.__lineage is not None:
+            self.__lineage._person_renamed(self)
 
     @property
     def gender(self) -> str:
         return self.__gender
 
+    # The lists returned by the following properties are the ones stored in the graph,
+    # when not empty. They must not be modified.
+
     @property
     def parents(self) -> list[Person]:
-        relatives = self.relatives_dict()
-        return [*relatives[Relation.FATHER], *relatives[Relation.MOTHER]]
+        return self.__graph.parents[self.__slot] or []
 
     @property
     def father(self) -> Person | None:
-        father_list = self.relatives_dict()[Relation.FATHER]
-        if father_list:
-            return father_list[0]
+        parents = self.__graph.parents[self.__slot]
+        if parents and parents[0].__gender == "m":
+            return parents[0]
         return None
 
     @property
     def mother(self) -> Person | None:
-        mother_list = self.relatives_dict()[Relation.MOTHER]
-        if mother_list:
-            return mother_list[0]
+        parents = self.__graph.parents[self.__slot]
+        if parents and parents[-1].__gender == "f":
+            return parents[-1]
         return None
 
     @property
     def children(self) -> list[Person]:
-        relatives = self.relatives_dict()
-        return [*relatives[Relation.SON], *relatives[Relation.DAUGHTER]]
+        return self.__graph.children[self.__slot] or []
 
     @property
     def sons(self) -> list[Person]:
-        return self.relatives_dict()[Relation.SON]
+        return [child for child in self.children if child.__gender == "m"]
 
     @property
     def daughters(self) -> list[Person]:
-        return self.relatives_dict()[Relation.DAUGHTER]
+        return [child for child in self.children if child.__gender == "f"]
 
     @property
     def husband(self) -> list[Person]:
-        return self.relatives_dict()[Relation.HUSBAND]
+        if self.__gender == "f":
+            return self.__graph.spouses[self.__slot] or []
+        return []
 
     @property
     def wife(self) -> list[Person]:
-        return self.relatives_dict()[Relation.WIFE]
+        if self.__gender == "m":
+            return self.__graph.spouses[self.__slot] or []
+        return []
 
     def relation_with(self, relative: Person) -> Relation | None:
-        try:
-            return self.__graph.edges[self, relative][Relation]
-        except KeyError:
-            return
+        graph = self.__graph
+        slot = self.__slot
+        male = relative.__gender == "m"
+
+        if relative in (graph.parents[slot] or _EMPTY):
+            return Relation.FATHER if male else Relation.MOTHER
+        if relative in (graph.children[slot] or _EMPTY):
+            return Relation.SON if male else Relation.DAUGHTER
+        if relative in (graph.spouses[slot] or _EMPTY):
+            return Relation.HUSBAND if male else Relation.WIFE
+        return None
 
     def relatives_dict(self) -> dict[Relation, list[Person]]:
-        return self.__relatives_dict
+        """Relatives grouped by their relation. Only the present relations are included."""
+
+        relatives = defaultdict(list)
+        for relative, relation in self._relatives():
+            relatives[relation].append(relative)
+        return relatives
+
+    def _relatives(self) -> Iterator[tuple[Person, Relation]]:
+        """Iterate over the relatives along with their relation"""
+
+        graph = self.__graph
+        slot = self.__slot
+        for relative in graph.parents[slot] or _EMPTY:
+            male = relative.__gender == "m"
+            yield relative, Relation.FATHER if male else Relation.MOTHER
+        for relative in graph.children[slot] or _EMPTY:
+            male = relative.__gender == "m"
+            yield relative, Relation.SON if male else Relation.DAUGHTER
+        for relative in graph.spouses[slot] or _EMPTY:
+            male = relative.__gender == "m"
+            yield relative, Relation.HUSBAND if male else Relation.WIFE
+
+    @property
+    def generation(self) -> int:
+        """
+        0 for a person without parents and one more than the latest parent otherwise,
+        i.e. the length of the longest chain of ancestors
+        """
+
+        if self.__lineage is not None:
+            return self.__lineage._generation_of(self)
+        parents = self.parents
+        return 1 + max(parent.generation for parent in parents) if parents else 0
+
+    @property
+    def _slot(self) -> int:
+        """Position of the person in the graph"""
+
+        return self.__slot
+
+    def __relatives_list(self, relation: Relation) -> list[list[Person] | None]:
+        return getattr(self.__graph, _RELATIVES_LIST[relation])
 
     def _add_relation(self, to: Person, relation: Relation) -> None:
         if self is to:
@@ -105,32 +289,53 @@ class Person:
             raise InvalidRelationError(
                 f"Relation is already present ({self.relation_with(to)})"
             )
-
-        self.__graph.add_edges_from([(self, to, {Relation: relation})])
-        self.__relatives_dict[relation].append(to)
+        if (to.__gender == "m") != (relation in _MALE_RELATIONS):
+            raise InvalidRelationError(f"Gender of {to} does not match {relation}")
+
+        # New list is created every time instead of appending, so that the list
+        # does not over-allocate
+        lists = self.__relatives_list(relation)
+        relatives = lists[self.__slot] or []
+        i = len(relatives)
+        if to.__gender == "m" and relation != Relation.HUSBAND:
+            # Father and sons are kept before mother and daughters
+            i = 0
+            while i < len(relatives) and relatives[i].__gender == "m":
+                i += 1
+        lists[self.__slot] = relatives[:i] + [to] + relatives[i:]
+        if self.__lineage is not None:
+            self.__lineage._relation_added(self, to, relation)
+
+    def _remove_from_one_side(self, relative: Person) -> None:
+        relation = self.relation_with(relative)
+        if relation is None:
+            raise InvalidRelationError("Relation not present")
+
+        lists = self.__relatives_list(relation)
+        relatives = lists[self.__slot]
+        relatives.remove(relative)
+        if not relatives:
+            lists[self.__slot] = None
+        if self.__lineage is not None:
+            self.__lineage._relation_removed(self, relative, relation)
 
     def remove_relative(self, relative: Person) -> None:
-        def remove_from_one_side(person1: Person, person2: Person):
-            relation: Relation = person1.relation_with(person2)
-            if relation is not None:
-                person1.__relatives_dict[relation].remove(person2)
-                person1.__graph.remove_edge(person1, person2)
-            else:
-                raise InvalidRelationError("Relation not present")
-
-        remove_from_one_side(self, relative)
-        remove_from_one_side(relative, self)
+        self._remove_from_one_side(relative)
+        relative._remove_from_one_side(self)
 
     def self_remove(self):
         person = self
 
-        # Removing this person from relatives' reltives_dict
+        # Removing this person from relatives' lists
         # This can be done using self.remove_relative(relative), but it removes from both sides, which is not required here, since the person object will be deleted
-        for _, relatives in person.relatives_dict().items():
-            for relative in relatives:
-                relative.__relatives_dict[relative.relation_with(person)].remove(person)
+        for relative, _ in list(person._relatives()):
+            # Relation can be one-sided
+            if relative.relation_with(person) is not None:
+                relative._remove_from_one_side(person)
 
-        person.__graph.remove_node(person)
+        person.__graph.remove_node(person.__slot)
+        if person.__lineage is not None:
+            person.__lineage._person_removed(person)
 
     @staticmethod
     def __validate_is_Person_object(x):
@@ -148,10 +353,11 @@ class Person:
                 f"Relation is already present ({self.relation_with(child)})"
             )
 
-        if len(child.relatives_dict()[parent_rel]) >= 1:
-            raise InvalidRelationError("Can't have multiple father or mother values")
-
         if parent_rel == Relation.FATHER:
+            if child.father is not None:
+                raise InvalidRelationError(
+                    "Can't have multiple father or mother values"
+                )
             if (
                 child.mother is not None
                 and self.relation_with(child.mother) != Relation.WIFE
@@ -160,6 +366,10 @@ class Person:
                     f"{self} and {child.mother} are not spouse. {child.mother} is mother of {child}"
                 )
         else:
+            if child.mother is not None:
+                raise InvalidRelationError(
+                    "Can't have multiple father or mother values"
+                )
             if (
                 child.father is not None
                 and self.relation_with(child.father) != Relation.HUSBAND
@@ -194,107 +404,1319 @@ class Person:
         return f"P{self.id}({self.name})"
 
 
+def _walk(person, up: bool, line: Line) -> Iterator[tuple[Person, int]]:
+    """
+    Breadth first walk over the ancestors (`up`) or descendants of the person, yielding
+    each relative once along with its smallest distance in generations from the person.
+
+    Paternal ancestors are the father, his father and so on. Paternal descendants are the
+    inverse of it, i.e. children of the person and of the paternal descendants, if male.
+    """
+
+    seen = {person}
+    frontier = [person]
+    depth = 0
+    while frontier:
+        depth += 1
+        next_frontier = []
+        for p in frontier:
+            if up:
+                if line is Line.ALL:
+                    relatives = p.parents
+                else:
+                    relative = p.father if line is Line.PATERNAL else p.mother
+                    relatives = (relative,) if relative is not None else _EMPTY
+            elif line is Line.ALL or p.gender == (
+                "m" if line is Line.PATERNAL else "f"
+            ):
+                relatives = p.children
+            else:
+                relatives = _EMPTY
+
+            for relative in relatives:
+                if relative not in seen:
+                    seen.add(relative)
+                    next_frontier.append(relative)
+                    yield relative, depth
+        frontier = next_frontier
+
+
+def _layering(persons: Iterable[Person]) -> dict[Person, int]:
+    """
+    Generation of each person, 0 for a person without parents and one more than the
+    latest parent otherwise, i.e. the length of the longest chain of ancestors.
+    A cycle of parent relations, if any, is broken at its person with the earliest
+    generation, whose parents in the cycle are ignored.
+    """
+
+    persons = list(persons)
+    generations = {}
+    num_parents = {}
+    frontier = []
+    for person in persons:
+        n = len(person.parents)
+        num_parents[person] = n
+        generations[person] = 0
+        if n == 0:
+            frontier.append(person)
+
+    layering = {}
+    while len(layering) < len(persons):
+        if not frontier:
+            # Rest of the persons are in cycles or descend from a cycle
+            person = min(
+                (p for p in persons if p not in layering),
+                key=lambda p: (generations[p], p.id),
+            )
+            num_parents[person] = 0
+            frontier = [person]
+
+        next_frontier = []
+        for person in frontier:
+            layering[person] = generation = generations[person]
+            for child in person.children:
+                if child in layering:
+                    continue
+                if generations[child] <= generation:
+                    generations[child] = generation + 1
+                num_parents[child] -= 1
+                if num_parents[child] == 0:
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return layering
+
+
+def _within_depth(
+    closure: Iterable[tuple[Person, int]], depth: int | None
+) -> Iterator[Person]:
+    for relative, d in closure:
+        # Walk is breadth first, so no further relative can be within depth
+        if depth is not None and d > depth:
+            return
+        yield relative
+
+
+def _hop_filter(
+    relations: Iterable[Relation] | None, line: Line
+) -> Callable[[Person, Person, Relation], bool] | None:
+    """
+    Function telling whether the path can go from a person to its relative having the
+    given relation with it. None if every hop is allowed.
+    """
+
+    if relations is None and line is Line.ALL:
+        return None
+    if relations is not None:
+        relations = frozenset(relations)
+    parent_gender = "m" if line is Line.PATERNAL else "f"
+
+    def allowed(person: Person, relative: Person, relation: Relation) -> bool:
+        if relations is not None and relation not in relations:
+            return False
+        if line is not Line.ALL:
+            list_name = _RELATIVES_LIST[relation]
+            if list_name == "parents":
+                return relative.gender == parent_gender
+            if list_name == "children":
+                return person.gender == parent_gender
+        return True
+
+    return allowed
+
+
+def _labeled(
+    meet: Person,
+    forward: dict[Person, tuple[Person, Relation] | None],
+    backward: dict[Person, tuple[Person, Relation] | None],
+) -> list[tuple[Person, Relation | None]]:
+    """
+    Join the paths found by searches from both ends through the person where they met.
+    Each entry of the searches is the previous person and relation of the entry with it.
+    """
+
+    path = []
+    person = meet
+    while forward[person] is not None:
+        previous, relation = forward[person]
+        path.append((person, relation))
+        person = previous
+    path.append((person, None))
+    path.reverse()
+
+    person = meet
+    while backward[person] is not None:
+        previous, relation = backward[person]
+        # Backward search has gone from the previous person to this one
+        path.append((previous, _RECIPROCAL_RELATION[relation][previous.gender]))
+        person = previous
+    return path
+
+
+def _shortest_paths(
+    pairs: Iterable[tuple[Person, Person]],
+    relations: Iterable[Relation] | None,
+    line: Line,
+) -> list[list[tuple[Person, Relation | None]] | None]:
+    """Shortest paths for each pair of start and stop, see Lineage.shortest_paths"""
+
+    allowed = _hop_filter(relations, line)
+    pairs = list(pairs)
+    stops_of_start: dict[Person, set[Person]] = defaultdict(set)
+    for start, stop in pairs:
+        stops_of_start[start].add(stop)
+
+    paths: dict[tuple[Person, Person], list | None] = {}
+    for start, stops in stops_of_start.items():
+        if len(stops) == 1:
+            stop = next(iter(stops))
+            paths[start, stop] = _bidirectional_path(start, stop, allowed)
+            continue
+
+        forward = _search(start, stops, allowed)
+        for stop in stops:
+            paths[start, stop] = (
+                _labeled(stop, forward, {stop: None}) if stop in forward else None
+            )
+
+    return [paths[pair] for pair in pairs]
+
+
+def _search(
+    start: Person,
+    stops: set[Person],
+    allowed: Callable[[Person, Person, Relation], bool] | None,
+) -> dict[Person, tuple[Person, Relation] | None]:
+    """
+    Breadth first search from start until all the stops are reached.
+    Return the previous person and relation of each reached person.
+    """
+
+    previous: dict[Person, tuple[Person, Relation] | None] = {start: None}
+    remaining = set(stops)
+    remaining.discard(start)
+    frontier = [start]
+    while frontier and remaining:
+        next_frontier = []
+        for person in frontier:
+            for relative, relation in person._relatives():
+                if relative in previous:
+                    continue
+                if allowed is not None and not allowed(person, relative, relation):
+                    continue
+                previous[relative] = (person, relation)
+                next_frontier.append(relative)
+                remaining.discard(relative)
+        frontier = next_frontier
+    return previous
+
+
+def _bidirectional_path(
+    start: Person,
+    stop: Person,
+    allowed: Callable[[Person, Person, Relation], bool] | None,
+) -> list[tuple[Person, Relation | None]] | None:
+    """
+    Breadth first search from both ends, expanding the smaller frontier by a level
+    at a time, until the searches meet
+    """
+
+    forward: dict[Person, tuple[Person, Relation] | None] = {start: None}
+    backward: dict[Person, tuple[Person, Relation] | None] = {stop: None}
+    if start == stop:
+        return [(start, None)]
+
+    forward_frontier = [start]
+    backward_frontier = [stop]
+    while forward_frontier and backward_frontier:
+        is_forward = len(forward_frontier) <= len(backward_frontier)
+        if is_forward:
+            frontier, visited, other = forward_frontier, forward, backward
+        else:
+            frontier, visited, other = backward_frontier, backward, forward
+
+        next_frontier = []
+        for person in frontier:
+            for relative, relation in person._relatives():
+                if relative in visited:
+                    continue
+                if allowed is not None and not (
+                    allowed(person, relative, relation)
+                    if is_forward
+                    # Path goes from relative to person
+                    else allowed(
+                        relative,
+                        person,
+                        _RECIPROCAL_RELATION[relation][person.gender],
+                    )
+                ):
+                    continue
+
+                visited[relative] = (person, relation)
+                # First meeting is on a shortest path, since all the persons seen by
+                # the other search before its last level have been expanded already
+                if relative in other:
+                    return _labeled(relative, forward, backward)
+                next_frontier.append(relative)
+
+        if is_forward:
+            forward_frontier = next_frontier
+        else:
+            backward_frontier = next_frontier
+
+    return None
+
+
+# Persons checked by a worker process at a time while validating in parallel
+VALIDATION_CHUNK = 20000
+# Tables of the lineage being validated, set in each worker process
+_tables = None
+
+
+def _check_persons(tables: tuple, start: int, stop: int) -> list[ConsistencyIssue]:
+    """
+    Check the relatives of the persons numbered from start to stop. Tables hold the ids,
+    the genders and the lists of parents, children and spouses of all the persons,
+    referring to each other by number.
+    """
+
+    ids, genders, parents, children, spouses = tables
+    lists = {"parents": parents, "children": children, "spouses": spouses}
+    issues = []
+
+    def issue(reason: str, i: int, j: int, list_name: str) -> None:
+        relation = _LIST_RELATIONS[list_name][genders[j]]
+        issues.append(ConsistencyIssue(reason, ids[i], ids[j], relation))
+
+    for i in range(start, stop):
+        seen = set()
+        for list_name, relatives_of in lists.items():
+            reciprocal_of = lists[_RECIPROCAL_LIST[list_name]]
+            for j in relatives_of[i] or _EMPTY:
+                if j == i:
+                    issue("Can't be related to self", i, j, list_name)
+                elif j in seen:
+                    issue("Relation is already present", i, j, list_name)
+                elif i not in (reciprocal_of[j] or _EMPTY):
+                    issue("Reciprocal relation is not present", i, j, list_name)
+                elif list_name == "spouses" and genders[i] == genders[j]:
+                    issue("Gender is same", i, j, list_name)
+                seen.add(j)
+
+        father = mother = None
+        for j in parents[i] or _EMPTY:
+            if genders[j] == "m" and father is None:
+                father = j
+            elif genders[j] == "f" and mother is None:
+                mother = j
+            else:
+                issue("Can't have multiple father or mother values", i, j, "parents")
+        if (
+            father is not None
+            and mother is not None
+            and mother not in (spouses[father] or _EMPTY)
+        ):
+            issues.append(
+                ConsistencyIssue(
+                    "Father and mother are not spouse",
+                    ids[father],
+                    ids[mother],
+                    Relation.WIFE,
+                )
+            )
+
+    return issues
+
+
+def _init_worker(tables: tuple) -> None:
+    global _tables
+    _tables = tables
+
+
+def _check_chunk(bounds: tuple[int, int]) -> list[ConsistencyIssue]:
+    return _check_persons(_tables, *bounds)
+
+
+def _cycles(parents: list[list[int] | None]) -> list[list[int]]:
+    """
+    Groups of persons which are their own ancestors through the parent relations.
+    Strongly connected components are found by Tarjan's algorithm, done iteratively.
+    """
+
+    n = len(parents)
+    order = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    counter = 0
+    cycles = []
+
+    for root in range(n):
+        if order[root] != -1:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, edge = work.pop()
+            if edge == 0:
+                order[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+
+            relatives = parents[v] or _EMPTY
+            if edge < len(relatives):
+                work.append((v, edge + 1))
+                w = relatives[edge]
+                if order[w] == -1:
+                    work.append((w, 0))
+                elif on_stack[w]:
+                    low[v] = min(low[v], order[w])
+                continue
+
+            if low[v] == order[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                if len(component) > 1 or v in (parents[v] or _EMPTY):
+                    cycles.append(component)
+            if work:
+                u = work[-1][0]
+                low[u] = min(low[u], low[v])
+
+    return cycles
+
+
+def _nearest_common_ancestors(
+    depths1: dict[Person, int], depths2: dict[Person, int]
+) -> list[Person]:
+    """
+    Nearest common ancestors (see Lineage.common_ancestors) of two persons, given the
+    generations of their ancestors from them, including themselves at 0
+    """
+
+    if len(depths1) > len(depths2):
+        depths1, depths2 = depths2, depths1
+    common = {p for p in depths1 if p in depths2}
+
+    # Child of a common ancestor on the way down to a nearer one is common as well, so
+    # the nearest are those with none of their children common
+    nearest = [p for p in common if not any(c in common for c in p.children)]
+    return sorted(nearest, key=lambda p: (depths1[p] + depths2[p], p.id))
+
+
+def _relationship(person: Person, relative: Person, up: int, down: int) -> str:
+    """
+    Name of the kinship of relative with the person (see Lineage.relationship), given
+    the generations from both up to their nearest common ancestor
+    """
+
+    male = relative.gender == "m"
+
+    def greats(n: int) -> str:
+        return "great-" * n
+
+    if up == 0:
+        word = "son" if male else "daughter"
+        return word if down == 1 else greats(down - 2) + "grand" + word
+    if down == 0:
+        word = "father" if male else "mother"
+        return word if up == 1 else greats(up - 2) + "grand" + word
+    if up == 1 and down == 1:
+        word = "brother" if male else "sister"
+        # Half sibling shares only one of the two known parents
+        parents = person.parents
+        shared = set(parents).intersection(relative.parents)
+        if len(parents) == len(relative.parents) == 2 and len(shared) == 1:
+            return "half-" + word
+        return word
+    if up == 1:
+        word = "nephew" if male else "niece"
+        return greats(down - 2) + word
+    if down == 1:
+        word = "uncle" if male else "aunt"
+        return greats(up - 2) + word
+
+    degree = min(up, down) - 1
+    removed = abs(up - down)
+    name = f"{_ordinal(degree)} cousin"
+    if removed:
+        name += " " + _times(removed) + " removed"
+    return name
+
+
+def _ordinal(n: int) -> str:
+    words = "first second third fourth fifth sixth seventh eighth".split()
+    if n <= len(words):
+        return words[n - 1]
+    if 10 <= n % 100 <= 20:
+        suffix = "th"
+    else:
+        suffix = {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+def _times(n: int) -> str:
+    return {1: "once", 2: "twice", 3: "thrice"}.get(n, f"{n} times")
+
+
 class Lineage:
     def __init__(self) -> None:
-        self._graph = DiGraph()
+        self._graph = _Graph()
         self.__counter = -1
+        self.__persons_by_id: dict[int, Person] = {}
+        self.__name_index = NameIndex()
+        # Indexes of names attached from outside, see attach_index
+        self.__indexes: list = [self.__name_index]
+        self.__journal: Journal | None = None
+        # Cached closures of (up, line), see _walk. Closure maps relative to depth.
+        self.__closures: dict[tuple[bool, Line], dict[Person, dict[Person, int]]] = {
+            (up, line): {} for up in (True, False) for line in Line
+        }
+        # Generation of each person (see _layering) and persons of each generation
+        self.__generations: dict[Person, int] = {}
+        self.__layers: dict[int, set[Person]] = defaultdict(set)
+        self.__revision = 0
+
+    @property
+    def revision(self) -> int:
+        """
+        Incremented on every change of the persons or relations, so the results derived
+        from the lineage can be cached along with the revision they were computed at
+        """
+
+        return self.__revision
 
     def __new_id(self) -> int:
         self.__counter += 1
         return self.__counter
 
-    # TODO Add id in graph node and person in node's attribute for faster search by id
     def add_person(self, name: str, gender: str) -> Person:
-        person = Person(self._graph, self.__new_id(), name, gender)
-        self._graph.add_node(person)
+        return self._add_person(self.__new_id(), name, gender)
+
+    def _add_person(self, id: int, name: str, gender: str) -> Person:
+        """Add person with the given id. Used while restoring the saved lineage."""
+
+        if id in self.__persons_by_id:
+            raise ValueError(f"ID {id} is already present")
+
+        person = Person(self._graph, id, name, gender, self)
+        self.__counter = max(self.__counter, id)
+        self.__persons_by_id[person.id] = person
+        for index in self.__indexes:
+            index.add(person)
+        self.__generations[person] = 0
+        self.__layers[0].add(person)
+        self.__revision += 1
+        if self.__journal is not None:
+            self.__journal.record("person", person.id, person.name, person.gender)
 
         return person
 
     def remove_person(self, person: Person) -> None:
         person.self_remove()
 
+    def bulk_add_persons(
+        self, ids: Iterable[int], names: Iterable[str], genders: Iterable[str]
+    ) -> list[ConsistencyIssue]:
+        """
+        Add the persons given column-wise, keeping their IDs.
+        Return the issues due to which persons are not added.
+        """
+
+        issues = []
+        for id, name, gender in zip(ids, names, genders):
+            try:
+                self._add_person(id, name, gender)
+            except (ValueError, TypeError, AttributeError) as e:
+                issues.append(ConsistencyIssue(str(e), id))
+        return issues
+
+    def bulk_add_relations(
+        self,
+        ids1: Iterable[int],
+        ids2: Iterable[int],
+        relations: Iterable[Relation | str],
+    ) -> list[ConsistencyIssue]:
+        """
+        Add the relations given column-wise, where relative with ids2 is `relation` of person
+        with ids1. Both sides of a relation must be present, either in the given rows or in
+        the lineage.
+
+        Rows are not validated one by one through `Person._add_relation`. Rows are grouped
+        per person, the groups are checked together for duplicate relations, single father
+        and mother and reciprocal relation, and then inserted at once.
+        Return the issues due to which rows are not added.
+        """
+
+        issues = []
+        get_person = self.__persons_by_id.get
+        graph = self._graph
+        # Relations already present are looked up only if there is any
+        has_relations = any(graph.parents) or any(graph.children) or any(graph.spouses)
+
+        # New relatives of each person, for each list of the graph
+        new: dict[str, dict[Person, list[Person]]] = {
+            "parents": {},
+            "children": {},
+            "spouses": {},
+        }
+        for id1, id2, relation in zip(ids1, ids2, relations):
+            try:
+                if not isinstance(relation, Relation):
+                    relation = Relation[relation]
+            except KeyError:
+                issues.append(ConsistencyIssue("Unknown relation", id1, id2))
+                continue
+
+            p1 = get_person(id1)
+            p2 = get_person(id2)
+            if p1 is None or p2 is None:
+                reason = "ID is not present"
+            elif p1 is p2:
+                reason = "Can't be related to self"
+            elif (p2.gender == "m") != (relation in _MALE_RELATIONS) or (
+                # Reciprocal of WIFE is HUSBAND, so spouses are of the other gender
+                _RELATIVES_LIST[relation] == "spouses" and p1.gender == p2.gender
+            ):
+                reason = "Gender does not match the relation"
+            elif has_relations and p1.relation_with(p2) is not None:
+                reason = "Relation is already present"
+            else:
+                group = new[_RELATIVES_LIST[relation]]
+                relatives = group.get(p1)
+                if relatives is None:
+                    group[p1] = [p2]
+                    continue
+                if p2 not in relatives:
+                    relatives.append(p2)
+                    continue
+                reason = "Relation is already present"
+
+            issues.append(ConsistencyIssue(reason, id1, id2, relation))
+
+        def issue(reason: str, p1: Person, p2: Person, list_name: str):
+            relation = _LIST_RELATIONS[list_name][p2.gender]
+            issues.append(ConsistencyIssue(reason, p1.id, p2.id, relation))
+
+        # Single father and mother
+        for child, parents in new["parents"].items():
+            father = child.father if has_relations else None
+            mother = child.mother if has_relations else None
+            kept = []
+            for parent in parents:
+                if parent.gender == "m" and father is None:
+                    father = parent
+                elif parent.gender == "f" and mother is None:
+                    mother = parent
+                else:
+                    issue(
+                        "Can't have multiple father or mother values",
+                        child,
+                        parent,
+                        "parents",
+                    )
+                    continue
+                kept.append(parent)
+            new["parents"][child] = kept
+
+        # Same pair in two lists
+        accepted: dict[str, dict[Person, list[Person]]] = {}
+        for list_name, group in new.items():
+            other1, other2 = [new[name] for name in new if name != list_name]
+            accepted[list_name] = {}
+            for p1, relatives in group.items():
+                kept = []
+                for p2 in relatives:
+                    if p2 in other1.get(p1, _EMPTY) or p2 in other2.get(p1, _EMPTY):
+                        issue("Relation is already present", p1, p2, list_name)
+                    else:
+                        kept.append(p2)
+                accepted[list_name][p1] = kept
+
+        # Reciprocal relation in the accepted rows or in lineage. Rejecting a row rejects
+        # its reciprocal row too, so the rows are checked again until none is rejected.
+        changed = True
+        while changed:
+            changed = False
+            for list_name, group in accepted.items():
+                reciprocal_name = _RECIPROCAL_LIST[list_name]
+                reciprocal_group = accepted[reciprocal_name]
+                reciprocal_lists = getattr(graph, reciprocal_name)
+                for p1, relatives in group.items():
+                    kept = []
+                    for p2 in relatives:
+                        if p1 in reciprocal_group.get(p2, _EMPTY) or (
+                            has_relations
+                            and p1 in (reciprocal_lists[p2._slot] or _EMPTY)
+                        ):
+                            kept.append(p2)
+                        else:
+                            issue(
+                                "Reciprocal relation is not present", p1, p2, list_name
+                            )
+                    if len(kept) != len(relatives):
+                        group[p1] = kept
+                        changed = True
+
+        for list_name, group in accepted.items():
+            lists = getattr(graph, list_name)
+            for person, relatives in group.items():
+                if not relatives:
+                    continue
+                relatives = (lists[person._slot] or []) + relatives
+                if list_name != "spouses" and len(relatives) > 1:
+                    # Males are kept first, sort is stable even when reversed
+                    relatives.sort(key=_gender, reverse=True)
+                lists[person._slot] = relatives
+
+        # Instead of notifying through _relation_added row by row, the derived indexes
+        # are rebuilt at once
+        if any(accepted.values()):
+            self.__revision += 1
+        if accepted["parents"]:
+            for cache in self.__closures.values():
+                cache.clear()
+            self.__relayer()
+
+        if self.__journal is not None:
+            for list_name, group in accepted.items():
+                relations = _LIST_RELATIONS[list_name]
+                for p1, relatives in group.items():
+                    for p2 in relatives:
+                        self.__journal.record(
+                            "rel", p1.id, p2.id, relations[p2.gender].name
+                        )
+
+        return issues
+
+    def merge(
+        self, other: Lineage, name_key: Callable[[str], str] = normalize
+    ) -> MergeReport:
+        """
+        Add the persons and relations of the other lineage, which may describe some of
+        the same families. Persons of other are matched with the persons of this lineage
+        having the same gender and name key, i.e. blocking, and among those with the most
+        names in common among their parents, spouses and children. A person is matched
+        only if there is a single best match or the name is unique in both lineages.
+        Persons with more than one best match, like siblings named same, are matched
+        through their matched parent, by their order among its children of that name.
+        Unmatched persons are added as new persons, and then the relations are added.
+
+        Parameters
+        ----------
+        other: Lineage
+        name_key: Callable[[str], str]
+            same for the names which should be taken as same, like
+            search.canonical_form applied on normalized name
+        """
+
+        def signature(person: Person) -> set[str]:
+            return {name_key(relative.name) for relative, _ in person._relatives()}
+
+        blocks: dict[tuple[str, str], list[Person]] = defaultdict(list)
+        for person in self.__persons_by_id.values():
+            blocks[name_key(person.name), person.gender].append(person)
+        other_blocks: dict[tuple[str, str], list[Person]] = defaultdict(list)
+        for person in other.all_persons():
+            other_blocks[name_key(person.name), person.gender].append(person)
+
+        conflicts = []
+        ambiguous = []
+        # Candidate pairs, unique names first and then from the highest score
+        scored = []
+        for key, others in other_blocks.items():
+            candidates = blocks.get(key)
+            if not candidates:
+                continue
+            if len(candidates) == 1 and len(others) == 1:
+                scored.append((0, 0, others[0].id, others[0], candidates[0]))
+                continue
+
+            signatures = [signature(candidate) for candidate in candidates]
+            for person in others:
+                person_signature = signature(person)
+                scores = [len(person_signature & s) for s in signatures]
+                best = max(scores)
+                if best == 0:
+                    continue
+                if scores.count(best) > 1:
+                    ambiguous.append(person)
+                    continue
+                candidate = candidates[scores.index(best)]
+                scored.append((1, -best, person.id, person, candidate))
+
+        scored.sort(key=lambda x: x[:3])
+        matched: dict[Person, Person] = {}
+        taken = set()
+        for _, _, _, person, candidate in scored:
+            if person not in matched and candidate not in taken:
+                matched[person] = candidate
+                taken.add(candidate)
+
+        def named_children(parent: Person, key: tuple[str, str]) -> list[Person]:
+            children = [
+                child
+                for child in parent.children
+                if (name_key(child.name), child.gender) == key
+            ]
+            return sorted(children, key=lambda person: person.id)
+
+        # Matching a person may match its children named same, so repeat until none
+        ambiguous.sort(key=lambda person: person.id)
+        progress = True
+        while ambiguous and progress:
+            progress = False
+            unresolved = []
+            for person in ambiguous:
+                key = name_key(person.name), person.gender
+                candidate = None
+                for parent in person.parents:
+                    match = matched.get(parent)
+                    if match is None:
+                        continue
+                    siblings = [
+                        p for p in named_children(parent, key) if p not in matched
+                    ]
+                    candidates = [
+                        p for p in named_children(match, key) if p not in taken
+                    ]
+                    if len(siblings) == len(candidates):
+                        candidate = candidates[siblings.index(person)]
+                    break
+                if candidate is None:
+                    unresolved.append(person)
+                    continue
+                matched[person] = candidate
+                taken.add(candidate)
+                progress = True
+            ambiguous = unresolved
+
+        added = []
+        mapping = dict(matched)
+        for person in sorted(other.all_persons(), key=lambda person: person.id):
+            if person not in mapping:
+                mapping[person] = new = self.add_person(person.name, person.gender)
+                added.append(new)
+        for person in ambiguous:
+            conflicts.append(
+                ConsistencyIssue(
+                    "Matches more than one person, added as new person",
+                    mapping[person].id,
+                )
+            )
+
+        ids1, ids2, relations = [], [], []
+        for p1, p2, relation in other.all_relations():
+            m1 = mapping[p1]
+            m2 = mapping[p2]
+            present = m1.relation_with(m2)
+            if present is None:
+                ids1.append(m1.id)
+                ids2.append(m2.id)
+                relations.append(relation)
+            elif present is not relation:
+                conflicts.append(
+                    ConsistencyIssue(
+                        f"Relation is already present ({present})",
+                        m1.id,
+                        m2.id,
+                        relation,
+                    )
+                )
+        conflicts += self.bulk_add_relations(ids1, ids2, relations)
+
+        return MergeReport(matched, added, conflicts)
+
+    def attach_journal(self, journal: Journal | None) -> None:
+        """Record all the further changes in the journal. `None` stops the recording."""
+
+        self.__journal = journal
+
+    def attach_index(self, index) -> None:
+        """
+        Keep the index updated with the persons of lineage. Index is an object like
+        NameIndex, having add, remove and update methods taking the person.
+        """
+
+        for person in self.__persons_by_id.values():
+            index.add(person)
+        self.__indexes.append(index)
+
+    def detach_index(self, index) -> None:
+        self.__indexes.remove(index)
+
+    def _person_renamed(self, person: Person) -> None:
+        self.__revision += 1
+        for index in self.__indexes:
+            index.update(person)
+        if self.__journal is not None:
+            self.__journal.record("name", person.id, person.name)
+
+    def _person_removed(self, person: Person) -> None:
+        self.__revision += 1
+        self.__persons_by_id.pop(person.id, None)
+        for index in self.__indexes:
+            index.remove(person)
+        generation = self.__generations.pop(person, None)
+        if generation is not None:
+            self.__discard_from_layer(person, generation)
+        # One-sided relations of the person are not removed through _relation_removed
+        for cache in self.__closures.values():
+            stale = [
+                p for p, closure in cache.items() if p is person or person in closure
+            ]
+            for p in stale:
+                del cache[p]
+        if self.__journal is not None:
+            self.__journal.record("rmperson", person.id)
+
+    def _relation_added(
+        self, person: Person, relative: Person, relation: Relation
+    ) -> None:
+        # Change is recorded before updating the derived indexes, so that the journal
+        # has it even if updating them fails
+        if self.__journal is not None:
+            self.__journal.record("rel", person.id, relative.id, relation.name)
+        self.__revision += 1
+        self.__invalidate_closures(person, relative, relation)
+        self.__settle_generation(person, relative, relation)
+
+    def _relation_removed(
+        self, person: Person, relative: Person, relation: Relation
+    ) -> None:
+        if self.__journal is not None:
+            self.__journal.record("unrel", person.id, relative.id)
+        self.__revision += 1
+        self.__invalidate_closures(person, relative, relation)
+        self.__settle_generation(person, relative, relation)
+
+    def __invalidate_closures(
+        self, person: Person, relative: Person, relation: Relation
+    ) -> None:
+        """Drop the cached closures which the change in the relation can affect"""
+
+        list_name = _RELATIVES_LIST[relation]
+        if list_name == "spouses":
+            return
+        if list_name == "parents":
+            parent, child = relative, person
+        else:
+            parent, child = person, relative
+
+        for (up, line), cache in self.__closures.items():
+            if not cache:
+                continue
+            if line is not Line.ALL and parent.gender != (
+                "m" if line is Line.PATERNAL else "f"
+            ):
+                continue
+
+            # Ancestors change for the child and its descendants,
+            # descendants change for the parent and its ancestors
+            changed = child if up else parent
+            stale = [
+                p for p, closure in cache.items() if p is changed or changed in closure
+            ]
+            for p in stale:
+                del cache[p]
+
+    def __discard_from_layer(self, person: Person, generation: int) -> None:
+        layer = self.__layers[generation]
+        layer.discard(person)
+        if not layer:
+            del self.__layers[generation]
+
+    def __relayer(self) -> None:
+        self.__generations = _layering(self.__persons_by_id.values())
+        self.__layers.clear()
+        for person, generation in self.__generations.items():
+            self.__layers[generation].add(person)
+
+    def __settle_generation(
+        self, person: Person, relative: Person, relation: Relation
+    ) -> None:
+        """Update the generation of the child of the changed relation and its descendants"""
+
+        list_name = _RELATIVES_LIST[relation]
+        if list_name == "spouses":
+            return
+        child = person if list_name == "parents" else relative
+
+        generations = self.__generations
+        # Generation can't exceed the number of persons, unless parents form a cycle
+        limit = len(generations)
+        stack = [child]
+        while stack:
+            p = stack.pop()
+            old = generations.get(p)
+            if old is None:
+                continue
+            parents = p.parents
+            new = (
+                1 + max(generations.get(parent, 0) for parent in parents)
+                if parents
+                else 0
+            )
+            if new == old or new > limit:
+                continue
+            generations[p] = new
+            self.__discard_from_layer(p, old)
+            self.__layers[new].add(p)
+            stack.extend(p.children)
+
+    def generation(self, n: int) -> list[Person]:
+        """Persons of the generation n (see Person.generation), sorted by id"""
+
+        return sorted(self.__layers.get(n, _EMPTY), key=lambda person: person.id)
+
+    def _generation_of(self, person: Person) -> int:
+        return self.__generations[person]
+
+    def __closure(self, person: Person, up: bool, line: Line) -> dict[Person, int]:
+        cache = self.__closures[up, line]
+        closure = cache.get(person)
+        if closure is None:
+            closure = cache[person] = dict(_walk(person, up, line))
+        return closure
+
+    def ancestors(
+        self,
+        person: Person,
+        depth: int | None = None,
+        line: Line = Line.ALL,
+        lazy: bool = False,
+    ) -> list[Person] | Iterator[Person]:
+        """
+        Ancestors of the person, nearest first
+
+        Parameters
+        ----------
+        person: Person
+        depth: int | None
+            number of generations to go up, all if None
+        line: Line
+            parents to be followed
+        lazy: bool
+            return a generator which walks only as far as it is consumed.
+            It is not cached, unless the closure is already cached.
+        """
+
+        return self.__relatives_within(person, True, depth, line, lazy)
+
+    def descendants(
+        self,
+        person: Person,
+        depth: int | None = None,
+        line: Line = Line.ALL,
+        lazy: bool = False,
+    ) -> list[Person] | Iterator[Person]:
+        """Descendants of the person, nearest first. Parameters are same as `ancestors`."""
+
+        return self.__relatives_within(person, False, depth, line, lazy)
+
+    def __relatives_within(
+        self, person: Person, up: bool, depth: int | None, line: Line, lazy: bool
+    ) -> list[Person] | Iterator[Person]:
+        closure = self.__closures[up, line].get(person)
+        if lazy:
+            if closure is None:
+                return _within_depth(_walk(person, up, line), depth)
+            return _within_depth(closure.items(), depth)
+
+        if closure is None:
+            closure = self.__closure(person, up, line)
+        if depth is None:
+            return list(closure)
+        return list(_within_depth(closure.items(), depth))
+
     def find_person_by_id(self, id: int) -> Person | None:
-        for person in self.all_persons():
-            if person.id == id:
-                return person
+        return self.__persons_by_id.get(id)
+
+    def find_persons_by_ids(self, ids: Iterable[int]) -> list[Person | None]:
+        """Return the persons for the given IDs, `None` for the IDs not present"""
+
+        persons_by_id = self.__persons_by_id
+        return [persons_by_id.get(id) for id in ids]
 
     def find_person_by_name(self, name: str) -> list[Person]:
         name = name.lower()
         found = []
-        for person in self.all_persons():
+        for person in self.__name_index.candidates(name):
             if name in person.name.lower():
                 found.append(person)
-        return found
+        return sorted(found, key=lambda person: person.id)
+
+    def search_names(self, terms: Iterable[str]) -> list[Person]:
+        """
+        Return the persons whose name contains any of the terms.
+        Case and spaces are ignored in both name and terms.
+        """
+
+        return sorted(self.__name_index.search(terms), key=lambda person: person.id)
+
+    def match_names(
+        self, pattern: re.Pattern, required: Iterable[Iterable[str]] = ()
+    ) -> list[Person]:
+        """
+        Return the persons whose name without spaces and lowercased matches the pattern.
+        Every match contains at least one string of each in required, used to narrow
+        the persons to be tested (see NameIndex.match).
+        """
+
+        found = self.__name_index.match(pattern, required)
+        return sorted(found, key=lambda person: person.id)
 
     def all_persons(self) -> list[Person]:
-        return list(self._graph.nodes)
+        return list(self._graph.nodes())
 
     def all_relations(self) -> list[(Person, Person, Relation)]:
-        relations = []
-        for p1, p2, relation in self._graph.edges.data():
-            relations.append((p1, p2, relation[Relation]))
-        return relations
+        return list(self._relations())
+
+    def _relations(self) -> Iterator[tuple[Person, Person, Relation]]:
+        for p1 in self._graph.nodes():
+            for p2, relation in p1._relatives():
+                yield p1, p2, relation
 
     def all_unique_relations(self) -> list[(Person, Person, Relation)]:
         relations = []
-        rel_set = []
-        for p1, p2, relation in self._graph.edges.data():
-            if (p1, p2) not in rel_set and (p2, p1) not in rel_set:
-                rel_set.append((p1, p2))
-                relations.append((p1, p2, relation[Relation]))
+        rel_set = set()
+        for p1, p2, relation in self.all_relations():
+            if (p2, p1) not in rel_set:
+                rel_set.add((p1, p2))
+                relations.append((p1, p2, relation))
 
         return relations
 
-    def shortest_path(self, start, stop):
-        return networkx.shortest_path(self._graph, start, stop)
+    def __ancestor_depths(self, person: Person) -> dict[Person, int]:
+        """Cached ancestors of the person, including the person at depth 0"""
+
+        depths = {person: 0}
+        depths.update(self.__closure(person, True, Line.ALL))
+        return depths
+
+    def common_ancestors(self, person1: Person, person2: Person) -> list[Person]:
+        """
+        Nearest common ancestors of both persons, i.e. those which are not ancestor of
+        another common ancestor. A person is included if it is an ancestor of the other.
+        Sorted by the total generations from both persons.
+        """
+
+        return _nearest_common_ancestors(
+            self.__ancestor_depths(person1),
+            self.__ancestor_depths(person2),
+        )
+
+    def relationship(self, person: Person, relative: Person) -> str | None:
+        """
+        Name of the kinship of relative with the person, like "grandfather", "aunt" or
+        "second cousin once removed". None if they have no common ancestor.
+        """
+
+        if person == relative:
+            return "self"
+
+        common = self.common_ancestors(person, relative)
+        if not common:
+            return None
+        return _relationship(
+            person,
+            relative,
+            self.__ancestor_depths(person)[common[0]],
+            self.__ancestor_depths(relative)[common[0]],
+        )
+
+    def validate(self, workers: int | None = None) -> list[ConsistencyIssue]:
+        """
+        Check the whole lineage in one pass over the persons and their relatives, for
+        relations without reciprocal, relatives related twice or to self, multiple
+        fathers or mothers, father and mother who are not spouse, spouses of same gender
+        and persons who are their own ancestors.
+
+        Parameters
+        ----------
+        workers: int | None
+            number of processes to check the persons in chunks of VALIDATION_CHUNK.
+            Checked in this process if None, or if there is a single chunk.
+        """
+
+        graph = self._graph
+        persons = list(graph.nodes())
+        index = {person: i for i, person in enumerate(persons)}
+        slots = [person._slot for person in persons]
+
+        def table(lists: list[list[Person] | None]) -> list[list[int] | None]:
+            return [
+                [index[relative] for relative in lists[slot]] if lists[slot] else None
+                for slot in slots
+            ]
+
+        tables = (
+            [person.id for person in persons],
+            "".join(person.gender for person in persons),
+            table(graph.parents),
+            table(graph.children),
+            table(graph.spouses),
+        )
+
+        n = len(persons)
+        chunks = [
+            (start, min(start + VALIDATION_CHUNK, n))
+            for start in range(0, n, VALIDATION_CHUNK)
+        ]
+        if workers is None or workers <= 1 or len(chunks) <= 1:
+            issues = _check_persons(tables, 0, n)
+        else:
+            with ProcessPoolExecutor(
+                workers, initializer=_init_worker, initargs=(tables,)
+            ) as executor:
+                issues = []
+                for chunk_issues in executor.map(_check_chunk, chunks):
+                    issues += chunk_issues
+
+        ids = tables[0]
+        for cycle in _cycles(tables[2]):
+            for i in sorted(cycle, key=ids.__getitem__):
+                issues.append(ConsistencyIssue("Person is own ancestor", ids[i]))
+
+        return issues
+
+    def kinship_matrix(self, persons: Iterable[Person]) -> list[list[float]]:
+        """
+        Kinship coefficients of every pair of the persons, in their order. Kinship of a
+        person with itself is (1 + inbreeding) / 2. See lineage_aq.kinship.
+        """
+
+        persons = list(persons)
+        return Pedigree(persons).kinship(persons)
+
+    def inbreeding_coefficients(self) -> dict[Person, float]:
+        """Inbreeding coefficient of every person, i.e. the kinship of its parents"""
+
+        pedigree = Pedigree(self.all_persons())
+        return dict(zip(pedigree.persons, pedigree.inbreeding()))
+
+    def shortest_path(
+        self,
+        start: Person,
+        stop: Person,
+        relations: Iterable[Relation] | None = None,
+        line: Line = Line.ALL,
+    ) -> list[Person]:
+        """
+        Persons on a shortest path from start to stop, both included
+
+        Parameters
+        ----------
+        start, stop: Person
+        relations: Iterable[Relation] | None
+            relations through which the path can go, like BLOOD_RELATIONS. All if None.
+        line: Line
+            parent and child relations through which the path can go
+
+        Raises ValueError if there is no such path.
+        """
+
+        path = _bidirectional_path(start, stop, _hop_filter(relations, line))
+        if path is None:
+            raise ValueError(f"No path between {start} and {stop}")
+        return [person for person, _ in path]
+
+    def shortest_paths(
+        self,
+        pairs: Iterable[tuple[Person, Person]],
+        relations: Iterable[Relation] | None = None,
+        line: Line = Line.ALL,
+    ) -> list[list[tuple[Person, Relation | None]] | None]:
+        """
+        Shortest paths for each pair of start and stop. Parameters are same as
+        `shortest_path`.
+
+        Each path is a list of the persons along with the relation of the person with the
+        previous one in the path (None for start). Path is None if there is none.
+        Pairs having the same start share a single search.
+        """
+
+        return _shortest_paths(pairs, relations, line)
 
     def save_to_file(self, filename: Path | str) -> None:
-        data = {
-            "headers": {
-                "persons": ["id", "name", "gender"],
-                "relations": ["id1", "id2", "relation"],
-            },
-            "persons": [],
-            "relations": [],
+        """
+        Write the lineage to file row by row, without building the whole document,
+        along with its metadata (see lineage_aq.metadata)
+        """
+
+        headers = {
+            "persons": ["id", "name", "gender"],
+            "relations": ["id1", "id2", "relation"],
         }
+        persons = (
+            [person.id, person.name, person.gender] for person in self._graph.nodes()
+        )
+        relations = (
+            [p1.id, p2.id, relation.name] for p1, p2, relation in self._relations()
+        )
 
-        for person in self.all_persons():
-            data["persons"].append([person.id, person.name, person.gender])
+        counts = {"persons": 0, "relations": 0}
 
-        for p1, p2, relation in self.all_relations():
-            data["relations"].append([p1.id, p2.id, relation.name])
+        def counted(key: str, rows: Iterable[list]) -> Iterator[list]:
+            for row in rows:
+                counts[key] += 1
+                yield row
 
         with open(filename, "w") as f:
-            json.dump(data, f, indent=0, separators=(",", ":"))
+            writer = HashingWriter(f)
+            dump_rows(
+                writer,
+                headers,
+                {
+                    "persons": counted("persons", persons),
+                    "relations": counted("relations", relations),
+                },
+            )
+        write_metadata(
+            filename,
+            FileCounts(counts["persons"], counts["relations"]),
+            writer.hexdigest(),
+        )
 
     @classmethod
-    def load_from_file(cls, filename: Path | str) -> Lineage:
+    def load_from_file(
+        cls, filename: Path | str, issues: list[ConsistencyIssue] | None = None
+    ) -> Lineage:
+        """
+        Read the lineage from file row by row, without loading the whole document.
+        Rows having any issue are skipped, and the issues are appended in `issues` if given.
+        """
+
         lineage = cls()
+        if issues is None:
+            issues = []
 
         with open(filename) as f:
-            data = json.load(f)
-            persons_data = data["persons"]
-            relations_data = data["relations"]
-
-            persons_dict: dict[int, Person] = {}
-            for prev_id, name, gender in persons_data:
+            # Rows are kept column-wise, to be added in bulk
+            ids, names, genders = [], [], []
+            ids1, ids2, relations = [], [], []
+            for key, row in iter_rows(f):
                 try:
-                    # Here persons new id can be different or
-                    # Lineage counter should be made equal to the highest id assigned plus 1
-                    person = lineage.add_person(name, gender)
-
-                    persons_dict[prev_id] = person
-                except Exception:
-                    pass
-
-            for prev_id1, prev_id2, relation in relations_data:
-                try:
-                    prev_id1, prev_id2 = int(prev_id1), int(prev_id2)
-                    persons_dict[prev_id1]._add_relation(
-                        persons_dict[prev_id2], Relation[relation]
-                    )
-
-                except Exception:
-                    pass
+                    if key == "persons":
+                        id, name, gender = row
+                        # IDs are kept same, so that the journal of the file can be replayed
+                        ids.append(int(id))
+                        names.append(name)
+                        genders.append(gender)
+
+                    elif key == "relations":
+                        id1, id2, relation = row
+                        ids1.append(int(id1))
+                        ids2.append(int(id2))
+                        relations.append(Relation[relation])
+
+                except (ValueError, TypeError, KeyError):
+                    issues.append(ConsistencyIssue(f"Invalid row in {key}: {row}"))
+
+        issues += lineage.bulk_add_persons(ids, names, genders)
+        issues += lineage.bulk_add_relations(ids1, ids2, relations)
 
         return lineage
@@ -0,0 +1,162 @@
+"""
+Metadata of the saved lineage files, so that they can be listed without reading them.
+
+Lineage.save_to_file writes the metadata of `lineage X.json` in `lineage X.meta`
+```
+{"persons": 2, "relations": 2, "sha256": "...", "saved": "2023-01-01T10:00:00",
+"size": 250, "mtime_ns": 1672547400000000000}
+```
+The metadata is valid only while the size and modification time of the file are same.
+Counts of the files without valid metadata are cached by `file_counts`.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import IO, NamedTuple
+
+from lineage_aq.json_stream import iter_rows
+
+
+SUFFIX = ".meta"
+
+
+class FileCounts(NamedTuple):
+    persons: int
+    relations: int
+
+
+class HashingWriter:
+    """Writes to the file, hashing the text written"""
+
+    def __init__(self, f: IO[str]) -> None:
+        self.__f = f
+        self.__hash = hashlib.sha256()
+
+    def write(self, text: str) -> None:
+        self.__hash.update(text.encode())
+        self.__f.write(text)
+
+    def hexdigest(self) -> str:
+        return self.__hash.hexdigest()
+
+
+def metadata_path(file: Path | str) -> Path:
+    return Path(file).with_suffix(SUFFIX)
+
+
+def write_metadata(file: Path | str, counts: FileCounts, sha256: str) -> None:
+    """Write the metadata of the file, which must have been just written"""
+
+    stat = os.stat(file)
+    metadata = {
+        "persons": counts.persons,
+        "relations": counts.relations,
+        "sha256": sha256,
+        "saved": datetime.now().isoformat(timespec="seconds"),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    with open(metadata_path(file), "w") as f:
+        json.dump(metadata, f)
+
+
+def read_metadata(file: Path) -> dict | None:
+    """Metadata of the file, None if not present or if the file changed after it"""
+
+    try:
+        with open(metadata_path(file)) as f:
+            metadata = json.load(f)
+        stat = file.stat()
+        if (
+            metadata["size"] == stat.st_size
+            and metadata["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return metadata
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def count_rows(file: Path) -> FileCounts:
+    """Count the persons and relations by reading the file row by row"""
+
+    counts = {"persons": 0, "relations": 0}
+    with open(file) as f:
+        for key, _ in iter_rows(f):
+            if key in counts:
+                counts[key] += 1
+    return FileCounts(counts["persons"], counts["relations"])
+
+
+def file_counts(
+    files: list[Path], cache: Path, workers: int | None = None
+) -> list[FileCounts | None]:
+    """
+    Number of persons and relations in each file, None for an unreadable file.
+
+    Counts are taken from the metadata of the file, else from the cache file keyed on the
+    modification time and size of the file. The remaining files are counted, in parallel
+    by the given number of processes, and their counts are saved in the cache.
+    """
+
+    try:
+        with open(cache) as f:
+            cached: dict[str, list] = json.load(f)
+    except (OSError, ValueError):
+        cached = {}
+
+    counts: list[FileCounts | None] = []
+    missing = []
+    for i, file in enumerate(files):
+        metadata = read_metadata(file)
+        if metadata is not None:
+            counts.append(FileCounts(metadata["persons"], metadata["relations"]))
+            continue
+
+        try:
+            stat = file.stat()
+        except OSError:
+            counts.append(None)
+            continue
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        entry = cached.get(str(file))
+        if entry is not None and entry[:2] == stamp:
+            counts.append(FileCounts(*entry[2:]))
+        else:
+            counts.append(None)
+            missing.append((i, stamp))
+
+    if missing:
+        to_count = [files[i] for i, _ in missing]
+        if workers is None or workers <= 1 or len(to_count) <= 1:
+            results = [_count_or_none(file) for file in to_count]
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                results = list(executor.map(_count_or_none, to_count))
+
+        for (i, stamp), result in zip(missing, results):
+            counts[i] = result
+            if result is not None:
+                cached[str(files[i])] = stamp + list(result)
+
+        # Entries of the deleted files are dropped
+        cached = {key: value for key, value in cached.items() if Path(key).exists()}
+        try:
+            with open(cache, "w") as f:
+                json.dump(cached, f)
+        except OSError:
+            pass
+
+    return counts
+
+
+def _count_or_none(file: Path) -> FileCounts | None:
+    try:
+        return count_rows(file)
+    except (OSError, ValueError):
+        return None
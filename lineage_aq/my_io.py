@@ -1,23 +1,129 @@
 from __future__ import annotations
-from typing import Callable
+from collections import deque
+from contextlib import contextmanager
+import sys
+from typing import Callable, Iterable, Iterator, NamedTuple, TextIO
 from colorama import Fore as c, Style
 
 from lineage_aq import Person
 
+# Number of lines of tree written to the stream at once
+WRITE_CHUNK = 1000
+# Number of pieces of output buffered before they are written even without flush
+BUFFER_LIMIT = 4096
+
+# Output of the print functions, written to stdout together by flush
+_buffer: list[str] = []
+# Whether colors are used for the stdout, which is checked only when stdout changes
+_color_stdout = None
+_color = False
+# Lists collecting the output meanwhile, see recording
+_recorders: list[list[str]] = []
+# Answers to the prompts when commands are run from a script, None when interactive
+_answers: deque[str] | None = None
+
+
+def use_color() -> bool:
+    """Escape codes of colors are written only if stdout is a terminal"""
+
+    global _color_stdout, _color
+    if sys.stdout is not _color_stdout:
+        _color_stdout = sys.stdout
+        _color = _color_stdout.isatty()
+    return _color
+
+
+def _write(text: str) -> None:
+    _buffer.append(text)
+    for recorder in _recorders:
+        recorder.append(text)
+    if len(_buffer) >= BUFFER_LIMIT:
+        sys.stdout.write("".join(_buffer))
+        _buffer.clear()
+
+
+def flush() -> None:
+    """
+    Write the buffered output to stdout. Output is flushed before taking input and after
+    each command.
+    """
+
+    if _buffer:
+        sys.stdout.write("".join(_buffer))
+        _buffer.clear()
+    sys.stdout.flush()
+
+
+@contextmanager
+def recording() -> Iterator[list[str]]:
+    """Collect the output written within the context in the given list, besides writing it"""
+
+    recorder = []
+    _recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorders.remove(recorder)
+
+
+def answer_prompts(answers: Iterable[str] | None) -> None:
+    """
+    Take the answers of the following prompts from the answers in order, without asking.
+    Prompts left without an answer are taken blank, or fail if an answer is required.
+    `None` restores asking the prompts.
+    """
+
+    global _answers
+    _answers = None if answers is None else deque(answers)
+
+
+def unanswered_prompts() -> int:
+    return len(_answers) if _answers is not None else 0
+
+
+def scripted() -> bool:
+    """Whether the prompts are answered by answer_prompts"""
+
+    return _answers is not None
+
+
+def _answer(prompt: str, required: bool) -> str:
+    answer = _answers.popleft() if _answers else ""
+    if required and answer == "":
+        raise ValueError(f"No answer for '{prompt.strip()}'")
+    return answer
+
+
+def _invalid_input(message: str) -> None:
+    # Script can't be asked again, so invalid answer fails the command
+    if scripted():
+        raise ValueError(message)
+    print_red(f"Warning: {message}")
+
 
 def take_input(arg):
-    arg = c.LIGHTGREEN_EX + arg + c.LIGHTYELLOW_EX
+    if scripted():
+        return _answer(arg, False)
+    flush()
+    if use_color():
+        arg = c.LIGHTGREEN_EX + arg + c.LIGHTYELLOW_EX
     inp = input(arg)
-    print(c.RESET, end="")
+    if use_color():
+        _write(c.RESET)
     return inp
 
 
 def non_empty_input(arg):
-    arg = c.LIGHTGREEN_EX + arg + c.LIGHTYELLOW_EX
+    if scripted():
+        return _answer(arg, True)
+    flush()
+    if use_color():
+        arg = c.LIGHTGREEN_EX + arg + c.LIGHTYELLOW_EX
     while True:
         inp = input(arg)
         if inp != "":
-            print(c.RESET, end="")
+            if use_color():
+                _write(c.RESET)
             return inp
 
 
@@ -30,14 +136,14 @@ def input_from(msg, from_: tuple, *, IGNORE_CASE=True):
             inp = non_empty_input(msg).lower()
             if inp in from2:
                 return inp
-            print_red(f"Warning: Input from {from_}")
+            _invalid_input(f"Input from {from_}")
 
     else:
         while True:
             inp = non_empty_input(msg)
             if inp in from2:
                 return inp
-            print_red(f"Warning: Input from {from_}")
+            _invalid_input(f"Input from {from_}")
 
 
 def input_in_range(msg: str, a: int, b: int = None) -> float:
@@ -56,17 +162,25 @@ def input_in_range(msg: str, a: int, b: int = None) -> float:
         inp = non_empty_input(msg)
         try:
             inp = float(inp)
-            if lb <= inp < ub:
-                return inp
-            print_red(f"Warning: Input range is [{lb},{ub})")
-        except Exception:
-            print_red("Warning: Please input a number")
+        except ValueError:
+            _invalid_input("Please input a number")
+            continue
+        if lb <= inp < ub:
+            return inp
+        _invalid_input(f"Input range is [{lb},{ub})")
+
+
+def _print_colored(color, *args, sep=" ", end="\n"):
+    text = sep.join(str(arg) for arg in args) + end
+    if use_color():
+        text = color + text + c.RESET
+    _write(text)
 
 
-def _print_colored(color, *args, **kwargs):
-    print(color, end="")
-    print(*args, **kwargs)
-    print(c.RESET, end="")
+def print_plain(*args, sep=" ", end="\n"):
+    """Same as print, but buffered along with the colored output"""
+
+    _write(sep.join(str(arg) for arg in args) + end)
 
 
 def print_red(*args, **kwargs):
@@ -98,11 +212,14 @@ def print_magenta(*args, **kwargs):
 
 
 def print_heading(*args):
-    print()
-    print(Style.BRIGHT + c.LIGHTMAGENTA_EX, end="")
-    print(*args)
-    print("-" * len(" ".join(args)), end="")
-    print(c.RESET + Style.NORMAL)
+    heading = " ".join(args)
+    if use_color():
+        _write(
+            f"\n{Style.BRIGHT}{c.LIGHTMAGENTA_EX}{heading}\n"
+            f"{'-' * len(heading)}{c.RESET}{Style.NORMAL}\n"
+        )
+    else:
+        _write(f"\n{heading}\n{'-' * len(heading)}\n")
 
 
 def print_id_name_in_box(person: Person):
@@ -126,36 +243,47 @@ def print_id_name_in_box(person: Person):
     print_box("\t ╰" + "─" * (max(n_len, i_len) + 2) + "╯")
 
 
-def print_tree(
-    tree: dict[Person, dict],
-    occurance: dict[Person, int] = {},
+class _More(NamedTuple):
+    """Entry shown in place of the children left out of the tree"""
+
+    count: int
+
+
+def tree_lines(
+    root: Person,
+    children: Callable[[Person], list[tuple[Person, bool]]],
     person_repr: Callable[[Person], str] = repr,
     print_spouse=True,
-):
+    max_depth: int | None = None,
+    max_children: int | None = None,
+    color: bool = True,
+) -> Iterator[str]:
     """
-    Print the dict of dict into tree
+    Render the tree of the root person line by line. Lines are yielded as soon as they are
+    rendered, walking the tree iteratively, so the tree is never built in memory.
+
+    A person occurring again in the tree is rendered in grey along with its subtree.
 
     Parameters
     ----------
-    tree: dict[Person, dict]
-        recursive dict containing parent as key and dict containing children
-    occurance: dict[Person, int]
-        contains the number of occurances of any person in the tree
+    root: Person
+    children: Callable[[Person], list[tuple[Person, bool]]]
+        children of the person to be shown, in order, each along with whether it is to be
+        expanded. Children not expanded are shown as leaves.
     person_repr: Callable[[Person], str]
         function which represent string representation of the person to be printed
+    max_depth: int | None
+        number of generations to be shown below the root, all if None
+    max_children: int | None
+        number of children to be shown under a person, rest are counted in a single entry
+    color: bool
+        whether the persons occurring again are shown in grey through escape codes
 
     Example
     -------
     ```
-    tree = {
-        "foo": {
-            "bar": {"a": {"1": {"2": {}, "3": {}}}, "b": {}},
-            "baz": {},
-            "qux": {"c\nd": {}},
-        },
-    }
-
-    print_tree(tree)
+    for line in tree_lines(foo, lambda p: [(child, True) for child in p.children]):
+        print(line)
     ```
 
     Output:
@@ -171,54 +299,102 @@ def print_tree(
         └── c⏎d
     """
     VERTICAL = "│   "
-    HORIZONTAL = "─── "
     BRANCH = "├── "
     LAST_BRANCH = "└── "
     EMPTY = " " * len(BRANCH)
-    LEN = len(BRANCH)
-
-    def replace(st: str) -> str:
-        return (
-            st.replace(BRANCH, VERTICAL)
-            .replace(LAST_BRANCH, EMPTY)
-            .replace(HORIZONTAL, EMPTY)
-        )
+    GREY = c.LIGHTBLACK_EX if color else ""
+    RESET = c.RESET if color else ""
+
+    def spouse_of(person: Person) -> str:
+        if not print_spouse:
+            return ""
+        spouse = person.wife if person.gender == "m" else person.husband
+        if not spouse:
+            return ""
+        spouse = [person_repr(s) for s in sorted(spouse, key=lambda p: p.id)]
+        return "- " + ", ".join(spouse)
+
+    def entries_of(person: Person) -> list[tuple[Person | _More, bool]]:
+        entries = children(person)
+        if max_children is not None and len(entries) > max_children:
+            more = _More(len(entries) - max_children)
+            entries = entries[:max_children] + [(more, False)]
+        return entries
+
+    yield f"{person_repr(root)} {spouse_of(root)}"
+    if max_depth is not None and max_depth <= 0:
+        return
+
+    # Persons expanded once, to be shown in grey when they occur again
+    seen = {root}
+    # Each frame is the entries below a person, position of the next entry, prefix of
+    # the entries and their depth. Prefix of the entries is extended from the prefix of
+    # their parent once, instead of being rebuilt for every entry.
+    stack = [[entries_of(root), 0, "", 1]]
+    while stack:
+        frame = stack[-1]
+        entries, position, prefix, depth = frame
+        if position == len(entries):
+            stack.pop()
+            continue
+
+        person, expand = entries[position]
+        frame[1] = position = position + 1
+        last = position == len(entries)
+        branch = LAST_BRANCH if last else BRANCH
+
+        if isinstance(person, _More):
+            yield f"{prefix}{branch}... {person.count} more"
+            continue
+
+        text = f"{person_repr(person)} {spouse_of(person)}"
+        grey = expand and person in seen
+        if grey:
+            yield f"{prefix}{branch}{GREY}{text}{RESET}"
+        else:
+            yield f"{prefix}{branch}{text}"
+
+        if not expand or (max_depth is not None and depth >= max_depth):
+            continue
+        seen.add(person)
+        entries = entries_of(person)
+        if not entries:
+            continue
+        prefix += EMPTY if last else VERTICAL
+        if grey:
+            prefix += GREY
+        stack.append([entries, 0, prefix, depth + 1])
+
+
+def write_tree(lines: Iterable[str], out: TextIO, page_size: int | None = None) -> None:
+    """
+    Write the lines of tree (see tree_lines) to the stream. Lines are collected in a buffer
+    and written together, a page at a time with page_size, otherwise WRITE_CHUNK lines at
+    a time. With page_size, wait for Enter after each page, and stop if q is entered.
+    """
 
-    def _print_tree(tree: dict[Person, dict], connector=""):
-        print()
-        if isinstance(tree, dict):
-            connector = replace(connector) + BRANCH
-            for i, (person, subtree) in enumerate(tree.items(), 1):
-                if i == len(tree):
-                    connector = replace(connector[:-LEN]) + LAST_BRANCH
-
-                spouse = ""
-                if print_spouse:
-                    if person.gender == "m":
-                        spouse = person.wife
-                    else:
-                        spouse = person.husband
-                    if spouse:
-                        spouse = [
-                            person_repr(s) for s in sorted(spouse, key=lambda p: p.id)
-                        ]
-                        spouse = "- " + ", ".join(spouse)
-                    else:
-                        spouse = ""
-
-                print(connector[LEN:], end="")
-                if person in duplicates:
-                    if duplicates[person]:
-                        print_grey(person_repr(person), spouse, end="")
-                        _print_tree(subtree, connector + c.LIGHTBLACK_EX)
-                    else:
-                        print(person_repr(person), spouse, end="")
-                        duplicates[person] = True
-                        _print_tree(subtree, connector)
-                else:
-                    print(person_repr(person), spouse, end="")
-                    _print_tree(subtree, connector)
-
-    # When value is False for first time, print the person in regular color, and then print it in grey for all other occurances
-    duplicates = {person: False for person, freq in occurance.items() if freq > 1}
-    _print_tree(tree)
+    chunk = page_size or WRITE_CHUNK
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) == chunk:
+            buffer.append("")
+            out.write("\n".join(buffer))
+            buffer.clear()
+            if page_size is not None:
+                out.flush()
+                answer = take_input("-- More (Enter to continue, q to quit) --")
+                if answer.lower() == "q":
+                    return
+    if buffer:
+        buffer.append("")
+        out.write("\n".join(buffer))
+    out.flush()
+
+
+def print_tree(lines: Iterable[str], page_size: int | None = None) -> None:
+    """Print the lines of tree (see tree_lines) after an empty line. See write_tree."""
+
+    print_plain()
+    flush()
+    write_tree(lines, sys.stdout, page_size)
@@ -0,0 +1,335 @@
+from __future__ import annotations
+from collections import Counter, defaultdict
+from heapq import nsmallest
+from math import ceil
+import re
+from threading import Lock
+from typing import TYPE_CHECKING, Callable, Iterable
+
+if TYPE_CHECKING:
+    from lineage_aq.lineage import Person
+
+
+N = 3
+# Default least similarity of the persons found by CanonicalIndex.similar
+MIN_SIMILARITY = 0.3
+# Run of a repeated letter, taken as a single letter by CanonicalIndex.similar
+_REPEATED = re.compile(r"(.)\1+")
+
+
+def normalize(name: str) -> str:
+    """Lowercase the name and remove the spaces from it"""
+
+    return name.lower().replace(" ", "")
+
+
+def ngrams(x: str) -> set[str]:
+    return {x[i : i + N] for i in range(len(x) - N + 1)}
+
+
+class NameIndex:
+    """
+    Inverted n-gram index over the normalized names of persons.
+
+    A name containing the query as substring must contain every n-gram of the query,
+    so the candidates are found by intersecting the posting lists of the query n-grams
+    and only the candidates are checked for the substring.
+    """
+
+    def __init__(self) -> None:
+        self.__postings: dict[str, set[Person]] = defaultdict(set)
+        self.__names: dict[Person, str] = {}
+
+    def add(self, person: Person) -> None:
+        name = normalize(person.name)
+        self.__names[person] = name
+        for gram in ngrams(name):
+            self.__postings[gram].add(person)
+
+    def remove(self, person: Person) -> None:
+        name = self.__names.pop(person, None)
+        if name is None:
+            return
+
+        for gram in ngrams(name):
+            posting = self.__postings[gram]
+            posting.discard(person)
+            if not posting:
+                del self.__postings[gram]
+
+    def update(self, person: Person) -> None:
+        """Reindex the person after the change in name"""
+
+        self.remove(person)
+        self.add(person)
+
+    def candidates(self, query: str) -> set[Person]:
+        """Persons whose normalized name may contain the normalized query"""
+
+        query = normalize(query)
+        if len(query) < N:
+            return {person for person, name in self.__names.items() if query in name}
+
+        return self.__having(ngrams(query))
+
+    def __having(self, grams: set[str]) -> set[Person]:
+        """Persons whose normalized name has all the n-grams, which must not be empty"""
+
+        postings = [self.__postings.get(gram, set()) for gram in grams]
+        postings.sort(key=len)
+        found = set(postings[0])
+        for posting in postings[1:]:
+            if not found:
+                break
+            found &= posting
+        return found
+
+    def search(self, queries: Iterable[str]) -> set[Person]:
+        """Persons whose normalized name contains any of the normalized queries"""
+
+        found = set()
+        for query in queries:
+            query = normalize(query)
+            for person in self.candidates(query):
+                if query in self.__names[person]:
+                    found.add(person)
+        return found
+
+    def match(
+        self, pattern: re.Pattern, required: Iterable[Iterable[str]] = ()
+    ) -> set[Person]:
+        """
+        Persons whose normalized name matches the pattern. Every match contains at least
+        one of the normalized strings of each in required, so only the names having all
+        the n-grams of one of them are tested.
+        """
+
+        candidates = None
+        for strings in required:
+            found = set()
+            for x in strings:
+                grams = ngrams(x)
+                if not grams:
+                    # Too short to narrow the names
+                    found = None
+                    break
+                found |= self.__having(grams)
+            if found is not None:
+                candidates = found if candidates is None else candidates & found
+
+        if candidates is None:
+            candidates = self.__names
+        names = self.__names
+        return {person for person in candidates if pattern.search(names[person])}
+
+
+def _same(x: str) -> str:
+    return x
+
+
+def _squeeze(key: str) -> str:
+    # Doubled letters are mostly the spelling or typo of a single one (Muhammad, Mohamad)
+    return _REPEATED.sub(r"\1", key)
+
+
+def _key_ngrams(key: str) -> set[str]:
+    # Padded, so that the start and end of the name count and short names have n-grams
+    return ngrams(f"^{_squeeze(key)}$")
+
+
+def _one_edit(x: str, y: str) -> bool:
+    """
+    Whether x and y differ by at most one letter inserted, removed, replaced or swapped
+    with the next one
+    """
+
+    if len(x) < len(y):
+        x, y = y, x
+    if len(x) - len(y) > 1:
+        return False
+
+    i = 0
+    while i < len(y) and x[i] == y[i]:
+        i += 1
+    if len(x) != len(y):
+        return x[i + 1 :] == y[i:]
+    return x[i + 1 :] == y[i + 1 :] or (
+        x[i + 2 :] == y[i + 2 :] and x[i : i + 2] == y[i + 1 : i + 2] + y[i : i + 1]
+    )
+
+
+class CanonicalIndex:
+    """
+    Map from the canonical key of the names to the persons, so that the persons named
+    same are found by a single lookup, whatever the spelling (see search.canonical_form).
+    The key is the canonical spelling of the normalized name.
+
+    Persons with similar names, having typos, are found through the n-grams of the keys
+    (see similar).
+
+    The index is kept updated by the lineage it is attached to (Lineage.attach_index).
+    When the canonical spelling changes, rebuild() recomputes all the keys, and may run in
+    a background thread while the index is in use.
+
+    Parameters
+    ----------
+    canonical: Callable[[str], str]
+        canonical spelling of the normalized name, same for all the alternate spellings
+    version: Callable[[], int] | None
+        version of the canonical spelling. Keys are rebuilt before lookup if it changed.
+    """
+
+    def __init__(
+        self,
+        canonical: Callable[[str], str] = _same,
+        version: Callable[[], int] | None = None,
+    ) -> None:
+        self.__canonical = canonical
+        self.__version = version
+        self.__indexed_version = version() if version is not None else None
+        self.__keys: dict[Person, str] = {}
+        self.__persons: dict[str, set[Person]] = defaultdict(set)
+        # Persons by n-grams of their keys, for similar()
+        self.__postings: dict[str, set[Person]] = defaultdict(set)
+        # Guards the maps above, held only briefly so lookups don't wait for rebuild
+        self.__lock = Lock()
+        self.__rebuild_lock = Lock()
+        # Persons added, removed or renamed while the keys are being rebuilt
+        self.__changed: set[Person] | None = None
+
+    def key(self, name: str) -> str:
+        return self.__canonical(normalize(name))
+
+    def add(self, person: Person) -> None:
+        key = self.key(person.name)
+        with self.__lock:
+            self.__remove(person)
+            self.__keys[person] = key
+            self.__persons[key].add(person)
+            for gram in _key_ngrams(key):
+                self.__postings[gram].add(person)
+            if self.__changed is not None:
+                self.__changed.add(person)
+
+    def remove(self, person: Person) -> None:
+        with self.__lock:
+            self.__remove(person)
+            if self.__changed is not None:
+                self.__changed.add(person)
+
+    def __remove(self, person: Person) -> None:
+        key = self.__keys.pop(person, None)
+        if key is None:
+            return
+
+        persons = self.__persons[key]
+        persons.discard(person)
+        if not persons:
+            del self.__persons[key]
+        for gram in _key_ngrams(key):
+            posting = self.__postings[gram]
+            posting.discard(person)
+            if not posting:
+                del self.__postings[gram]
+
+    def update(self, person: Person) -> None:
+        """Reindex the person after the change in name"""
+
+        self.add(person)
+
+    def find(self, name: str) -> list[Person]:
+        """Persons having the same name as given, ignoring case, spaces and spelling"""
+
+        if self.__version is not None and self.__version() != self.__indexed_version:
+            self.rebuild()
+        key = self.key(name)
+        with self.__lock:
+            found = list(self.__persons.get(key, ()))
+        return sorted(found, key=lambda person: person.id)
+
+    def similar(
+        self, name: str, k: int = 10, min_score: float = MIN_SIMILARITY
+    ) -> list[tuple[Person, float]]:
+        """
+        At most k persons whose name is most similar to the given name, best first, with
+        their similarity. Similarity is the Jaccard index of the n-gram sets of the keys,
+        with the repeated letters taken once, so the alternate spellings are same and
+        typos lower it only a little.
+
+        A single typo changes up to N + 1 of the n-grams, which is most of them in short
+        names (Hasn and Hasan share 2 of 7), so the persons whose key is a typo away are
+        found as well, even with a similarity below min_score.
+
+        A person needs min_score * (number of n-grams of the name) shared n-grams to reach
+        min_score, and a typo away shares all but N + 1 of them. So the candidates are
+        taken only from enough of the rarest posting lists that such a person must be in
+        one of them, and the postings of the common n-grams are only used to count.
+        """
+
+        if self.__version is not None and self.__version() != self.__indexed_version:
+            self.rebuild()
+        key = _squeeze(self.key(name))
+        grams = _key_ngrams(key)
+        if not grams:
+            return []
+
+        with self.__lock:
+            postings = [self.__postings.get(gram, set()) for gram in grams]
+            postings.sort(key=len)
+            needed = max(
+                min(ceil(min_score * len(grams) - 1e-9), len(grams) - N - 1), 1
+            )
+            prefix = len(grams) - needed + 1
+            shared = Counter()
+            for posting in postings[:prefix]:
+                shared.update(posting)
+            candidates = shared.keys()
+            for posting in postings[prefix:]:
+                shared.update(candidates & posting)
+
+            keys = self.__keys
+            found = []
+            for person, count in shared.items():
+                if count < needed:
+                    continue
+                score = count / (len(grams) + len(_key_ngrams(keys[person])) - count)
+                if score >= min_score or _one_edit(key, _squeeze(keys[person])):
+                    found.append((person, score))
+
+        return nsmallest(k, found, key=lambda item: (-item[1], item[0].id))
+
+    def rebuild(self) -> None:
+        """
+        Recompute the keys after the change in canonical spelling. The index can be used
+        and updated meanwhile, with the old keys until the new ones replace them.
+        """
+
+        with self.__rebuild_lock:
+            version = self.__version() if self.__version is not None else None
+            if version is not None and version == self.__indexed_version:
+                return
+
+            with self.__lock:
+                persons = list(self.__keys)
+                self.__changed = set()
+            keys = {person: self.key(person.name) for person in persons}
+
+            with self.__lock:
+                # Keys of the persons changed meanwhile are taken from their current state
+                for person in self.__changed:
+                    if person in self.__keys:
+                        keys[person] = self.key(person.name)
+                    else:
+                        keys.pop(person, None)
+                self.__changed = None
+
+                by_key = defaultdict(set)
+                postings = defaultdict(set)
+                for person, key in keys.items():
+                    by_key[key].add(person)
+                    for gram in _key_ngrams(key):
+                        postings[gram].add(person)
+                self.__keys = keys
+                self.__persons = by_key
+                self.__postings = postings
+                self.__indexed_version = version
@@ -1,51 +1,62 @@
 from __future__ import annotations
-from lineage_aq.config import alternate_spells
+import re
+from typing import TYPE_CHECKING, NamedTuple
+from lineage_aq import Lineage, Person
+from lineage_aq.config import alternate_spells, alternate_spells_version
 
+if TYPE_CHECKING:
+    from lineage_aq.snapshot import LineageSnapshot
 
-def mark_alternate_spells_tokens(x: str) -> str:
-    """
-    Enclose the alternate_spells tokens contained in the given string by `()`.
+# Number of variants of a piece of search term, by which the names are narrowed
+MAX_VARIANTS = 16
+# Built from alternate_spells along with its version, when the version changes. Each is
+# replaced as a whole, since alternate_spells may be fetched in a background thread.
+# (version, tokens) by _spelling_groups
+_spelling_tokens: tuple[int | None, list[tuple[str, list[str], str]]] = (None, [])
+# (version, spells, pattern) by canonical_form
+_canonical: tuple[int | None, dict[str, str], re.Pattern | None] = (None, {}, None)
 
-    Example
-    -------
-    (global) alternate_spells = [
-        ["ee", "i"],
-        ["aa", "a"],
-    ]
 
-    >>> generate_formattable_str("Hadees")
-    H(a)d(ee)s
-    """
+class SpellingMatcher(NamedTuple):
+    """Compiled search term matching all of its alternate spellings (see spelling_matcher)"""
 
-    found_tokens = []
-    i = 0
-    for group in alternate_spells:
-        for item in group:
-            if item in x:
-                found_tokens.append(item)
-                # This is done so that there should be no replacement
-                # in the already grabbed text
-                x = x.replace(item, f"({i})")
-                i += 1
+    pattern: re.Pattern
+    # Every match contains at least one string of each of these
+    required: list[list[str]]
 
-    for i, item in enumerate(found_tokens):
-        x = x.replace(f"({i})", f"({item})")
-    return x
 
+def _spelling_groups() -> list[tuple[str, list[str], str]]:
+    """
+    alternate_spells tokens in the order they are looked for in a term, each with its
+    group and the regex alternation of the group. Built once for each version of
+    alternate_spells.
+    """
 
-def create_variants(x: str) -> set[str]:
+    global _spelling_tokens
+    version = alternate_spells_version()
+    if version != _spelling_tokens[0]:
+        tokens = {}
+        for group in alternate_spells:
+            alternation = "(?:" + "|".join(map(re.escape, group)) + ")"
+            for item in group:
+                if item and item not in tokens:
+                    tokens[item] = (item, group, alternation)
+        _spelling_tokens = (version, list(tokens.values()))
+    return _spelling_tokens[1]
+
+
+def spelling_matcher(x: str) -> SpellingMatcher:
     """
-    Create all the variants(permutations) by replacing the marked tokens by their alternates.
+    Compile the string into a regex matching every variant of it, the variants being made
+    by replacing each alternate_spells token of the string by any spelling of its group.
 
-    Parameter
-    ---------
-    x: str
-        String with marked tokens [output of function mark_alternate_spells_tokens()]
+    Tokens are looked for in the order of alternate_spells, and the text taken by a token
+    is not looked into for the later tokens. Each name is then tested in a single pass,
+    instead of trying the variants one by one, whose number grows exponentially with the
+    number of tokens.
 
-    Returns
-    -------
-    variants: set[str]
-        set containing all variants
+    To narrow the names to be tested, the string is also cut into pieces having at most
+    MAX_VARIANTS variants each. A match contains some variant of every piece.
 
     Example
     -------
@@ -54,39 +65,49 @@ def create_variants(x: str) -> set[str]:
         ["aa", "a"],
     ]
 
-    >>> create_variants("H(a)d(ee)s")
-    {'Hadees', 'Haadees', 'Haadis', 'Hadis'}
+    >>> spelling_matcher("hadees").pattern
+    re.compile('h(?:aa|a)d(?:ee|i)s')
     """
 
-    variants = {x.replace("(", "").replace(")", "")}
-
-    start = x.find("(")
-    end = x.find(")")
-    while start >= 0:
-        spell = x[start + 1 : end]
-
-        group_ = []
-        for group in alternate_spells:
-            if spell in group:
-                group_ = group.copy()
-                group_.remove(spell)
-                break
-
-        for sim in group_:
-            a = x[:start] + sim + x[end + 1 :]
-            variants |= create_variants(a)
-
-        x = x.replace("(", "", 1).replace(")", "", 1)
-
-        start = x.find("(")
-        end = x.find(")")
-
-    return variants
+    # Parts of the string, either literal text or a token
+    parts: list[tuple[str, tuple | None]] = [(x, None)]
+    for token, group, alternation in _spelling_groups():
+        split = []
+        for text, spelling in parts:
+            if spelling is not None or token not in text:
+                split.append((text, spelling))
+                continue
+            pieces = text.split(token)
+            for piece in pieces[:-1]:
+                split.append((piece, None))
+                split.append((token, (group, alternation)))
+            split.append((pieces[-1], None))
+        parts = split
+
+    pattern = []
+    required = []
+    variants = [""]
+    for text, spelling in parts:
+        if spelling is None:
+            pattern.append(re.escape(text))
+            variants = [variant + text for variant in variants]
+            continue
+
+        group, alternation = spelling
+        pattern.append(alternation)
+        if len(variants) * len(group) > MAX_VARIANTS:
+            required.append(variants)
+            variants = [""]
+        variants = [variant + item for variant in variants for item in group]
+    required.append(variants)
+
+    return SpellingMatcher(re.compile("".join(pattern)), required)
 
 
 def advanced_search(search_term: str, search_space: list[str]) -> list[str]:
     """
-    Search the given search_term in the given search_space, by generating several variants of the search_term.
+    Search the given search_term in the given search_space, matching all the alternate
+    spellings of the search_term (see spelling_matcher).
 
     Parameters
     ----------
@@ -98,7 +119,7 @@ def advanced_search(search_term: str, search_space: list[str]) -> list[str]:
     Returns
     -------
     :list[str]
-        List containing matching terms
+        List containing matching terms, in the order of search_space
 
     Example
     -------
@@ -108,14 +129,57 @@ def advanced_search(search_term: str, search_space: list[str]) -> list[str]:
     ]
 
     >>> advanced_search("Hadees", ["Hadis", "Hadees", "Other"])
-    ['Hadees', 'Hadis']
+    ['Hadis', 'Hadees']
+    """
+    pattern = spelling_matcher(search_term.lower()).pattern
+    return [term for term in search_space if pattern.search(term.lower())]
+
+
+def advanced_search_persons(
+    search_term: str, lineage: Lineage | LineageSnapshot
+) -> list[Person]:
+    """
+    Search the persons in lineage whose name matches any alternate spelling of the
+    search_term. Spaces are ignored in both search_term and names.
+
+    Same as advanced_search(), but only the names having the n-grams of the variants of
+    search_term pieces are tested, through the name index of lineage.
+    """
+    search_term = search_term.replace(" ", "").lower()
+    matcher = spelling_matcher(search_term)
+    return lineage.match_names(matcher.pattern, matcher.required)
+
+
+def canonical_form(x: str) -> str:
+    """
+    Replace each alternate_spells token in the given string by the first spelling of its
+    group, so that all the variants of a string have the same canonical form. Longer
+    tokens are preferred, and the replaced text is not scanned again.
+
+    Example
+    -------
+    (global) alternate_spells = [
+        ["ee", "i"],
+        ["aa", "a"],
+    ]
+
+    >>> canonical_form("hadis")
+    haadees
     """
-    search_term = search_term.lower()
-    variants = create_variants(mark_alternate_spells_tokens(search_term))
-
-    result = []
-    for variant in variants:
-        for term in search_space:
-            if variant in term.lower():
-                result.append(term)
-    return result
+
+    global _canonical
+    version = alternate_spells_version()
+    if version != _canonical[0]:
+        spells = {}
+        for group in alternate_spells:
+            for item in group:
+                if item:
+                    spells.setdefault(item, group[0])
+        tokens = sorted(spells, key=len, reverse=True)
+        pattern = re.compile("|".join(map(re.escape, tokens))) if tokens else None
+        _canonical = (version, spells, pattern)
+
+    _, spells, pattern = _canonical
+    if pattern is None:
+        return x
+    return pattern.sub(lambda match: spells[match.group()], x)
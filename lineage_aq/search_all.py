@@ -0,0 +1,162 @@
+"""
+Search of a name across all the lineage files saved in LINEAGE_HOME, including autosaves.
+
+Files are searched in parallel processes. The persons of each file, with the changes of its
+journal applied, are kept in a name cache in LINEAGE_CACHE_DIR, so a file not changed since
+the last search is not parsed again.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from itertools import repeat
+import json
+import os
+from pathlib import Path
+import re
+from typing import NamedTuple
+
+from lineage_aq.config import LINEAGE_AUTOSAVE_DIR, LINEAGE_CACHE_DIR, LINEAGE_HOME
+from lineage_aq.json_stream import iter_rows
+from lineage_aq.name_index import normalize
+from lineage_aq.search import spelling_matcher
+
+
+NAME_CACHE_DIR = LINEAGE_CACHE_DIR / "names"
+
+
+class FileHit(NamedTuple):
+    file: Path
+    id: int
+    name: str
+
+
+class SearchAllResult(NamedTuple):
+    hits: list[FileHit]
+    num_files: int
+    # Number of files whose names were read from the name cache
+    num_cached: int
+
+
+def lineage_files() -> list[Path]:
+    """Saved lineage files, latest first, followed by the autosaves"""
+
+    files = sorted(LINEAGE_HOME.glob("*.json"), reverse=True)
+    files += sorted(LINEAGE_AUTOSAVE_DIR.glob("*.json"), reverse=True)
+    return files
+
+
+def _stamp(file: Path) -> list[int | None]:
+    """Modification time and size of the file and its journal, to validate the cache"""
+
+    stamp = []
+    for path in (file, file.with_suffix(".journal")):
+        try:
+            stat = path.stat()
+            stamp += [stat.st_mtime_ns, stat.st_size]
+        except FileNotFoundError:
+            stamp += [None, None]
+    return stamp
+
+
+def _cache_path(file: Path) -> Path:
+    digest = hashlib.sha1(str(file.resolve()).encode()).hexdigest()
+    return NAME_CACHE_DIR / f"{digest}.json"
+
+
+def _read_names(file: Path) -> dict[int, str]:
+    """Names of the persons by ID, read row by row, with the journal of the file applied"""
+
+    names = {}
+    with open(file) as f:
+        for key, row in iter_rows(f):
+            if key == "persons":
+                names[int(row[0])] = row[1]
+
+    journal = file.with_suffix(".journal")
+    if journal.exists():
+        with open(journal) as f:
+            for line in f:
+                try:
+                    kind, id, *args = json.loads(line)
+                except ValueError:
+                    # Last line may be partially written due to crash
+                    continue
+                if kind in ("person", "name"):
+                    names[id] = args[0]
+                elif kind == "rmperson":
+                    names.pop(id, None)
+    return names
+
+
+def file_names(file: Path) -> tuple[list[list], bool]:
+    """
+    Rows of ID, name and normalized name of the persons in the file, and whether they
+    are taken from the name cache. The cache is written if not valid.
+    """
+
+    stamp = _stamp(file)
+    cache = _cache_path(file)
+    try:
+        with open(cache) as f:
+            cached = json.load(f)
+        if cached["stamp"] == stamp:
+            return cached["persons"], True
+    except (OSError, ValueError, KeyError):
+        pass
+
+    persons = [[id, name, normalize(name)] for id, name in _read_names(file).items()]
+    try:
+        NAME_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        temp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+        with open(temp, "w") as f:
+            json.dump({"file": str(file), "stamp": stamp, "persons": persons}, f)
+        os.replace(temp, cache)
+    except OSError:
+        pass
+    return persons, False
+
+
+def _search_file(file: Path, pattern: str) -> tuple[list[FileHit], bool]:
+    regex = re.compile(pattern)
+    try:
+        persons, cached = file_names(file)
+    except (OSError, ValueError):
+        # Unreadable or corrupt file has no hit
+        return [], False
+    hits = [FileHit(file, id, name) for id, name, key in persons if regex.search(key)]
+    hits.sort(key=lambda hit: hit.id)
+    return hits, cached
+
+
+def search_all(
+    name: str, files: list[Path] | None = None, workers: int | None = None
+) -> SearchAllResult:
+    """
+    Search the persons matching the name in all the lineage files, the same way as
+    advanced_search_persons, i.e. matching any alternate spelling and ignoring the spaces.
+
+    Parameters
+    ----------
+    name: str
+    files: list[Path] | None
+        files to be searched, lineage_files() if None
+    workers: int | None
+        number of processes searching the files. Searched in this process if None, or if
+        there is a single file.
+    """
+
+    if files is None:
+        files = lineage_files()
+    # Compiled here, since the alternate_spells may not be loaded in the worker processes
+    pattern = spelling_matcher(normalize(name)).pattern.pattern
+
+    if workers is None or workers <= 1 or len(files) <= 1:
+        results = [_search_file(file, pattern) for file in files]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_search_file, files, repeat(pattern)))
+
+    hits = [hit for file_hits, _ in results for hit in file_hits]
+    num_cached = sum(cached for _, cached in results)
+    return SearchAllResult(hits, len(files), num_cached)
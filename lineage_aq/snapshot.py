@@ -0,0 +1,488 @@
+"""
+Binary snapshot of a lineage, browsable without loading through memory map.
+
+Layout of the snapshot file (native byte order, recorded in header)
+
+header
+    magic, byteorder, number of persons, number of children and spouse entries,
+    offsets of the sections
+records
+    one fixed width record per person, sorted by id:
+    id, gender, father, mother, start and count of children, start and count of spouses
+    (father, mother, children and spouses are indexes of records, -1 if not present)
+names
+    offsets of the names (number of persons + 1) followed by the utf-8 names
+search names
+    offsets followed by the normalized names (see name_index.normalize) separated by \\0
+children, spouses
+    record indexes, sons before daughters, each sorted by id
+"""
+from __future__ import annotations
+from array import array
+from bisect import bisect_right
+import mmap
+from pathlib import Path
+import re
+import struct
+import sys
+from typing import Iterable, Iterator
+
+from lineage_aq.lineage import (
+    Lineage,
+    Line,
+    Relation,
+    _bidirectional_path,
+    _hop_filter,
+    _layering,
+    _nearest_common_ancestors,
+    _relationship,
+    _shortest_paths,
+    _walk,
+    _within_depth,
+)
+from lineage_aq.name_index import normalize
+
+
+MAGIC = b"LINSNAP1"
+_HEADER = struct.Struct("=8s1sxxxIII6Q")
+_RECORD = struct.Struct("=qcxxxiiIIII")
+_NO_PERSON = -1
+
+
+def save_snapshot(lineage: Lineage, filename: Path | str) -> None:
+    """Write the lineage in the binary snapshot format, to be opened by LineageSnapshot"""
+
+    persons = sorted(lineage.all_persons(), key=lambda person: person.id)
+    index = {person: i for i, person in enumerate(persons)}
+
+    def to_index(person) -> int:
+        return _NO_PERSON if person is None else index[person]
+
+    def offsets_and_blob(strings: list[bytes], separator: bytes) -> tuple[bytes, bytes]:
+        offsets = array("I", [0])
+        for x in strings:
+            offsets.append(offsets[-1] + len(x) + len(separator))
+        return offsets.tobytes(), separator.join(strings) + separator
+
+    records = bytearray()
+    children = array("i")
+    spouses = array("i")
+    for person in persons:
+        person_children = sorted(person.sons, key=lambda p: p.id) + sorted(
+            person.daughters, key=lambda p: p.id
+        )
+        person_spouses = sorted(person.husband + person.wife, key=lambda p: p.id)
+        records += _RECORD.pack(
+            person.id,
+            person.gender.encode(),
+            to_index(person.father),
+            to_index(person.mother),
+            len(children),
+            len(person_children),
+            len(spouses),
+            len(person_spouses),
+        )
+        children.extend(index[child] for child in person_children)
+        spouses.extend(index[spouse] for spouse in person_spouses)
+
+    name_offsets, names = offsets_and_blob(
+        [person.name.encode() for person in persons], b""
+    )
+    search_offsets, search_names = offsets_and_blob(
+        [normalize(person.name).encode() for person in persons], b"\0"
+    )
+
+    sections = [
+        bytes(records),
+        name_offsets + names,
+        search_offsets + search_names,
+        children.tobytes(),
+        spouses.tobytes(),
+    ]
+    offsets = []
+    offset = _HEADER.size
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    offsets.append(offset)
+
+    with open(filename, "wb") as f:
+        f.write(
+            _HEADER.pack(
+                MAGIC,
+                b"l" if sys.byteorder == "little" else b"b",
+                len(persons),
+                len(children),
+                len(spouses),
+                *offsets,
+            )
+        )
+        for section in sections:
+            f.write(section)
+
+
+class SnapshotPerson:
+    """Read-only view of a person in LineageSnapshot. Provides the queries of Person."""
+
+    __slots__ = ("__snapshot", "__index")
+
+    def __init__(self, snapshot: LineageSnapshot, index: int) -> None:
+        self.__snapshot = snapshot
+        self.__index = index
+
+    @property
+    def id(self) -> int:
+        return self.__snapshot._record(self.__index)[0]
+
+    @property
+    def name(self) -> str:
+        return self.__snapshot._name(self.__index)
+
+    @property
+    def gender(self) -> str:
+        return self.__snapshot._record(self.__index)[1].decode()
+
+    def __person(self, index: int) -> SnapshotPerson | None:
+        if index == _NO_PERSON:
+            return None
+        return SnapshotPerson(self.__snapshot, index)
+
+    @property
+    def father(self) -> SnapshotPerson | None:
+        return self.__person(self.__snapshot._record(self.__index)[2])
+
+    @property
+    def mother(self) -> SnapshotPerson | None:
+        return self.__person(self.__snapshot._record(self.__index)[3])
+
+    @property
+    def parents(self) -> list[SnapshotPerson]:
+        return [p for p in (self.father, self.mother) if p is not None]
+
+    @property
+    def children(self) -> list[SnapshotPerson]:
+        return [
+            SnapshotPerson(self.__snapshot, i)
+            for i in self.__snapshot._children(self.__index)
+        ]
+
+    @property
+    def sons(self) -> list[SnapshotPerson]:
+        return [child for child in self.children if child.gender == "m"]
+
+    @property
+    def daughters(self) -> list[SnapshotPerson]:
+        return [child for child in self.children if child.gender == "f"]
+
+    def __spouses(self) -> list[SnapshotPerson]:
+        return [
+            SnapshotPerson(self.__snapshot, i)
+            for i in self.__snapshot._spouses(self.__index)
+        ]
+
+    @property
+    def husband(self) -> list[SnapshotPerson]:
+        return self.__spouses() if self.gender == "f" else []
+
+    @property
+    def wife(self) -> list[SnapshotPerson]:
+        return self.__spouses() if self.gender == "m" else []
+
+    @property
+    def generation(self) -> int:
+        return self.__snapshot._generations()[self]
+
+    def relation_with(self, relative: SnapshotPerson) -> Relation | None:
+        for relation, relatives in self.relatives_dict().items():
+            if relative in relatives:
+                return relation
+        return None
+
+    def relatives_dict(self) -> dict[Relation, list[SnapshotPerson]]:
+        """Relatives grouped by their relation. Only the present relations are included."""
+
+        relatives = {
+            Relation.FATHER: [self.father] if self.father else [],
+            Relation.MOTHER: [self.mother] if self.mother else [],
+            Relation.SON: self.sons,
+            Relation.DAUGHTER: self.daughters,
+            Relation.HUSBAND: self.husband,
+            Relation.WIFE: self.wife,
+        }
+        return {relation: persons for relation, persons in relatives.items() if persons}
+
+    def _relatives(self) -> Iterator[tuple[SnapshotPerson, Relation]]:
+        """Iterate over the relatives along with their relation, same as Person"""
+
+        for relation, relatives in self.relatives_dict().items():
+            for relative in relatives:
+                yield relative, relation
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, SnapshotPerson)
+            and self.__snapshot is other.__snapshot
+            and self.__index == other.__index
+        )
+
+    def __hash__(self) -> int:
+        return hash(self.__index)
+
+    def __repr__(self) -> str:
+        return f"P{self.id}({self.name})"
+
+
+class LineageSnapshot:
+    """
+    Read-only lineage backed by a memory mapped snapshot file (see save_snapshot).
+
+    Nothing is loaded on opening, the queries are answered directly from the mapped file.
+    """
+
+    def __init__(self, filename: Path | str) -> None:
+        with open(filename, "rb") as f:
+            self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            byteorder,
+            self.__num_persons,
+            num_children,
+            num_spouses,
+            *offsets,
+        ) = _HEADER.unpack_from(self.__mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a lineage snapshot")
+        if byteorder != (b"l" if sys.byteorder == "little" else b"b"):
+            raise ValueError(f"{filename} is saved with different byte order")
+
+        records, names, search_names, children, spouses, end = offsets
+        n = self.__num_persons
+        view = memoryview(self.__mmap)
+        self.__records = records
+        self.__name_offsets = view[names : names + 4 * (n + 1)].cast("I")
+        self.__names = names + 4 * (n + 1)
+        self.__search_offsets = view[search_names : search_names + 4 * (n + 1)].cast(
+            "I"
+        )
+        self.__search_names = search_names + 4 * (n + 1)
+        self.__children = view[children : children + 4 * num_children].cast("i")
+        self.__spouses = view[spouses : spouses + 4 * num_spouses].cast("i")
+        self.__generations: dict[SnapshotPerson, int] | None = None
+
+    def close(self) -> None:
+        for view in (
+            self.__name_offsets,
+            self.__search_offsets,
+            self.__children,
+            self.__spouses,
+        ):
+            view.release()
+        self.__mmap.close()
+
+    def __enter__(self) -> LineageSnapshot:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def _record(self, index: int) -> tuple:
+        return _RECORD.unpack_from(self.__mmap, self.__records + index * _RECORD.size)
+
+    def _name(self, index: int) -> str:
+        start = self.__names + self.__name_offsets[index]
+        end = self.__names + self.__name_offsets[index + 1]
+        return self.__mmap[start:end].decode()
+
+    def _children(self, index: int) -> memoryview:
+        _, _, _, _, start, count, _, _ = self._record(index)
+        return self.__children[start : start + count]
+
+    def _spouses(self, index: int) -> memoryview:
+        _, _, _, _, _, _, start, count = self._record(index)
+        return self.__spouses[start : start + count]
+
+    def __len__(self) -> int:
+        return self.__num_persons
+
+    @property
+    def revision(self) -> int:
+        """Same as Lineage.revision, which never changes for the snapshot"""
+
+        return 0
+
+    def _generations(self) -> dict[SnapshotPerson, int]:
+        # Snapshot does not change, so layering is done once when first needed
+        if self.__generations is None:
+            self.__generations = _layering(self.all_persons())
+        return self.__generations
+
+    def generation(self, n: int) -> list[SnapshotPerson]:
+        """Persons of the generation n, sorted by id"""
+
+        found = [person for person, g in self._generations().items() if g == n]
+        return sorted(found, key=lambda person: person.id)
+
+    def find_person_by_id(self, id: int) -> SnapshotPerson | None:
+        # Binary search, since records are sorted by id
+        low, high = 0, self.__num_persons
+        while low < high:
+            mid = (low + high) // 2
+            mid_id = self._record(mid)[0]
+            if mid_id == id:
+                return SnapshotPerson(self, mid)
+            if mid_id < id:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    def __search(self, term: str) -> Iterator[int]:
+        """Indexes of persons whose normalized name contains the normalized term"""
+
+        term = normalize(term).encode()
+        start = self.__search_names
+        end = start + self.__search_offsets[self.__num_persons]
+        found = self.__mmap.find(term, start, end)
+        while found >= 0:
+            # Since names are separated by \0, match can't span two names
+            index = bisect_right(self.__search_offsets, found - start) - 1
+            yield index
+            found = self.__mmap.find(
+                term, start + self.__search_offsets[index + 1], end
+            )
+
+    def find_person_by_name(self, name: str) -> list[SnapshotPerson]:
+        name = name.lower()
+        found = []
+        for index in self.__search(name):
+            person = SnapshotPerson(self, index)
+            if name in person.name.lower():
+                found.append(person)
+        return found
+
+    def search_names(self, terms) -> list[SnapshotPerson]:
+        """
+        Return the persons whose name contains any of the terms.
+        Case and spaces are ignored in both name and terms.
+        """
+
+        found = set()
+        for term in terms:
+            found.update(self.__search(term))
+        return [SnapshotPerson(self, index) for index in sorted(found)]
+
+    def match_names(
+        self, pattern: re.Pattern, required: Iterable[Iterable[str]] = ()
+    ) -> list[SnapshotPerson]:
+        """
+        Same as Lineage.match_names. The pattern is run over the normalized names in the
+        file in a single pass, so required is not needed.
+        """
+
+        # Pattern is compiled for the bytes, it has no \0 so a match can't span two names
+        pattern = re.compile(pattern.pattern.encode())
+        start = self.__search_names
+        end = start + self.__search_offsets[self.__num_persons]
+        found = []
+        match = pattern.search(self.__mmap, start, end)
+        while match:
+            index = bisect_right(self.__search_offsets, match.start() - start) - 1
+            found.append(index)
+            match = pattern.search(
+                self.__mmap, start + self.__search_offsets[index + 1], end
+            )
+        return [SnapshotPerson(self, index) for index in found]
+
+    def all_persons(self) -> list[SnapshotPerson]:
+        return [SnapshotPerson(self, index) for index in range(self.__num_persons)]
+
+    def all_relations(self) -> list[(SnapshotPerson, SnapshotPerson, Relation)]:
+        relations = []
+        for p1 in self.all_persons():
+            for relation, relatives in p1.relatives_dict().items():
+                for p2 in relatives:
+                    relations.append((p1, p2, relation))
+        return relations
+
+    def ancestors(
+        self,
+        person: SnapshotPerson,
+        depth: int | None = None,
+        line: Line = Line.ALL,
+        lazy: bool = False,
+    ) -> list[SnapshotPerson] | Iterator[SnapshotPerson]:
+        """Same as Lineage.ancestors, but nothing is cached"""
+
+        found = _within_depth(_walk(person, True, line), depth)
+        return found if lazy else list(found)
+
+    def descendants(
+        self,
+        person: SnapshotPerson,
+        depth: int | None = None,
+        line: Line = Line.ALL,
+        lazy: bool = False,
+    ) -> list[SnapshotPerson] | Iterator[SnapshotPerson]:
+        """Same as Lineage.descendants, but nothing is cached"""
+
+        found = _within_depth(_walk(person, False, line), depth)
+        return found if lazy else list(found)
+
+    @staticmethod
+    def __ancestor_depths(person: SnapshotPerson) -> dict[SnapshotPerson, int]:
+        depths = {person: 0}
+        depths.update(_walk(person, True, Line.ALL))
+        return depths
+
+    def common_ancestors(
+        self, person1: SnapshotPerson, person2: SnapshotPerson
+    ) -> list[SnapshotPerson]:
+        """Same as Lineage.common_ancestors, but nothing is cached"""
+
+        return _nearest_common_ancestors(
+            self.__ancestor_depths(person1),
+            self.__ancestor_depths(person2),
+        )
+
+    def relationship(
+        self, person: SnapshotPerson, relative: SnapshotPerson
+    ) -> str | None:
+        """Same as Lineage.relationship"""
+
+        if person == relative:
+            return "self"
+
+        common = self.common_ancestors(person, relative)
+        if not common:
+            return None
+        return _relationship(
+            person,
+            relative,
+            self.__ancestor_depths(person)[common[0]],
+            self.__ancestor_depths(relative)[common[0]],
+        )
+
+    def shortest_path(
+        self,
+        start: SnapshotPerson,
+        stop: SnapshotPerson,
+        relations: Iterable[Relation] | None = None,
+        line: Line = Line.ALL,
+    ) -> list[SnapshotPerson]:
+        """Same as Lineage.shortest_path"""
+
+        path = _bidirectional_path(start, stop, _hop_filter(relations, line))
+        if path is None:
+            raise ValueError(f"No path between {start} and {stop}")
+        return [person for person, _ in path]
+
+    def shortest_paths(
+        self,
+        pairs: Iterable[tuple[SnapshotPerson, SnapshotPerson]],
+        relations: Iterable[Relation] | None = None,
+        line: Line = Line.ALL,
+    ) -> list[list[tuple[SnapshotPerson, Relation | None]] | None]:
+        """Same as Lineage.shortest_paths"""
+
+        return _shortest_paths(pairs, relations, line)
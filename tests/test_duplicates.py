@@ -0,0 +1,67 @@
+from lineage_aq import Lineage
+from lineage_aq.duplicates import DuplicateIndex
+from tests.test_lineage import factory
+
+
+def canonical(word: str) -> str:
+    return word.replace("ee", "i")
+
+
+def test_find_same_name():
+    lineage, father, mother, child = factory()
+    hadees = lineage.add_person("Hadees Khan", "m")
+    index = DuplicateIndex(canonical)
+    lineage.attach_index(index)
+
+    assert index.find("Hadis") == [hadees]
+    assert index.find("hadis khan") == [hadees]
+    assert index.find("Other") == []
+    assert index.find("child") == [child]
+
+    child.name = "Hadis"
+    assert index.find("Hadis") == [child, hadees]
+    lineage.remove_person(hadees)
+    assert index.find("Hadees Khan") == [child]
+
+
+def test_duplicates():
+    lineage, father, mother, child = factory()
+    copy = lineage.add_person("CHILD", "m")
+    father.add_child(copy)
+    lineage.add_person("Child", "f")
+
+    index = DuplicateIndex(canonical)
+    lineage.attach_index(index)
+    duplicates = index.all_duplicates()
+    assert [(d.person1, d.person2) for d in duplicates] == [(child, copy)]
+    # Same name and same father
+    assert duplicates[0].score == 2.0
+    assert index.duplicates_of(copy)[0].person2 == child
+
+
+def test_spelling_version():
+    lineage, father, mother, child = factory()
+    version = 0
+    spells = {}
+
+    index = DuplicateIndex(lambda word: spells.get(word, word), lambda: version)
+    lineage.attach_index(index)
+    assert index.find("kid") == []
+
+    spells["child"] = "kid"
+    version += 1
+    assert index.find("kid") == [child]
+
+
+def test_find_common_first_name():
+    lineage = Lineage()
+    for n in range(20):
+        lineage.add_person(f"Ali Son{n}", "m")
+    ali = lineage.add_person("Ali", "m")
+    index = DuplicateIndex(canonical)
+    lineage.attach_index(index)
+
+    assert index.find("Ali") == [ali]
+    # Whole name without spaces still matches the single word name
+    hasanali = lineage.add_person("Hasanali", "m")
+    assert index.find("Hasan Ali") == [hasanali]
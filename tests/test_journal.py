@@ -0,0 +1,121 @@
+from os import remove
+from pathlib import Path
+from lineage_aq import Journal, Lineage
+from lineage_aq.journal import num_entries
+from lineage_aq.metadata import metadata_path, read_metadata
+from tests.test_lineage import factory
+
+
+def snapshot_of(lineage: Lineage):
+    persons = sorted((p.id, p.name, p.gender) for p in lineage.all_persons())
+    relations = sorted(
+        (p1.id, p2.id, relation.name) for p1, p2, relation in lineage.all_relations()
+    )
+    return persons, relations
+
+
+def make_changes(lineage: Lineage, father, mother, child):
+    son = lineage.add_person("Son", "m")
+    father.add_child(son)
+    mother.add_child(son)
+    child.name = "First Child"
+    lineage.add_person("Temporary", "f")
+    lineage.remove_person(lineage.find_person_by_name("temporary")[0])
+    father.remove_relative(child)
+    son.self_remove()
+
+
+def test_replay_journal():
+    lineage, father, mother, child = factory()
+    filename = "test_journal_lineage.json"
+    lineage.save_to_file(filename)
+
+    journal = Journal(filename)
+    lineage.attach_journal(journal)
+    make_changes(lineage, father, mother, child)
+    journal.close()
+
+    new_lineage = Lineage.load_from_file(filename)
+    assert Journal(filename).replay(new_lineage) == len(journal)
+    assert snapshot_of(new_lineage) == snapshot_of(lineage)
+
+    # ID of new person must not clash with removed persons
+    assert new_lineage.add_person("New", "m").id == lineage.add_person("New", "m").id
+
+    remove(journal.path)
+    remove(filename)
+    remove(metadata_path(filename))
+
+
+def test_replay_partial_entry():
+    lineage, father, mother, child = factory()
+    filename = "test_journal_lineage.json"
+    lineage.save_to_file(filename)
+
+    journal = Journal(filename)
+    lineage.attach_journal(journal)
+    child.name = "Renamed"
+    journal.close()
+    with open(journal.path, "a") as f:
+        f.write('["name",0,"Par')
+
+    new_lineage = Lineage.load_from_file(filename)
+    assert Journal(filename).replay(new_lineage) == 1
+    assert snapshot_of(new_lineage) == snapshot_of(lineage)
+    with open(journal.path) as f:
+        assert f.read().endswith("]\n")
+
+    remove(journal.path)
+    remove(filename)
+    remove(metadata_path(filename))
+
+
+def test_compact_journal():
+    lineage, father, mother, child = factory()
+    filename = "test_journal_lineage.json"
+    lineage.save_to_file(filename)
+
+    journal = Journal(filename)
+    lineage.attach_journal(journal)
+    make_changes(lineage, father, mother, child)
+    journal.compact(lineage)
+    assert len(journal) == 0
+    assert not journal.path.exists()
+    assert read_metadata(Path(filename))["persons"] == len(lineage.all_persons())
+
+    new_lineage = Lineage.load_from_file(filename)
+    assert Journal(filename).replay(new_lineage) == 0
+    assert snapshot_of(new_lineage) == snapshot_of(lineage)
+
+    remove(filename)
+    remove(metadata_path(filename))
+
+
+def test_discard_uncommitted(tmp_path):
+    lineage, father, mother, child = factory()
+    filename = tmp_path / "lineage.json"
+    lineage.save_to_file(filename)
+
+    journal = Journal(filename)
+    lineage.attach_journal(journal)
+    lineage.add_person("Saved", "m")
+    journal.commit()
+    child.name = "Unsaved"
+    lineage.add_person("Unsaved", "f")
+    journal.discard()
+    assert len(journal) == 1
+    assert num_entries(filename) == 1
+
+    new_lineage = Lineage.load_from_file(filename)
+    assert Journal(filename).replay(new_lineage) == 1
+    assert new_lineage.find_person_by_name("saved") != []
+    assert new_lineage.find_person_by_name("unsaved") == []
+
+    # Nothing committed, so the journal is removed
+    journal = Journal(filename)
+    journal.replay(Lineage.load_from_file(filename))
+    journal.compact(new_lineage)
+    new_lineage.attach_journal(journal)
+    new_lineage.add_person("Unsaved", "f")
+    journal.discard()
+    assert not journal.path.exists()
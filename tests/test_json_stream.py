@@ -0,0 +1,45 @@
+import io
+import json
+from lineage_aq.json_stream import dump_rows, iter_rows
+
+
+def test_dump_rows_is_json():
+    f = io.StringIO()
+    dump_rows(f, {"a": ["x"]}, {"a": iter([[1, "Pé"], [2, "Q"]]), "b": []})
+
+    assert json.loads(f.getvalue()) == {
+        "headers": {"a": ["x"]},
+        "a": [[1, "Pé"], [2, "Q"]],
+        "b": [],
+    }
+
+
+def test_iter_rows_small_chunks():
+    data = {
+        "headers": {"persons": ["id"], "relations": ["id1"]},
+        "version": 12345,
+        "persons": [[0, "Father", "m"], [123456, "Mo ther", "f"]],
+        "empty": [],
+        "relations": [[0, 123456, "WIFE"]],
+    }
+
+    for indent in (None, 0, 2):
+        text = json.dumps(data, indent=indent)
+        for chunk_size in range(1, 10):
+            rows = list(iter_rows(io.StringIO(text), chunk_size))
+            assert rows == [
+                ("persons", [0, "Father", "m"]),
+                ("persons", [123456, "Mo ther", "f"]),
+                ("relations", [0, 123456, "WIFE"]),
+            ]
+
+
+def test_iter_rows_invalid():
+    error_raised = False
+    try:
+        # This must raise exception
+        list(iter_rows(io.StringIO('{"persons":[[0,"A","m"]')))
+    except ValueError:
+        error_raised = True
+
+    assert error_raised
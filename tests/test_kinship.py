@@ -0,0 +1,62 @@
+import pytest
+from lineage_aq import Lineage
+from tests.test_lineage import factory
+
+
+def close(x, y):
+    return abs(x - y) < 1e-12
+
+
+def test_kinship_matrix():
+    lineage, father, mother, child = factory()
+    daughter = lineage.add_person("Daughter", "f")
+    father.add_child(daughter)
+    mother.add_child(daughter)
+    stranger = lineage.add_person("Stranger", "m")
+
+    matrix = lineage.kinship_matrix([father, child, daughter, stranger])
+    assert close(matrix[0][0], 0.5)
+    assert close(matrix[0][1], 0.25)
+    assert close(matrix[1][2], 0.25)
+    assert close(matrix[2][1], 0.25)
+    assert close(matrix[1][3], 0)
+    assert close(matrix[0][3], 0)
+
+
+def test_inbreeding_coefficients():
+    lineage = Lineage()
+    father = lineage.add_person("Father", "m")
+    mother = lineage.add_person("Mother", "f")
+    father.add_spouse(mother)
+    son = lineage.add_person("Son", "m")
+    daughter = lineage.add_person("Daughter", "f")
+    for child in (son, daughter):
+        father.add_child(child)
+        mother.add_child(child)
+
+    # Offspring of full siblings
+    son.add_spouse(daughter)
+    grandchild = lineage.add_person("Grandchild", "m")
+    son.add_child(grandchild)
+    daughter.add_child(grandchild)
+
+    coefficients = lineage.inbreeding_coefficients()
+    assert set(coefficients) == set(lineage.all_persons())
+    assert close(coefficients[grandchild], 0.25)
+    assert close(coefficients[son], 0)
+    assert close(lineage.kinship_matrix([grandchild])[0][0], 0.625)
+
+
+def test_parent_cycle():
+    lineage = Lineage()
+    a = lineage.add_person("A", "m")
+    b = lineage.add_person("B", "m")
+    c = lineage.add_person("C", "m")
+    a.add_child(b)
+    b.add_child(c)
+    c.add_child(a)
+
+    with pytest.raises(ValueError, match="ancestors of themselves"):
+        lineage.inbreeding_coefficients()
+    with pytest.raises(ValueError, match="ancestors of themselves"):
+        lineage.kinship_matrix([b])
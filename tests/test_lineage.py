@@ -1,5 +1,8 @@
+import json
+from os import remove
 import string
-from lineage_aq import Lineage, Person, Relation
+from lineage_aq import Lineage, Person, Relation, Line, BLOOD_RELATIONS
+from lineage_aq.metadata import metadata_path
 
 
 def factory():
@@ -395,6 +398,7 @@ def test_save_and_load_file():
     from os import remove
 
     remove(filename)
+    remove(metadata_path(filename))
 
 
 def test_find_by_id():
@@ -410,3 +414,556 @@ def test_find_by_name():
     assert lineage.find_person_by_name("AthEr")[0] == father
     assert lineage.find_person_by_name("oTheR")[0] == mother
     assert lineage.find_person_by_name("ild")[0] == child
+
+
+def test_find_by_ids():
+    lineage, father, mother, child = factory()
+    assert lineage.find_persons_by_ids([child.id, father.id]) == [child, father]
+    assert lineage.find_persons_by_ids([mother.id, 1000]) == [mother, None]
+
+    lineage.remove_person(child)
+    assert lineage.find_person_by_id(child.id) is None
+
+
+def test_find_by_name_after_edit():
+    lineage, father, mother, child = factory()
+    child.name = "Grand Child"
+    assert lineage.find_person_by_name("ild") == [child]
+    assert lineage.find_person_by_name("grand c") == [child]
+
+    father.name = "Dad"
+    assert lineage.find_person_by_name("father") == []
+    assert lineage.find_person_by_name("da") == [father]
+
+    lineage.remove_person(mother)
+    assert lineage.find_person_by_name("mother") == []
+
+
+def test_search_names():
+    lineage, father, mother, child = factory()
+    assert lineage.search_names(["MoTh", "chi"]) == [mother, child]
+    assert lineage.search_names(["the r"]) == [father, mother]
+    assert lineage.search_names(["none"]) == []
+
+
+def test_relatives_order():
+    lineage, father, mother, child = factory()
+    daughter = lineage.add_person("Daughter", "f")
+    son = lineage.add_person("Son", "m")
+    mother.add_child(daughter)
+    mother.add_child(son)
+
+    assert mother.children == [child, son, daughter]
+    assert mother.sons == [child, son]
+    assert mother.daughters == [daughter]
+    assert daughter.parents == [mother]
+    father.add_child(daughter)
+    assert daughter.parents == [father, mother]
+
+
+def test_relation_gender_mismatch():
+    lineage, father, mother, _ = factory()
+    person = lineage.add_person("Person", "m")
+
+    error_raised = False
+    try:
+        # This must raise exception
+        person._add_relation(mother, Relation.FATHER)
+    except Exception:
+        error_raised = True
+
+    assert error_raised
+    assert person.relation_with(mother) is None
+
+
+def test_shortest_path_not_present():
+    lineage, father, _, _ = factory()
+    person = lineage.add_person("Person", "m")
+
+    error_raised = False
+    try:
+        # This must raise exception
+        lineage.shortest_path(father, person)
+    except Exception:
+        error_raised = True
+
+    assert error_raised
+
+
+def test_unique_relations():
+    lineage, _, _, _ = factory()
+    assert len(lineage.all_relations()) == 6
+    assert len(lineage.all_unique_relations()) == 3
+
+
+def test_load_indented_file():
+    lineage, father, mother, child = factory()
+
+    filename = "test_lineage_indented.json"
+    with open(filename, "w") as f:
+        json.dump(
+            {
+                "headers": {},
+                "persons": [[p.id, p.name, p.gender] for p in lineage.all_persons()],
+                "relations": [
+                    [p1.id, p2.id, r.name] for p1, p2, r in lineage.all_relations()
+                ],
+            },
+            f,
+            indent=0,
+            separators=(",", ":"),
+        )
+
+    new_lineage = Lineage.load_from_file(filename)
+    remove(filename)
+
+    assert len(new_lineage.all_persons()) == 3
+    assert len(new_lineage.all_relations()) == 6
+    assert new_lineage.find_person_by_id(child.id).father.name == father.name
+
+
+def test_bulk_add():
+    lineage = Lineage()
+    issues = lineage.bulk_add_persons(
+        [0, 1, 2, 3, 3, 4],
+        ["F", "M", "C", "X", "Dup", "Y"],
+        ["m", "f", "m", "m", "m", "x"],
+    )
+    assert [issue.id1 for issue in issues] == [3, 4]
+
+    issues = lineage.bulk_add_relations(
+        [2, 0, 2, 1, 0, 1, 2, 3, 0, 0, 5, 1, 2],
+        [0, 2, 1, 2, 1, 0, 3, 2, 1, 3, 0, 3, 2],
+        [
+            # Valid parents
+            "FATHER",
+            "SON",
+            "MOTHER",
+            "SON",
+            # Valid spouse
+            "WIFE",
+            "HUSBAND",
+            # Second father
+            "FATHER",
+            "SON",
+            Relation.WIFE,  # Duplicate
+            "WIFE",  # Wrong gender and no reciprocal
+            "SON",  # ID not present
+            "HUSBAND",  # No reciprocal
+            "BROTHER",  # Unknown
+        ],
+    )
+    assert sorted((issue.id1, issue.id2) for issue in issues) == [
+        (0, 1),
+        (0, 3),
+        (1, 3),
+        (2, 2),
+        (2, 3),
+        (3, 2),
+        (5, 0),
+    ]
+
+    father, mother, child, other = lineage.find_persons_by_ids([0, 1, 2, 3])
+    assert child.father is father
+    assert child.mother is mother
+    assert father.children == [child]
+    assert father.wife == [mother]
+    assert mother.husband == [father]
+    assert other.relatives_dict() == {}
+    assert len(lineage.all_relations()) == 6
+
+
+def test_bulk_add_rejected_reciprocal():
+    lineage = Lineage()
+    lineage.bulk_add_persons([0, 1], ["P", "C"], ["m", "f"])
+    # P -> C is both DAUGHTER and WIFE, so both are rejected, and then C -> P FATHER
+    # is left without its reciprocal
+    issues = lineage.bulk_add_relations(
+        [1, 0, 0], [0, 1, 1], ["FATHER", "DAUGHTER", "WIFE"]
+    )
+    assert sorted((issue.id1, issue.id2, issue.reason) for issue in issues) == [
+        (0, 1, "Relation is already present"),
+        (0, 1, "Relation is already present"),
+        (1, 0, "Reciprocal relation is not present"),
+    ]
+    assert lineage.all_relations() == []
+    assert lineage.validate() == []
+
+
+def test_bulk_add_same_gender_spouses():
+    lineage = Lineage()
+    lineage.bulk_add_persons([0, 1], ["A", "B"], ["f", "f"])
+    issues = lineage.bulk_add_relations([0, 1], [1, 0], ["WIFE", "WIFE"])
+    assert sorted((issue.id1, issue.id2, issue.reason) for issue in issues) == [
+        (0, 1, "Gender does not match the relation"),
+        (1, 0, "Gender does not match the relation"),
+    ]
+    assert lineage.all_relations() == []
+
+
+def test_load_reports_issues():
+    lineage, father, mother, child = factory()
+
+    filename = "test_lineage_issues.json"
+    with open(filename, "w") as f:
+        json.dump(
+            {
+                "persons": [[p.id, p.name, p.gender] for p in lineage.all_persons()]
+                + [["x", "Invalid", "m"]],
+                "relations": [
+                    [p1.id, p2.id, r.name] for p1, p2, r in lineage.all_relations()
+                ]
+                + [[child.id, mother.id, "MOTHER"], [child.id, father.id]],
+            },
+            f,
+        )
+
+    issues = []
+    new_lineage = Lineage.load_from_file(filename, issues)
+    remove(filename)
+
+    assert len(issues) == 3
+    assert len(new_lineage.all_persons()) == 3
+    assert len(new_lineage.all_relations()) == 6
+
+
+def test_ancestors_and_descendants():
+    lineage, father, mother, child = factory()
+    grandfather = lineage.add_person("Grandfather", "m")
+    grandmother = lineage.add_person("Grandmother", "f")
+    grandchild = lineage.add_person("Grandchild", "f")
+    father.add_parent(grandfather)
+    mother.add_parent(grandmother)
+    child.add_child(grandchild)
+
+    assert lineage.ancestors(grandchild)[:1] == [child]
+    assert set(lineage.ancestors(grandchild)) == {
+        child,
+        father,
+        mother,
+        grandfather,
+        grandmother,
+    }
+    assert set(lineage.ancestors(grandchild, depth=2)) == {child, father, mother}
+    assert lineage.ancestors(grandchild, line=Line.PATERNAL) == [
+        child,
+        father,
+        grandfather,
+    ]
+    assert lineage.ancestors(child, line=Line.MATERNAL) == [mother, grandmother]
+    assert list(lineage.ancestors(grandchild, line=Line.PATERNAL, lazy=True)) == [
+        child,
+        father,
+        grandfather,
+    ]
+
+    assert lineage.descendants(grandfather) == [father, child, grandchild]
+    assert lineage.descendants(grandmother, line=Line.PATERNAL) == []
+    assert lineage.descendants(grandmother, line=Line.MATERNAL) == [mother, child]
+    assert lineage.descendants(grandfather, depth=1) == [father]
+
+
+def test_ancestors_cache_invalidation():
+    lineage, father, mother, child = factory()
+    assert lineage.ancestors(child) == [father, mother]
+    assert lineage.descendants(father) == [child]
+
+    grandfather = lineage.add_person("Grandfather", "m")
+    grandfather.add_child(father)
+    assert lineage.ancestors(child) == [father, mother, grandfather]
+    assert lineage.descendants(grandfather) == [father, child]
+
+    grandchild = lineage.add_person("Grandchild", "m")
+    child.add_child(grandchild)
+    assert lineage.descendants(grandfather) == [father, child, grandchild]
+
+    father.remove_relative(child)
+    assert lineage.ancestors(child) == [mother]
+    assert lineage.descendants(grandfather) == [father]
+
+    mother.self_remove()
+    assert lineage.ancestors(grandchild) == [child]
+
+
+def test_relationship():
+    lineage, father, mother, child = factory()
+    daughter = lineage.add_person("Daughter", "f")
+    father.add_child(daughter)
+    mother.add_child(daughter)
+    grandson = lineage.add_person("Grandson", "m")
+    child.add_child(grandson)
+    granddaughter = lineage.add_person("Granddaughter", "f")
+    daughter.add_child(granddaughter)
+    great_grandson = lineage.add_person("Great grandson", "m")
+    grandson.add_child(great_grandson)
+    stranger = lineage.add_person("Stranger", "m")
+
+    assert lineage.common_ancestors(grandson, granddaughter) == [father, mother]
+    assert lineage.common_ancestors(child, grandson) == [child]
+    assert lineage.common_ancestors(child, stranger) == []
+    # Child of cousins, whose grandparents are also ancestors of the nearer ones
+    cousins_child = lineage.add_person("Cousins child", "f")
+    grandson.add_spouse(granddaughter)
+    grandson.add_child(cousins_child)
+    granddaughter.add_child(cousins_child)
+    assert lineage.common_ancestors(cousins_child, daughter) == [daughter]
+    assert lineage.common_ancestors(cousins_child, great_grandson) == [grandson]
+
+    assert lineage.relationship(child, child) == "self"
+    assert lineage.relationship(child, father) == "father"
+    assert lineage.relationship(great_grandson, father) == "great-grandfather"
+    assert lineage.relationship(father, granddaughter) == "granddaughter"
+    assert lineage.relationship(child, daughter) == "sister"
+    assert lineage.relationship(grandson, daughter) == "aunt"
+    assert lineage.relationship(daughter, great_grandson) == "great-nephew"
+    assert lineage.relationship(grandson, granddaughter) == "first cousin"
+    assert (
+        lineage.relationship(granddaughter, great_grandson)
+        == "first cousin once removed"
+    )
+    assert lineage.relationship(child, stranger) is None
+
+    half_sister = lineage.add_person("Half sister", "f")
+    father.add_child(half_sister)
+    other_mother = lineage.add_person("Other mother", "f")
+    father.add_spouse(other_mother)
+    other_mother.add_child(half_sister)
+    assert lineage.relationship(child, half_sister) == "half-sister"
+
+
+def test_shortest_path_filters():
+    lineage, father, mother, child = factory()
+    stepchild = lineage.add_person("Stepchild", "f")
+    mother.add_child(stepchild)
+
+    assert lineage.shortest_path(child, stepchild) == [child, mother, stepchild]
+    assert lineage.shortest_path(child, father, relations=BLOOD_RELATIONS) == [
+        child,
+        father,
+    ]
+    assert lineage.shortest_path(father, stepchild) == [father, mother, stepchild]
+    path = lineage.shortest_path(stepchild, child, line=Line.MATERNAL)
+    assert path == [stepchild, mother, child]
+
+    wife = lineage.add_person("Wife", "f")
+    child.add_spouse(wife)
+    error_raised = False
+    try:
+        lineage.shortest_path(father, wife, relations=BLOOD_RELATIONS)
+    except ValueError:
+        error_raised = True
+    assert error_raised
+
+    error_raised = False
+    try:
+        lineage.shortest_path(child, stepchild, line=Line.PATERNAL)
+    except ValueError:
+        error_raised = True
+    assert error_raised
+
+
+def test_shortest_paths():
+    lineage, father, mother, child = factory()
+    person = lineage.add_person("Person", "m")
+
+    paths = lineage.shortest_paths(
+        [(child, mother), (child, father), (father, child), (child, person)]
+    )
+    assert paths[0] == [(child, None), (mother, Relation.MOTHER)]
+    assert paths[1] == [(child, None), (father, Relation.FATHER)]
+    assert paths[2] == [(father, None), (child, Relation.SON)]
+    assert paths[3] is None
+
+    path = lineage.shortest_paths(
+        [(father, child)], relations=[Relation.WIFE, Relation.SON]
+    )
+    assert path == [[(father, None), (child, Relation.SON)]]
+
+
+def test_generation():
+    lineage, father, mother, child = factory()
+    assert (father.generation, mother.generation, child.generation) == (0, 0, 1)
+    assert lineage.generation(0) == [father, mother]
+    assert lineage.generation(1) == [child]
+
+    grandfather = lineage.add_person("Grandfather", "m")
+    assert grandfather.generation == 0
+    grandfather.add_child(father)
+    assert (father.generation, child.generation) == (1, 2)
+    assert lineage.generation(0) == [mother, grandfather]
+    assert lineage.generation(2) == [child]
+
+    grandfather.remove_relative(father)
+    assert (father.generation, child.generation) == (0, 1)
+
+    mother.add_parent(grandfather)
+    assert (mother.generation, child.generation) == (1, 2)
+    mother.self_remove()
+    assert child.generation == 1
+    assert lineage.generation(2) == []
+
+
+def test_generation_after_load():
+    lineage, father, mother, child = factory()
+    grandchild = lineage.add_person("Grandchild", "f")
+    child.add_child(grandchild)
+
+    filename = "test_generation_lineage.json"
+    lineage.save_to_file(filename)
+    loaded = Lineage.load_from_file(filename)
+    remove(filename)
+    remove(metadata_path(filename))
+
+    assert [p.id for p in loaded.generation(2)] == [grandchild.id]
+    assert loaded.find_person_by_id(child.id).generation == 1
+
+
+def test_generation_with_parent_cycle():
+    lineage = Lineage()
+    lineage.bulk_add_persons([0, 1, 2, 3], ["A", "B", "C", "D"], ["m", "m", "m", "m"])
+    # A is father of B, B of C and C of A
+    lineage.bulk_add_relations(
+        [1, 0, 2, 1, 0, 2], [0, 1, 1, 2, 2, 0], ["FATHER", "SON"] * 3
+    )
+    a, b, c, d = lineage.find_persons_by_ids([0, 1, 2, 3])
+    # Cycle is broken at A, the earliest by id
+    assert (a.generation, b.generation, c.generation) == (0, 1, 2)
+
+    a.add_child(d)
+    assert d.generation == 1
+    d.add_child(lineage.add_person("E", "m"))
+    assert len(lineage.all_relations()) == 10
+    assert sum(len(lineage.generation(n)) for n in range(10)) == 5
+
+
+def test_validate():
+    lineage, father, mother, child = factory()
+    assert lineage.validate() == []
+
+    # One-sided relation
+    grandchild = lineage.add_person("Grandchild", "m")
+    child.add_child(grandchild)
+    grandchild._remove_from_one_side(child)
+
+    # Parents forming a cycle
+    a = lineage.add_person("A", "m")
+    b = lineage.add_person("B", "m")
+    c = lineage.add_person("C", "m")
+    a.add_child(b)
+    b.add_child(c)
+    c.add_child(a)
+
+    issues = lineage.validate()
+    assert (
+        "Reciprocal relation is not present",
+        child.id,
+        grandchild.id,
+        Relation.SON,
+    ) in issues
+    assert ("Person is own ancestor", a.id, None, None) in issues
+    assert ("Person is own ancestor", c.id, None, None) in issues
+    assert len(issues) == 4
+    assert lineage.validate(workers=2) == issues
+
+
+def test_merge():
+    lineage, father, mother, child = factory()
+
+    other = Lineage()
+    father_b = other.add_person("father", "m")
+    mother_b = other.add_person("Mother", "f")
+    child_b = other.add_person("Child", "m")
+    daughter_b = other.add_person("Daughter", "f")
+    grandfather_b = other.add_person("Grandfather", "m")
+    father_b.add_spouse(mother_b)
+    for person in (child_b, daughter_b):
+        father_b.add_child(person)
+        mother_b.add_child(person)
+    grandfather_b.add_child(father_b)
+
+    report = lineage.merge(other)
+    assert report.matched == {father_b: father, mother_b: mother, child_b: child}
+    assert [p.name for p in report.added] == ["Daughter", "Grandfather"]
+    assert report.conflicts == []
+
+    daughter, grandfather = report.added
+    assert father.father == grandfather
+    assert set(mother.children) == {child, daughter}
+    assert len(lineage.all_persons()) == 5
+    assert lineage.validate() == []
+
+
+def test_merge_conflicts():
+    lineage, father, mother, child = factory()
+    lineage.add_person("Child", "m")
+
+    other = Lineage()
+    child_b = other.add_person("Child", "m")
+    other_father = other.add_person("Other Father", "m")
+    other_father.add_child(child_b)
+
+    report = lineage.merge(other)
+    # Neither child has a relative with a common name
+    assert child_b not in report.matched
+    assert len(report.added) == 2
+
+    other = Lineage()
+    child_b = other.add_person("Child", "m")
+    father_b = other.add_person("Father", "m")
+    other_mother = other.add_person("Other Mother", "f")
+    father_b.add_spouse(other_mother)
+    father_b.add_child(child_b)
+    other_mother.add_child(child_b)
+
+    report = lineage.merge(other)
+    assert report.matched[child_b] == child
+    assert ("Can't have multiple father or mother values", child.id) in [
+        issue[:2] for issue in report.conflicts
+    ]
+    assert child.mother == mother
+
+
+def test_merge_same_named_siblings():
+    def build():
+        lineage, father, mother, child = factory()
+        hasans = [lineage.add_person("Hasan", "m") for _ in range(2)]
+        for hasan in hasans:
+            father.add_child(hasan)
+            mother.add_child(hasan)
+            # Children named same are told apart once their fathers are matched
+            hasan.add_child(lineage.add_person("Ali", "m"))
+        return lineage
+
+    lineage = build()
+    other = build()
+    report = lineage.merge(other)
+    assert report.added == []
+    assert report.conflicts == []
+    assert {p.id: m.id for p, m in report.matched.items()} == {
+        p.id: p.id for p in other.all_persons()
+    }
+    assert len(lineage.all_relations()) == len(other.all_relations())
+
+
+def test_revision():
+    lineage, father, mother, child = factory()
+    revisions = [lineage.revision]
+
+    def changed():
+        revisions.append(lineage.revision)
+        return revisions[-1] != revisions[-2]
+
+    other = lineage.add_person("Other", "f")
+    assert changed()
+    other.name = "Another"
+    assert changed()
+    child.add_spouse(other)
+    assert changed()
+    child.remove_relative(other)
+    assert changed()
+    lineage.find_person_by_name("child")
+    assert not changed()
+    lineage.bulk_add_relations([child.id], [other.id], ["WIFE"])
+    assert changed()
+    other.self_remove()
+    assert changed()
@@ -0,0 +1,84 @@
+from lineage_aq import __main__ as cli, config
+from lineage_aq.cache import LRUCache
+from lineage_aq.my_io import answer_prompts, flush, recording
+from lineage_aq.snapshot import LineageSnapshot, save_snapshot
+from tests.test_lineage import factory
+
+
+def test_read_only_commands(tmp_path, monkeypatch):
+    # Indexes and caches of the snapshot are not left behind for the other tests
+    monkeypatch.setattr(config, "_alternate_spells_listeners", [])
+    monkeypatch.setattr(cli, "canonical_index", None)
+    monkeypatch.setattr(cli, "duplicate_index", None)
+    monkeypatch.setattr(cli, "search_cache", LRUCache(256))
+    monkeypatch.setattr(cli, "details_cache", LRUCache(1024))
+
+    lineage, father, mother, child = factory()
+    filename = tmp_path / "lineage.snapshot"
+    save_snapshot(lineage, filename)
+
+    prompts = {
+        cli.shortest_path: [str(child.id), str(father.id)],
+        cli.relationship: [str(child.id), str(father.id)],
+        cli.find: [str(child.id)],
+        cli.show_tree: [str(father.id)],
+    }
+    skipped = cli.modifying_commands() | {cli.safe_exit, cli.show_help}
+    with LineageSnapshot(filename) as snapshot:
+        for command in cli.commands():
+            if command in skipped:
+                continue
+            answer_prompts(prompts.get(command, []))
+            try:
+                with recording() as output:
+                    if command in cli.commands_with_options():
+                        command(snapshot, [])
+                    else:
+                        command(snapshot)
+            finally:
+                answer_prompts(None)
+                flush()
+            if command is cli.relationship:
+                assert "is father of" in "".join(output)
+
+
+def test_snapshot_name_search(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "_alternate_spells_listeners", [])
+    monkeypatch.setattr(cli, "canonical_index", None)
+    monkeypatch.setattr(cli, "search_cache", LRUCache(256))
+    monkeypatch.setattr(cli, "details_cache", LRUCache(1024))
+
+    lineage, father, mother, child = factory()
+    lineage.add_person("Grandchild", "f")
+    filename = tmp_path / "lineage.snapshot"
+    save_snapshot(lineage, filename)
+
+    with LineageSnapshot(filename) as snapshot:
+        found = cli._search_name(snapshot, "child")
+        assert [p.id for p in found] == [child.id, child.id + 1]
+        try:
+            with recording() as output:
+                cli._find_by_name(snapshot, "nobody")
+        finally:
+            flush()
+        assert "Name not found" in "".join(output)
+    # Snapshot is searched through its own name lookup, without loading all the names
+    assert cli.canonical_index is None
+
+
+def test_name_starting_with_command(monkeypatch):
+    monkeypatch.setattr(config, "_alternate_spells_listeners", [])
+    monkeypatch.setattr(cli, "canonical_index", None)
+    monkeypatch.setattr(cli, "search_cache", LRUCache(256))
+    monkeypatch.setattr(cli, "details_cache", LRUCache(1024))
+
+    lineage, *_ = factory()
+    tree_ali = lineage.add_person("Tree Ali", "m")
+    try:
+        with recording() as output:
+            cli._run_command(lineage, "tree ali", set())
+    finally:
+        flush()
+    output = "".join(output)
+    assert "FIND PERSON" in output and "Usage" not in output
+    assert tree_ali.name in output
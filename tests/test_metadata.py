@@ -0,0 +1,55 @@
+import hashlib
+import json
+
+from lineage_aq.metadata import (
+    FileCounts,
+    count_rows,
+    file_counts,
+    metadata_path,
+    read_metadata,
+)
+from tests.test_lineage import factory
+
+
+def test_metadata(tmp_path):
+    lineage, *_ = factory()
+    file = tmp_path / "lineage 1.json"
+    lineage.save_to_file(file)
+
+    metadata = read_metadata(file)
+    with open(file) as f:
+        data = json.load(f)
+    assert metadata["persons"] == len(data["persons"]) == 3
+    assert metadata["relations"] == len(data["relations"])
+    assert metadata["sha256"] == hashlib.sha256(file.read_bytes()).hexdigest()
+    assert count_rows(file) == FileCounts(metadata["persons"], metadata["relations"])
+
+    # Metadata of the changed file is stale
+    with open(file, "a") as f:
+        f.write("\n")
+    assert read_metadata(file) is None
+
+
+def test_file_counts(tmp_path):
+    lineage, *_ = factory()
+    file1 = tmp_path / "lineage 1.json"
+    file2 = tmp_path / "lineage 2.json"
+    lineage.save_to_file(file1)
+    lineage.add_person("Other", "f")
+    lineage.save_to_file(file2)
+    counts = count_rows(file2)
+    metadata_path(file2).unlink()
+    (tmp_path / "lineage 3.json").write_text("{")
+    cache = tmp_path / "counts.json"
+
+    files = [file1, file2, tmp_path / "lineage 3.json"]
+    expected = [count_rows(file1), counts, None]
+    assert file_counts(files, cache) == expected
+    assert json.loads(cache.read_text())[str(file2)][2:] == list(counts)
+
+    # Cached counts are used while the file is unchanged
+    cached = json.loads(cache.read_text())
+    cached[str(file2)][2] = 100
+    cache.write_text(json.dumps(cached))
+    assert file_counts(files, cache)[1].persons == 100
+    assert file_counts(files, cache, workers=2)[1].persons == 100
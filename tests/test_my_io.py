@@ -0,0 +1,77 @@
+import io
+import pytest
+from lineage_aq import Lineage, my_io
+from lineage_aq.my_io import tree_lines, write_tree
+
+
+def _tree():
+    lineage = Lineage()
+    root = lineage.add_person("Root", "m")
+    wife = lineage.add_person("Wife", "f")
+    root.add_spouse(wife)
+    children = [lineage.add_person(f"C{i}", "m") for i in range(3)]
+    for child in children:
+        root.add_child(child)
+        wife.add_child(child)
+    children[0].add_child(lineage.add_person("G", "f"))
+    return root
+
+
+def _children(person):
+    return [(child, True) for child in sorted(person.children, key=lambda p: p.id)]
+
+
+def _name(person):
+    return person.name
+
+
+def test_tree_lines():
+    lines = list(tree_lines(_tree(), _children, _name, print_spouse=False))
+    assert lines == ["Root ", "├── C0 ", "│   └── G ", "├── C1 ", "└── C2 "]
+
+
+def test_tree_lines_limits():
+    root = _tree()
+    lines = list(tree_lines(root, _children, _name, print_spouse=False, max_depth=1))
+    assert lines == ["Root ", "├── C0 ", "├── C1 ", "└── C2 "]
+
+    lines = list(tree_lines(root, _children, _name, max_children=1))
+    assert lines == ["Root - Wife", "├── C0 ", "│   └── G ", "└── ... 2 more"]
+
+
+def test_tree_lines_lazy():
+    lines = tree_lines(_tree(), _children, _name)
+    assert next(lines) == "Root - Wife"
+
+
+def test_write_tree(monkeypatch):
+    lines = list(tree_lines(_tree(), _children, _name))
+    out = io.StringIO()
+    monkeypatch.setattr(my_io, "WRITE_CHUNK", 2)
+    write_tree(iter(lines), out)
+    assert out.getvalue() == "".join(line + "\n" for line in lines)
+
+
+def test_output_without_terminal(capsys):
+    my_io.print_red("error", 1)
+    my_io.print_heading("HEADING")
+    my_io.print_plain("a", "b", sep="-", end="")
+    assert capsys.readouterr().out == ""
+
+    my_io.flush()
+    assert capsys.readouterr().out == "error 1\n\nHEADING\n-------\na-b"
+
+
+def test_answer_prompts():
+    my_io.answer_prompts(["Ali Khan", "x", "m"])
+    try:
+        assert my_io.non_empty_input("Name: ") == "Ali Khan"
+        with pytest.raises(ValueError):
+            my_io.input_from("Gender: ", ("m", "f"))
+        assert my_io.input_from("Gender: ", ("m", "f")) == "m"
+        assert my_io.take_input("Parent: ") == ""
+        with pytest.raises(ValueError):
+            my_io.non_empty_input("Name: ")
+    finally:
+        my_io.answer_prompts(None)
+    assert not my_io.scripted()
@@ -0,0 +1,92 @@
+from threading import Thread
+from lineage_aq.name_index import CanonicalIndex
+from tests.test_lineage import factory
+
+
+def test_canonical_index():
+    lineage, father, mother, child = factory()
+    hadees = lineage.add_person("Hadees Khan", "m")
+    index = CanonicalIndex(lambda name: name.replace("ee", "i"))
+    lineage.attach_index(index)
+
+    assert index.find("hadis khan") == [hadees]
+    assert index.find("HADISKHAN") == [hadees]
+    assert index.find("Hadis") == []
+
+    hadees.name = "Hadis"
+    assert index.find("Hadees") == [hadees]
+    hadees.self_remove()
+    assert index.find("Hadees") == []
+
+
+def test_canonical_index_rebuild():
+    lineage, father, mother, child = factory()
+    spells = {"version": 0, "from": "ee"}
+
+    def canonical(name):
+        return name.replace(spells["from"], "i")
+
+    index = CanonicalIndex(canonical, lambda: spells["version"])
+    lineage.attach_index(index)
+    hadees = lineage.add_person("Hadees", "m")
+    assert index.find("Hadis") == [hadees]
+
+    spells["from"] = "ea"
+    spells["version"] = 1
+    rebuild = Thread(target=index.rebuild)
+    rebuild.start()
+    hadeas = lineage.add_person("Hadeas", "m")
+    rebuild.join()
+
+    assert index.find("Hadis") == [hadeas]
+    assert index.find("Hadees") == [hadees]
+
+
+def test_similar():
+    lineage, father, mother, child = factory()
+    muhammad = lineage.add_person("Muhammad Khan", "m")
+    mohammed = lineage.add_person("Mohammed Khan", "m")
+    lineage.add_person("Ali Raza", "m")
+    index = CanonicalIndex(lambda name: name.replace("o", "u").replace("e", "a"))
+    lineage.attach_index(index)
+
+    found = index.similar("Muhamad Kahn")
+    assert [person for person, _ in found] == [muhammad, mohammed]
+    assert found[0][1] == found[1][1] < 1
+    assert index.similar("Mohammed Khan", min_score=1) == [
+        (muhammad, 1.0),
+        (mohammed, 1.0),
+    ]
+    assert index.similar("Muhamad Kahn", k=1) == found[:1]
+    assert index.similar("Zzz") == []
+
+
+def test_similar_without_spellings():
+    lineage, father, mother, child = factory()
+    muhammad = lineage.add_person("Muhammad", "m")
+    lineage.add_person("Hamid", "m")
+    index = CanonicalIndex()
+    lineage.attach_index(index)
+
+    found = index.similar("Mohamad")
+    assert [person for person, _ in found] == [muhammad]
+    assert found[0][1] >= 0.4
+
+
+def test_similar_short_names():
+    lineage, father, mother, child = factory()
+    hasan = lineage.add_person("Hasan", "m")
+    husain = lineage.add_person("Husain", "m")
+    lineage.add_person("Hamid", "m")
+    index = CanonicalIndex()
+    lineage.attach_index(index)
+
+    # Dropped letter
+    found = index.similar("hasn")
+    assert [person for person, _ in found] == [hasan]
+    assert found[0][1] < 0.3
+    # Swapped letters
+    assert [person for person, _ in index.similar("Husian")] == [husain]
+    # Replaced letter
+    assert [person for person, _ in index.similar("Hasen")] == [hasan]
+    assert index.similar("Hsni") == []
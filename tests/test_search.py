@@ -0,0 +1,45 @@
+import pytest
+from lineage_aq import config
+from lineage_aq.search import advanced_search, advanced_search_persons
+from tests.test_lineage import factory
+
+
+@pytest.fixture
+def set_alternate_spells():
+    def set_(spells):
+        config.alternate_spells[:] = spells
+        config._alternate_spells_updated()
+
+    saved = config.alternate_spells[:]
+    yield set_
+    set_(saved)
+
+
+def test_advanced_search(set_alternate_spells):
+    set_alternate_spells([["ee", "i"], ["aa", "a"]])
+
+    found = advanced_search("Hadees", ["Hadis", "Hadees", "Other"])
+    assert found == ["Hadis", "Hadees"]
+    assert advanced_search("hadees", ["Haadis", "Hdees"]) == ["Haadis"]
+
+
+def test_advanced_search_persons(set_alternate_spells):
+    set_alternate_spells([["ee", "i"], ["aa", "a"], ["sh", "sch"]])
+    lineage, father, mother, child = factory()
+    hadees = lineage.add_person("Hadees Shah", "m")
+    hadis = lineage.add_person("Haadis Schaah", "m")
+    lineage.add_person("Hadees Khan", "m")
+
+    assert advanced_search_persons("hadis sha", lineage) == [hadees, hadis]
+    assert advanced_search_persons("schah", lineage) == [hadees, hadis]
+    assert advanced_search_persons("xyz", lineage) == []
+
+
+def test_many_spellings(set_alternate_spells):
+    set_alternate_spells([["ee", "i"], ["aa", "a"]])
+    lineage, father, mother, child = factory()
+    name = "Haadees" * 20
+    person = lineage.add_person(name, "m")
+
+    # 2^40 variants of the term
+    assert advanced_search_persons(name.lower().replace("ee", "i"), lineage) == [person]
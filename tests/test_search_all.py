@@ -0,0 +1,32 @@
+from lineage_aq import Journal, search_all as search_all_module
+from lineage_aq.search_all import search_all
+from tests.test_lineage import factory
+
+
+def test_search_all(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_all_module, "NAME_CACHE_DIR", tmp_path / "names")
+    lineage1, father, mother, child = factory()
+    lineage2, *_ = factory()
+    hasan = lineage2.add_person("Hasan Child", "m")
+    file1 = tmp_path / "lineage 1.json"
+    file2 = tmp_path / "lineage 2.json"
+    lineage1.save_to_file(file1)
+    lineage2.save_to_file(file2)
+
+    result = search_all("child", [file1, file2])
+    assert [(hit.file, hit.id, hit.name) for hit in result.hits] == [
+        (file1, child.id, "Child"),
+        (file2, child.id, "Child"),
+        (file2, hasan.id, "Hasan Child"),
+    ]
+    assert result.num_cached == 0
+
+    # Changes in the journal are searched too, without the stale cache
+    journal = Journal(file1)
+    lineage1.attach_journal(journal)
+    child.name = "Renamed"
+    journal.close()
+    result = search_all("child", [file1, file2])
+    assert [hit.file for hit in result.hits] == [file2, file2]
+    assert result.num_cached == 1
+    assert search_all("renamed", [file1, file2]).num_cached == 2
@@ -0,0 +1,86 @@
+from os import remove
+from lineage_aq import Relation
+from lineage_aq.snapshot import LineageSnapshot, save_snapshot
+from tests.test_lineage import factory
+
+
+def test_save_and_open_snapshot():
+    lineage, father, mother, child = factory()
+    daughter = lineage.add_person("Daughter Name", "f")
+    mother.add_child(daughter)
+
+    filename = "test_lineage.snapshot"
+    save_snapshot(lineage, filename)
+
+    with LineageSnapshot(filename) as snapshot:
+        assert len(snapshot) == 4
+        father_b = snapshot.find_person_by_id(father.id)
+        child_b = snapshot.find_person_by_id(child.id)
+        daughter_b = snapshot.find_person_by_id(daughter.id)
+        assert snapshot.find_person_by_id(1000) is None
+
+        assert father_b.name == "Father"
+        assert father_b.gender == "m"
+        assert child_b.father == father_b
+        assert child_b.mother.name == "Mother"
+        assert daughter_b.father is None
+        assert daughter_b.parents == [child_b.mother]
+        assert father_b.children == [child_b]
+        assert [p.id for p in child_b.mother.children] == [child.id, daughter.id]
+        assert father_b.wife == [child_b.mother]
+        assert child_b.mother.husband == [father_b]
+
+        assert child_b.relation_with(father_b) == Relation.FATHER
+        assert father_b.relation_with(daughter_b) is None
+        assert len(snapshot.all_relations()) == len(lineage.all_relations())
+
+        assert snapshot.find_person_by_name("ather") == [father_b]
+        assert snapshot.find_person_by_name("ter n") == [daughter_b]
+        assert snapshot.find_person_by_name("tern") == []
+        assert snapshot.search_names(["tern", "chi"]) == [child_b, daughter_b]
+        assert [p.id for p in snapshot.find_person_by_name("the")] == [
+            father.id,
+            mother.id,
+        ]
+
+        assert snapshot.generation(0) == [father_b, child_b.mother]
+        assert snapshot.generation(1) == [child_b, daughter_b]
+        assert daughter_b.generation == 1
+        assert snapshot.ancestors(child_b) == [father_b, child_b.mother]
+
+    remove(filename)
+
+
+def test_snapshot_kinship_queries(tmp_path):
+    lineage, father, mother, child = factory()
+    daughter = lineage.add_person("Daughter", "f")
+    father.add_child(daughter)
+    mother.add_child(daughter)
+    grandson = lineage.add_person("Grandson", "m")
+    child.add_child(grandson)
+
+    filename = tmp_path / "lineage.snapshot"
+    save_snapshot(lineage, filename)
+
+    def ids(persons):
+        return [p.id for p in persons]
+
+    with LineageSnapshot(filename) as snapshot:
+        father_b, daughter_b, grandson_b = [
+            snapshot.find_person_by_id(p.id) for p in (father, daughter, grandson)
+        ]
+        assert snapshot.relationship(grandson_b, daughter_b) == "aunt"
+        assert snapshot.relationship(daughter_b, daughter_b) == "self"
+        assert ids(snapshot.common_ancestors(grandson_b, daughter_b)) == ids(
+            lineage.common_ancestors(grandson, daughter)
+        )
+        assert ids(snapshot.shortest_path(grandson_b, father_b)) == ids(
+            lineage.shortest_path(grandson, father)
+        )
+        ((path),) = snapshot.shortest_paths([(grandson_b, daughter_b)])
+        assert [relation for _, relation in path] == [
+            None,
+            Relation.FATHER,
+            Relation.FATHER,
+            Relation.DAUGHTER,
+        ]